@@ -0,0 +1,71 @@
+"""Deduplicate recording data and add idempotent batch uploads
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "003"
+down_revision: Union[str, None] = "002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Remove rows inserted more than once by retried uploads, keeping the first copy
+    op.execute("""
+        DELETE FROM location_points a
+        USING location_points b
+        WHERE a.session_id = b.session_id
+          AND a.timestamp = b.timestamp
+          AND a.id > b.id
+    """)
+    op.execute("""
+        DELETE FROM sensor_readings a
+        USING sensor_readings b
+        WHERE a.session_id = b.session_id
+          AND a.timestamp = b.timestamp
+          AND a.id > b.id
+    """)
+    
+    # The unique constraints replace the plain (session_id, timestamp) indexes
+    op.drop_index("ix_location_points_timestamp", table_name="location_points")
+    op.create_unique_constraint(
+        "uq_location_points_session_timestamp", "location_points", ["session_id", "timestamp"]
+    )
+    op.drop_index("ix_sensor_readings_timestamp", table_name="sensor_readings")
+    op.create_unique_constraint(
+        "uq_sensor_readings_session_timestamp", "sensor_readings", ["session_id", "timestamp"]
+    )
+    
+    # Client batch IDs of uploads that have already been written
+    op.create_table(
+        "ingest_batches",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("session_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("batch_id", sa.String(length=64), nullable=False),
+        sa.Column("added", sa.Integer(), nullable=False),
+        sa.Column("duplicates", sa.Integer(), nullable=False),
+        sa.Column("first_timestamp", sa.DateTime(), nullable=False),
+        sa.Column("last_timestamp", sa.DateTime(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["session_id"], ["recording_sessions.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("session_id", "kind", "batch_id", name="uq_ingest_batches_session_kind_batch"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("ingest_batches")
+    
+    op.drop_constraint("uq_sensor_readings_session_timestamp", "sensor_readings", type_="unique")
+    op.create_index("ix_sensor_readings_timestamp", "sensor_readings", ["session_id", "timestamp"], unique=False)
+    op.drop_constraint("uq_location_points_session_timestamp", "location_points", type_="unique")
+    op.create_index("ix_location_points_timestamp", "location_points", ["session_id", "timestamp"], unique=False)
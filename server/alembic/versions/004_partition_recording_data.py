@@ -0,0 +1,140 @@
+"""Partition location_points and sensor_readings by month
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-17
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "004"
+down_revision: Union[str, None] = "003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Monthly partitions to create past the current month
+MONTHS_AHEAD = 3
+
+LOCATION_POINT_COLUMNS = """
+    id integer NOT NULL DEFAULT nextval('location_points_id_seq'),
+    session_id integer NOT NULL REFERENCES recording_sessions (id) ON DELETE CASCADE,
+    "timestamp" timestamp without time zone NOT NULL,
+    latitude double precision NOT NULL,
+    longitude double precision NOT NULL,
+    altitude double precision,
+    speed double precision,
+    bearing double precision,
+    horizontal_accuracy double precision,
+    vertical_accuracy double precision,
+    point geometry(POINT, 4326)
+"""
+
+SENSOR_READING_COLUMNS = """
+    id integer NOT NULL DEFAULT nextval('sensor_readings_id_seq'),
+    session_id integer NOT NULL REFERENCES recording_sessions (id) ON DELETE CASCADE,
+    "timestamp" timestamp without time zone NOT NULL,
+    accel_x double precision,
+    accel_y double precision,
+    accel_z double precision,
+    gyro_x double precision,
+    gyro_y double precision,
+    gyro_z double precision,
+    pressure double precision,
+    magnetic_heading double precision
+"""
+
+
+def _next_month(start: datetime) -> datetime:
+    return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+
+
+def _month_starts(first: datetime, last: datetime) -> list[datetime]:
+    """Start of every month from the month of `first` through the month of `last`."""
+    current = first.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    months = []
+    while current <= last:
+        months.append(current)
+        current = _next_month(current)
+    return months
+
+
+def _partition(table: str, columns: str, unique_name: str) -> None:
+    """Rebuild `table` as a partitioned table and move its rows into monthly partitions."""
+    conn = op.get_bind()
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+    op.execute(f"ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {unique_name} TO {unique_name}_old")
+    op.execute(f"ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {table}_pkey TO {table}_pkey_old")
+    op.execute(f"ALTER INDEX ix_{table}_session_id RENAME TO ix_{table}_session_id_old")
+    op.execute(f"""
+        CREATE TABLE {table} (
+            {columns},
+            CONSTRAINT {table}_pkey PRIMARY KEY (id, "timestamp"),
+            CONSTRAINT {unique_name} UNIQUE (session_id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    """)
+    op.execute(f"CREATE INDEX ix_{table}_session_id ON {table} (session_id)")
+    
+    # Partitions for every month with data, through a few months ahead
+    first, last = conn.exec_driver_sql(
+        f'SELECT min("timestamp"), max("timestamp") FROM {table}_unpartitioned'
+    ).one()
+    now = datetime.utcnow()
+    latest = _month_starts(now, now)[0]
+    for _ in range(MONTHS_AHEAD):
+        latest = _next_month(latest)
+    for start in _month_starts(min(first or now, now), max(last or now, latest)):
+        op.execute(
+            f"CREATE TABLE {table}_{start:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{_next_month(start).isoformat()}')"
+        )
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    
+    op.execute(f"INSERT INTO {table} SELECT * FROM {table}_unpartitioned")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    op.execute(f"DROP TABLE {table}_unpartitioned")
+
+
+def _unpartition(table: str, columns: str, unique_name: str) -> None:
+    """Turn the partitioned `table` back into a plain table."""
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_partitioned")
+    op.execute(f"ALTER TABLE {table}_partitioned RENAME CONSTRAINT {unique_name} TO {unique_name}_old")
+    op.execute(f"ALTER TABLE {table}_partitioned RENAME CONSTRAINT {table}_pkey TO {table}_pkey_old")
+    op.execute(f"ALTER INDEX ix_{table}_session_id RENAME TO ix_{table}_session_id_old")
+    op.execute(f"""
+        CREATE TABLE {table} (
+            {columns},
+            CONSTRAINT {table}_pkey PRIMARY KEY (id),
+            CONSTRAINT {unique_name} UNIQUE (session_id, "timestamp")
+        )
+    """)
+    op.execute(f"CREATE INDEX ix_{table}_session_id ON {table} (session_id)")
+    op.execute(f"INSERT INTO {table} SELECT * FROM {table}_partitioned")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    op.execute(f"DROP TABLE {table}_partitioned")
+
+
+def upgrade() -> None:
+    # The sequences would be dropped along with the old tables that own them
+    op.execute("ALTER SEQUENCE location_points_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE sensor_readings_id_seq OWNED BY NONE")
+    
+    op.drop_index("ix_location_points_point_gist", table_name="location_points")
+    _partition("location_points", LOCATION_POINT_COLUMNS, "uq_location_points_session_timestamp")
+    op.execute("CREATE INDEX ix_location_points_point_gist ON location_points USING GIST (point)")
+    
+    _partition("sensor_readings", SENSOR_READING_COLUMNS, "uq_sensor_readings_session_timestamp")
+
+
+def downgrade() -> None:
+    op.execute("ALTER SEQUENCE location_points_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE sensor_readings_id_seq OWNED BY NONE")
+    
+    op.drop_index("ix_location_points_point_gist", table_name="location_points")
+    _unpartition("location_points", LOCATION_POINT_COLUMNS, "uq_location_points_session_timestamp")
+    op.execute("CREATE INDEX ix_location_points_point_gist ON location_points USING GIST (point)")
+    
+    _unpartition("sensor_readings", SENSOR_READING_COLUMNS, "uq_sensor_readings_session_timestamp")
@@ -0,0 +1,55 @@
+"""Add trajectory chunks for packed location point storage
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+import geoalchemy2
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "005"
+down_revision: Union[str, None] = "004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Location points of finished sessions, packed by services/trajectory.py
+    op.create_table(
+        "trajectory_chunks",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("session_id", sa.Integer(), nullable=False),
+        sa.Column("sequence", sa.Integer(), nullable=False),
+        sa.Column("start_time", sa.DateTime(), nullable=False),
+        sa.Column("end_time", sa.DateTime(), nullable=False),
+        sa.Column("point_count", sa.Integer(), nullable=False),
+        sa.Column(
+            "bbox",
+            geoalchemy2.types.Geometry(
+                geometry_type="POLYGON",
+                srid=4326,
+                from_text="ST_GeomFromEWKT",
+                name="geometry",
+                spatial_index=False,
+            ),
+            nullable=False,
+        ),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(["session_id"], ["recording_sessions.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("session_id", "sequence", name="uq_trajectory_chunks_session_sequence"),
+    )
+    op.create_index(op.f("ix_trajectory_chunks_session_id"), "trajectory_chunks", ["session_id"], unique=False)
+    op.execute("CREATE INDEX ix_trajectory_chunks_bbox_gist ON trajectory_chunks USING GIST (bbox)")
+
+
+def downgrade() -> None:
+    # Unpacking chunks back into rows is left to the application; this only drops the table
+    op.drop_index("ix_trajectory_chunks_bbox_gist", table_name="trajectory_chunks")
+    op.drop_index(op.f("ix_trajectory_chunks_session_id"), table_name="trajectory_chunks")
+    op.drop_table("trajectory_chunks")
@@ -0,0 +1,28 @@
+"""Add the recording session sort index for keyset pagination
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "006"
+down_revision: Union[str, None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Lines and routes page by primary key, and points and readings by the
+    # (session_id, timestamp) unique constraints, which already have indexes
+    op.create_index(
+        "ix_recording_sessions_started_at_id", "recording_sessions", ["started_at", "id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_recording_sessions_started_at_id", table_name="recording_sessions")
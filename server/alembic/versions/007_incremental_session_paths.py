@@ -0,0 +1,26 @@
+"""Track the end of incrementally built session paths
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NULL for existing sessions: their path is rebuilt on the next upload
+    op.add_column("recording_sessions", sa.Column("path_end_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("recording_sessions", "path_end_at")
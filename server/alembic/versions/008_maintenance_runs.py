@@ -0,0 +1,38 @@
+"""Add maintenance run history for the in-process scheduler
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Runs of the maintenance jobs, shared by all API workers
+    op.create_table(
+        "maintenance_runs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("job", sa.String(length=50), nullable=False),
+        sa.Column("worker", sa.String(length=255), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=False),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("detail", sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_maintenance_runs_job", "maintenance_runs", ["job"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_maintenance_runs_job", table_name="maintenance_runs")
+    op.drop_table("maintenance_runs")
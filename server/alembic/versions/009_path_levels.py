@@ -0,0 +1,73 @@
+"""Add simplified levels of detail for route and session paths
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+import geoalchemy2
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "009"
+down_revision: Union[str, None] = "008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Default PATH_LOD_TOLERANCES, for the backfill
+TOLERANCES = "{1,5,20,75,300}"
+
+
+def _levels_table(name: str, key: str, owner: str, constraint: str) -> None:
+    op.create_table(
+        name,
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column("tolerance", sa.Float(), nullable=False),
+        sa.Column("point_count", sa.Integer(), nullable=False),
+        sa.Column(
+            "path",
+            geoalchemy2.types.Geometry(
+                geometry_type="LINESTRING",
+                srid=4326,
+                from_text="ST_GeomFromEWKT",
+                name="geometry",
+                spatial_index=False,
+            ),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint([key], [f"{owner}.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(key, "tolerance", name=constraint),
+    )
+
+
+def _backfill(name: str, key: str, owner: str, column: str, where: str) -> None:
+    op.execute(f"""
+        INSERT INTO {name} ({key}, tolerance, point_count, path)
+        SELECT o.id, t.tolerance, ST_NPoints(s.path), s.path
+        FROM {owner} AS o
+        CROSS JOIN unnest('{TOLERANCES}'::double precision[]) AS t(tolerance)
+        CROSS JOIN LATERAL (
+            SELECT ST_Transform(ST_Simplify(ST_Transform(o.{column}, 3857), t.tolerance, true), 4326) AS path
+        ) AS s
+        WHERE o.{column} IS NOT NULL AND {where}
+    """)
+
+
+def upgrade() -> None:
+    # Simplified paths, written by services/simplification.py
+    _levels_table("route_path_levels", "route_id", "routes", "uq_route_path_levels_route_tolerance")
+    _levels_table("session_path_levels", "session_id", "recording_sessions", "uq_session_path_levels_session_tolerance")
+    
+    # Levels of existing routes and finished sessions (in-progress ones are simplified on read)
+    _backfill("route_path_levels", "route_id", "routes", "path", "true")
+    _backfill("session_path_levels", "session_id", "recording_sessions", "computed_path", "o.status <> 'IN_PROGRESS'")
+
+
+def downgrade() -> None:
+    op.drop_table("session_path_levels")
+    op.drop_table("route_path_levels")
@@ -0,0 +1,64 @@
+"""Add consensus paths built from recordings
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+import geoalchemy2
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "011"
+down_revision: Union[str, None] = "010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Resampled session paths, packed by services/consensus.py
+    op.create_table(
+        "consensus_tracks",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("session_id", sa.Integer(), nullable=False),
+        sa.Column("station_count", sa.Integer(), nullable=False),
+        sa.Column("length", sa.Float(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["session_id"], ["recording_sessions.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("session_id"),
+    )
+    
+    op.create_table(
+        "route_consensus",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("line_id", sa.Integer(), nullable=False),
+        sa.Column("direction", sa.String(length=100), nullable=False),
+        sa.Column(
+            "path",
+            geoalchemy2.types.Geometry(
+                geometry_type="LINESTRING",
+                srid=4326,
+                from_text="ST_GeomFromEWKT",
+                name="geometry",
+                spatial_index=False,
+            ),
+            nullable=False,
+        ),
+        sa.Column("track_count", sa.Integer(), nullable=False),
+        sa.Column("outlier_count", sa.Integer(), nullable=False),
+        sa.Column("spread", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["line_id"], ["lines.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("line_id", "direction", name="uq_route_consensus_line_direction"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("route_consensus")
+    op.drop_table("consensus_tracks")
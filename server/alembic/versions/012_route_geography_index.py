@@ -0,0 +1,26 @@
+"""Index route paths as geography for nearby search
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "012"
+down_revision: Union[str, None] = "011"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Expression index: queries on geography(path) use it for ST_DWithin in
+    # meters and KNN ordering, without storing a second copy of the paths
+    op.execute("CREATE INDEX ix_routes_path_geography ON routes USING GIST (geography(path))")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_routes_path_geography", table_name="routes")
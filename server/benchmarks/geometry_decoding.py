@@ -0,0 +1,85 @@
+"""
+Benchmark of list responses with long paths: row-by-row read models against
+the page decoding of services/geometry.py.
+
+Serves a page of recording sessions from memory (no database) through two
+endpoints of a throwaway app, one returning read models for FastAPI to
+validate and encode as `list_recordings` used to, the other returning
+`page_response`, and reports the median time of each.
+
+    python -m benchmarks.geometry_decoding --sessions 100 --points 3600
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime
+
+import numpy as np
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+from geoalchemy2.shape import from_shape
+from shapely.geometry import LineString
+
+from models.recording import RecordingSession, RecordingSessionRead, RecordingStatus
+from services.geometry import page_response
+
+
+def make_sessions(count: int, points: int, seed: int = 0) -> list[RecordingSession]:
+    """Completed sessions with random-walk paths of `points` vertices around Manhattan."""
+    rng = np.random.default_rng(seed)
+    sessions = []
+    for i in range(count):
+        steps = rng.normal(scale=1e-4, size=(points, 2))
+        path = np.array([-73.98, 40.75]) + np.cumsum(steps, axis=0)
+        sessions.append(RecordingSession(
+            id=i + 1,
+            user_id=1,
+            line_id=1,
+            direction="outbound",
+            status=RecordingStatus.COMPLETED,
+            started_at=datetime(2024, 5, 1),
+            last_activity_at=datetime(2024, 5, 1),
+            computed_path=from_shape(LineString(path), srid=4326),
+        ))
+    return sessions
+
+
+def make_app(sessions: list[RecordingSession]) -> FastAPI:
+    app = FastAPI()
+    
+    @app.get("/rows", response_model=list[RecordingSessionRead])
+    def rows() -> list[RecordingSessionRead]:
+        return [RecordingSessionRead.model_validate(s) for s in sessions]
+    
+    @app.get("/page", response_model=list[RecordingSessionRead])
+    def page(response: Response) -> Response:
+        return page_response(RecordingSessionRead, sessions, "computed_path", response)
+    
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--points", type=int, default=3600, help="Vertices per path (an hour at 1 Hz)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    
+    client = TestClient(make_app(make_sessions(args.sessions, args.points)))
+    assert client.get("/rows").json() == client.get("/page").json()
+    
+    print(f"{args.sessions} sessions x {args.points} points, median of {args.repeat}")
+    results = {}
+    for name in ("rows", "page"):
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            client.get(f"/{name}")
+            times.append(time.perf_counter() - start)
+        results[name] = statistics.median(times)
+        print(f"  {name:5s} {results[name] * 1000:9.1f} ms")
+    print(f"  speedup {results['rows'] / results['page']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,19 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from sqlalchemy import text
 
-from database import engine
-from routes import lines_router, recordings_router, routes_router
+from database import DB_MODE, async_engine, engine, replica_set
+from middleware import DecompressRequestMiddleware
+from routes import (
+    admin_router,
+    lines_router,
+    make_async_router,
+    recordings_router,
+    routes_router,
+    tiles_router,
+)
+from services.route_index import ROUTE_INDEX_ENABLED, route_index
+from services.scheduler import SCHEDULER_ENABLED, scheduler
+from services.spool import INGEST_MODE, close_spool, open_spool
 
 
 @asynccontextmanager
@@ -13,8 +24,24 @@ async def lifespan(app: FastAPI):
     # Startup: verify database connection
     with engine.connect() as conn:
         conn.execute(text("SELECT 1"))
+    if INGEST_MODE == "spool":
+        open_spool()
+    # In-memory spatial index answering nearby and bbox route queries
+    if ROUTE_INDEX_ENABLED:
+        route_index.start()
+    # Periodic maintenance (stale cleanup, partitions, caches)
+    if SCHEDULER_ENABLED:
+        # Replicas are health checked by the scheduler instead of on the request path
+        replica_set.background_checks = True
+        scheduler.start()
     yield
-    # Shutdown: cleanup if needed
+    # Shutdown: stop the scheduler and the route index listener, flush and close the ingest spool
+    await scheduler.stop()
+    route_index.stop()
+    close_spool()
+    await async_engine.dispose()
+    for replica in replica_set.replicas:
+        await replica.async_engine.dispose()
 
 
 app = FastAPI(
@@ -24,10 +51,15 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# Include routers
-app.include_router(lines_router)
-app.include_router(recordings_router)
-app.include_router(routes_router)
+# Accept gzip/zstd compressed bodies on the batch upload endpoints
+app.add_middleware(
+    DecompressRequestMiddleware,
+    path_pattern=r"^/recordings/\d+/(locations|sensors)/batch$",
+)
+
+# Include routers (DB_MODE=async serves them on async sessions instead of the threadpool)
+for router in (admin_router, lines_router, recordings_router, routes_router, tiles_router):
+    app.include_router(make_async_router(router) if DB_MODE == "async" else router)
 
 
 @app.get("/")
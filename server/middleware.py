@@ -0,0 +1,164 @@
+"""
+ASGI middleware for compressed request bodies.
+
+Clients can compress large uploads with gzip or zstd and send them with a
+`Content-Encoding` header. The body is decompressed chunk by chunk as the
+app reads it, so it is never held compressed and decompressed at once, and
+a body that inflates past the configured limit is rejected with 413 as soon
+as it crosses it.
+"""
+import os
+import re
+import zlib
+
+import zstandard
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+REQUEST_MAX_DECOMPRESSED_BYTES = int(
+    os.getenv("REQUEST_MAX_DECOMPRESSED_BYTES", str(20 * 1024 * 1024))
+)
+
+# A zstd block inflates to at most 128 KiB from as little as 4 bytes of
+# input. zstandard's decompressor can't stop at an output size, so input is
+# fed in steps that can complete only as many blocks as fit in the limit
+_ZSTD_MAX_BLOCK_SIZE = 128 * 1024
+_ZSTD_MIN_BLOCK_INPUT = 4
+
+
+class _GzipDecoder:
+    """Streaming gzip decoder."""
+    
+    def __init__(self):
+        # wbits=31: expect a gzip header and trailer
+        self._decompressor = zlib.decompressobj(wbits=31)
+    
+    def decompress(self, data: bytes, limit: int) -> bytes:
+        """Decompress the next chunk, returning at most `limit + 1` bytes."""
+        try:
+            return self._decompressor.decompress(data, limit + 1)
+        except zlib.error as e:
+            raise ValueError(str(e)) from e
+    
+    def finish(self) -> None:
+        """Check that the stream ended cleanly."""
+        if not self._decompressor.eof or self._decompressor.unused_data:
+            raise ValueError("Truncated or trailing gzip data")
+
+
+class _ZstdDecoder:
+    """Streaming zstd decoder."""
+    
+    def __init__(self):
+        self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+    
+    def decompress(self, data: bytes, limit: int) -> bytes:
+        """
+        Decompress the next chunk, stopping early once it exceeds `limit`
+        bytes, by at most one block.
+        """
+        output = bytearray()
+        start = 0
+        try:
+            while start < len(data) and len(output) <= limit:
+                # The blocks completed by a step are the ones it holds, plus the one it finishes
+                step = max(1, (limit - len(output)) // _ZSTD_MAX_BLOCK_SIZE * _ZSTD_MIN_BLOCK_INPUT)
+                output += self._decompressor.decompress(data[start:start + step])
+                start += step
+        except zstandard.ZstdError as e:
+            raise ValueError(str(e)) from e
+        return bytes(output)
+    
+    def finish(self) -> None:
+        """Check that the stream ended cleanly."""
+        if not self._decompressor.eof:
+            raise ValueError("Truncated zstd data")
+
+
+DECODERS = {
+    "gzip": _GzipDecoder,
+    "x-gzip": _GzipDecoder,
+    "zstd": _ZstdDecoder,
+}
+
+
+class DecompressRequestMiddleware:
+    """
+    Decompress gzip and zstd request bodies on paths matching `path_pattern`.
+    
+    The Content-Encoding and Content-Length headers are removed from requests
+    it decompresses, so the app sees a plain body. Unsupported encodings get
+    415, corrupt bodies 400 and bodies inflating past `max_size` bytes 413.
+    """
+    
+    def __init__(
+        self,
+        app: ASGIApp,
+        path_pattern: str,
+        max_size: int = REQUEST_MAX_DECOMPRESSED_BYTES,
+    ):
+        self.app = app
+        self.path_pattern = re.compile(path_pattern)
+        self.max_size = max_size
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.path_pattern.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        
+        encoding = next(
+            (
+                value.decode("latin-1").strip().lower()
+                for name, value in scope["headers"]
+                if name == b"content-encoding"
+            ),
+            "identity",
+        )
+        if encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+        
+        decoder_class = DECODERS.get(encoding)
+        if decoder_class is None:
+            response = JSONResponse(
+                {"detail": f"Unsupported Content-Encoding: {encoding}"},
+                status_code=415,
+            )
+            await response(scope, receive, send)
+            return
+        
+        scope = dict(scope)
+        scope["headers"] = [
+            (name, value) for name, value in scope["headers"]
+            if name not in (b"content-encoding", b"content-length")
+        ]
+        decoder = decoder_class()
+        size = 0
+        
+        async def receive_decompressed() -> Message:
+            nonlocal size
+            message = await receive()
+            if message["type"] != "http.request":
+                return message
+            
+            more_body = message.get("more_body", False)
+            try:
+                body = decoder.decompress(message.get("body", b""), self.max_size - size)
+                size += len(body)
+                if size > self.max_size:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Decompressed request body exceeds {self.max_size} bytes"
+                    )
+                if not more_body:
+                    decoder.finish()
+            except ValueError:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Malformed {encoding} request body"
+                )
+            return {"type": "http.request", "body": body, "more_body": more_body}
+        
+        # Errors raised while the app reads the body are turned into responses by FastAPI
+        await self.app(scope, receive_decompressed, send)
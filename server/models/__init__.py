@@ -1,30 +1,56 @@
+from .geometry import GeometryFormat
 from .line import Line, LineCreate, LineRead, LineReadWithRoutes, LineUpdate
+from .maintenance import MaintenanceRun, MaintenanceRunStatus
 from .recording import (
+    IngestBatch,
     LocationPoint,
     LocationPointBatch,
     LocationPointCreate,
     LocationPointRead,
+    MatchedPointRead,
     RecordingSession,
     RecordingSessionCreate,
     RecordingSessionRead,
     RecordingStatus,
     SensorReading,
     SensorReadingBatch,
+    SensorReadingColumns,
     SensorReadingCreate,
     SensorReadingRead,
+    SessionMatch,
+    SessionMatchRead,
+    SessionPathLevel,
+    TrajectoryChunk,
+)
+from .route import (
+    ConsensusTrack,
+    Route,
+    RouteConsensus,
+    RouteConsensusRead,
+    RouteCreate,
+    RouteNearbyRead,
+    RoutePathLevel,
+    RouteRead,
+    RouteUpdate,
 )
-from .route import Route, RouteCreate, RouteRead, RouteUpdate
 from .user import User, UserCreate, UserRead
 
 __all__ = [
+    # Geometry
+    "GeometryFormat",
     # Line
     "Line", "LineCreate", "LineRead", "LineReadWithRoutes", "LineUpdate",
     # Route
-    "Route", "RouteCreate", "RouteRead", "RouteUpdate",
+    "Route", "RouteCreate", "RouteNearbyRead", "RoutePathLevel", "RouteRead", "RouteUpdate",
+    "RouteConsensus", "RouteConsensusRead", "ConsensusTrack",
     # User
     "User", "UserCreate", "UserRead",
     # Recording
     "RecordingSession", "RecordingSessionCreate", "RecordingSessionRead", "RecordingStatus",
     "LocationPoint", "LocationPointCreate", "LocationPointRead", "LocationPointBatch",
     "SensorReading", "SensorReadingCreate", "SensorReadingRead", "SensorReadingBatch",
+    "SensorReadingColumns", "IngestBatch", "TrajectoryChunk",
+    "SessionPathLevel", "SessionMatch", "SessionMatchRead", "MatchedPointRead",
+    # Maintenance
+    "MaintenanceRun", "MaintenanceRunStatus",
 ]
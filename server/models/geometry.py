@@ -0,0 +1,144 @@
+"""
+Compact encodings of paths, for clients on slow networks.
+
+Paths are sent as `[longitude, latitude]` pairs by default. Two denser
+formats are available on output (`geometry_format`) and input:
+
+- `polyline`: Google's encoded polyline algorithm, a string. As in Google's
+  format, each point is encoded latitude first.
+- `delta`: a flat list of integers, the first point's coordinates followed
+  by each point's difference from the previous one, `[lon, lat, dlon,
+  dlat, ...]`.
+
+Both round coordinates to `precision` decimal places (5 is about 1 m, as
+in Google's format; 6 is about 10 cm). Differences are taken between the
+rounded points, so rounding errors don't accumulate along a path.
+"""
+from enum import Enum
+from typing import Any
+
+import numpy as np
+
+GEOMETRY_PRECISION = 5
+MAX_GEOMETRY_PRECISION = 10
+
+
+class GeometryFormat(str, Enum):
+    """Encoding of paths in requests and responses."""
+    COORDINATES = "coordinates"  # [[lon, lat], ...]
+    POLYLINE = "polyline"  # Google encoded polyline
+    DELTA = "delta"  # [lon, lat, dlon, dlat, ...] integers
+
+
+def _scale(precision: int) -> int:
+    if not 0 <= precision <= MAX_GEOMETRY_PRECISION:
+        raise ValueError(f"Precision must be between 0 and {MAX_GEOMETRY_PRECISION}")
+    return 10 ** precision
+
+
+def _accumulate(deltas: np.ndarray, scale: int) -> np.ndarray:
+    """Sum (n, 2) longitude/latitude deltas into coordinates."""
+    # Checked in floating point first, which can't overflow where int64 can
+    if np.any(np.abs(np.cumsum(deltas, axis=0, dtype=np.float64)) > np.array([180, 90]) * scale):
+        raise ValueError("Encoded path has a coordinate out of range")
+    return np.cumsum(deltas, axis=0) / scale
+
+
+def _deltas(coords: np.ndarray, precision: int) -> np.ndarray:
+    points = np.round(np.asarray(coords, dtype=np.float64) * _scale(precision)).astype(np.int64)
+    return np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+
+
+def encode_delta(coords: np.ndarray, precision: int = GEOMETRY_PRECISION) -> list[int]:
+    """Delta-encode (n, 2) longitude/latitude coordinates."""
+    return _deltas(coords, precision).ravel().tolist()
+
+
+def decode_delta(values: list[int], precision: int = GEOMETRY_PRECISION) -> np.ndarray:
+    """Decode delta-encoded integers into (n, 2) longitude/latitude coordinates."""
+    if len(values) % 2:
+        raise ValueError("Delta-encoded path must have an even number of values")
+    if not all(type(v) is int for v in values):
+        raise ValueError("Delta-encoded path must be integers")
+    try:
+        deltas = np.asarray(values, dtype=np.int64).reshape(-1, 2)
+    except OverflowError:
+        raise ValueError("Delta-encoded path has a value out of range")
+    return _accumulate(deltas, _scale(precision))
+
+
+def encode_polyline(coords: np.ndarray, precision: int = GEOMETRY_PRECISION) -> str:
+    """Encode (n, 2) longitude/latitude coordinates as a Google encoded polyline."""
+    values = _deltas(coords, precision)[:, ::-1].ravel()
+    if not len(values):
+        return ""
+    # Zigzag: the sign goes to the lowest bit
+    remaining = np.where(values < 0, ~(values << 1), values << 1).astype(np.uint64)
+    chunks, emitted = [], []
+    while True:
+        chunks.append(remaining & np.uint64(0x1F))
+        emitted.append(remaining != 0)
+        remaining = remaining >> np.uint64(5)
+        if not remaining.any():
+            break
+    chunks, emitted = np.stack(chunks, axis=1), np.stack(emitted, axis=1)
+    emitted[:, 0] = True
+    # Every chunk but a value's last has the continuation bit
+    more = np.zeros_like(emitted)
+    more[:, :-1] = emitted[:, 1:]
+    chars = chunks + np.where(more, np.uint64(0x20), np.uint64(0)) + np.uint64(63)
+    return chars[emitted].astype(np.uint8).tobytes().decode("ascii")
+
+
+def decode_polyline(text: str, precision: int = GEOMETRY_PRECISION) -> np.ndarray:
+    """Decode a Google encoded polyline into (n, 2) longitude/latitude coordinates."""
+    scale = _scale(precision)
+    try:
+        chars = np.frombuffer(text.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    except UnicodeEncodeError:
+        raise ValueError("Encoded polyline must be ASCII")
+    if not len(chars):
+        return np.empty((0, 2))
+    if chars.min() < 0 or chars.max() > 63:
+        raise ValueError("Invalid character in encoded polyline")
+    last = (chars & 0x20) == 0
+    if not last[-1]:
+        raise ValueError("Encoded polyline is truncated")
+    starts = np.flatnonzero(np.concatenate([[True], last[:-1]]))
+    position = np.arange(len(chars)) - np.repeat(starts, np.diff(np.append(starts, len(chars))))
+    if position.max() > 11:
+        raise ValueError("Encoded polyline has a value out of range")
+    values = np.add.reduceat((chars & 0x1F) << (5 * position), starts)
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+    if len(values) % 2:
+        raise ValueError("Encoded polyline has an odd number of values")
+    return _accumulate(values.reshape(-1, 2)[:, ::-1], scale)
+
+
+def encode_path(coords: np.ndarray, geometry_format: GeometryFormat, precision: int = GEOMETRY_PRECISION) -> Any:
+    """A path's (n, 2) coordinates in the given format."""
+    if geometry_format == GeometryFormat.POLYLINE:
+        return encode_polyline(coords, precision)
+    if geometry_format == GeometryFormat.DELTA:
+        return encode_delta(coords, precision)
+    return np.asarray(coords).tolist()
+
+
+def decode_path(value: Any, precision: int = GEOMETRY_PRECISION) -> Any:
+    """
+    A path sent in any format as `[longitude, latitude]` pairs: a string is
+    an encoded polyline, a flat list of integers is delta-encoded. Other
+    values are returned as they are, for the schema to validate.
+    """
+    if isinstance(value, str):
+        return decode_polyline(value, precision).tolist()
+    if is_encoded_path(value):
+        return decode_delta(value, precision).tolist()
+    return value
+
+
+def is_encoded_path(value: Any) -> bool:
+    """Whether a path was sent as an encoded polyline or delta-encoded integers."""
+    return isinstance(value, str) or (
+        bool(value) and isinstance(value, list) and all(type(v) is int for v in value)
+    )
@@ -0,0 +1,32 @@
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from sqlalchemy import Column, Text
+from sqlmodel import Field, SQLModel
+
+
+class MaintenanceRunStatus(str, Enum):
+    """Outcome of a maintenance job run."""
+    RUNNING = "running"
+    OK = "ok"
+    ERROR = "error"
+    TIMEOUT = "timeout"  # Cancelled after running longer than the job's timeout
+
+
+class MaintenanceRun(SQLModel, table=True):
+    """
+    A run of a scheduled maintenance job (see services/scheduler.py).
+    
+    Only jobs that run in one worker at a time are recorded here; the
+    history is shared by all workers.
+    """
+    __tablename__ = "maintenance_runs"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job: str = Field(max_length=50, index=True)
+    worker: str = Field(max_length=255)  # hostname:pid
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = Field(default=None)
+    status: MaintenanceRunStatus = Field(default=MaintenanceRunStatus.RUNNING)
+    detail: Optional[str] = Field(default=None, sa_column=Column(Text))  # JSON result or error
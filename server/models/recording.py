@@ -1,12 +1,14 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from enum import Enum
 from typing import TYPE_CHECKING, Any, Optional
 
+import numpy as np
+import shapely
 from geoalchemy2 import Geometry, WKBElement
-from pydantic import model_validator
-from shapely import wkb
+from geoalchemy2.shape import to_shape
+from pydantic import ValidationInfo, field_validator, model_validator
 from shapely.geometry import LineString
-from sqlalchemy import Column, Text
+from sqlalchemy import Column, Index, LargeBinary, Text, UniqueConstraint
 from sqlmodel import Field, Relationship, SQLModel
 
 if TYPE_CHECKING:
@@ -36,6 +38,10 @@ class RecordingSession(RecordingSessionBase, table=True):
     A recording session capturing a single trip on a transit line.
     """
     __tablename__ = "recording_sessions"
+    __table_args__ = (
+        # Sort key of the session list, for keyset pagination
+        Index("ix_recording_sessions_started_at_id", "started_at", "id"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="users.id", index=True)
@@ -45,7 +51,7 @@ class RecordingSession(RecordingSessionBase, table=True):
     ended_at: Optional[datetime] = Field(default=None)
     last_activity_at: datetime = Field(default_factory=datetime.utcnow)  # Updated on each batch upload
     
-    # Computed path from all location points (updated when session ends)
+    # Path through the location points, extended as batches arrive (services/paths.py)
     computed_path: Any = Field(
         default=None,
         sa_column=Column(
@@ -53,6 +59,7 @@ class RecordingSession(RecordingSessionBase, table=True):
             nullable=True
         )
     )
+    path_end_at: Optional[datetime] = Field(default=None)  # Timestamp of the path's last point
     
     # Relationships
     user: Optional["User"] = Relationship(back_populates="recordings")
@@ -78,12 +85,19 @@ class RecordingSessionRead(RecordingSessionBase):
     started_at: datetime
     ended_at: Optional[datetime]
     last_activity_at: datetime
-    computed_path: Optional[list[list[float]]] = None
+    # [[lon, lat], ...], or encoded with `geometry_format` (models/geometry.py)
+    computed_path: Optional[list[list[float]] | str | list[int]] = None
+    path_end_at: Optional[datetime] = None
     
     @model_validator(mode="before")
     @classmethod
-    def convert_geometry(cls, data: Any) -> Any:
-        """Convert PostGIS geometry to coordinate list."""
+    def convert_geometry(cls, data: Any, info: ValidationInfo) -> Any:
+        """
+        Convert PostGIS geometry to coordinate list.
+        
+        The path is left out with `context={"decode_geometry": False}`, for
+        pages whose paths are decoded at once (services/geometry.py).
+        """
         if isinstance(data, RecordingSession):
             result = {
                 "id": data.id,
@@ -97,18 +111,29 @@ class RecordingSessionRead(RecordingSessionBase):
                 "started_at": data.started_at,
                 "ended_at": data.ended_at,
                 "last_activity_at": data.last_activity_at,
-                "computed_path": None
+                "computed_path": None,
+                "path_end_at": data.path_end_at,
             }
-            if data.computed_path is not None:
+            if data.computed_path is not None and (info.context or {}).get("decode_geometry", True):
                 if isinstance(data.computed_path, WKBElement):
-                    shape = wkb.loads(bytes(data.computed_path.data))
-                    result["computed_path"] = list(shape.coords)
+                    shape = to_shape(data.computed_path)
+                    result["computed_path"] = shapely.get_coordinates(shape).tolist()
                 elif isinstance(data.computed_path, LineString):
-                    result["computed_path"] = list(data.computed_path.coords)
+                    result["computed_path"] = shapely.get_coordinates(data.computed_path).tolist()
             return result
         return data
 
 
+def naive_utc(value: datetime) -> datetime:
+    """
+    A timestamp as naive UTC, the way it is stored. Clients send ISO strings
+    with an offset (usually `Z`), which can't be compared with stored values.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
 # ============================================================
 # Location Points - GPS data
 # ============================================================
@@ -123,13 +148,26 @@ class LocationPointBase(SQLModel):
     bearing: Optional[float] = Field(default=None, ge=0, lt=360)  # Degrees from north
     horizontal_accuracy: Optional[float] = None  # Meters
     vertical_accuracy: Optional[float] = None  # Meters
+    
+    @field_validator("timestamp")
+    @classmethod
+    def validate_timestamp(cls, value: datetime) -> datetime:
+        return naive_utc(value)
 
 
 class LocationPoint(LocationPointBase, table=True):
     """A single GPS location point in a recording session."""
     __tablename__ = "location_points"
+    __table_args__ = (
+        # One fix per timestamp, so retried uploads can't insert the same point twice
+        UniqueConstraint("session_id", "timestamp", name="uq_location_points_session_timestamp"),
+        # Monthly partitions, see services/partitions.py
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
     
-    id: Optional[int] = Field(default=None, primary_key=True)
+    # The partition key has to be part of the primary key
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
+    timestamp: datetime = Field(primary_key=True)
     session_id: int = Field(foreign_key="recording_sessions.id", index=True)
     
     # PostGIS point for spatial queries
@@ -154,6 +192,97 @@ class LocationPointRead(LocationPointBase):
     session_id: int
 
 
+class TrajectoryChunk(SQLModel, table=True):
+    """
+    Location points of a finished session, packed into a compressed chunk.
+    
+    Compaction (services/trajectory.py) moves a session's location_points
+    rows into chunks of typed arrays, which are read back transparently.
+    """
+    __tablename__ = "trajectory_chunks"
+    __table_args__ = (
+        UniqueConstraint("session_id", "sequence", name="uq_trajectory_chunks_session_sequence"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: int = Field(foreign_key="recording_sessions.id", ondelete="CASCADE", index=True)
+    sequence: int  # Order of the chunk within the session
+    start_time: datetime  # Timestamp of the first point
+    end_time: datetime  # Timestamp of the last point
+    point_count: int
+    
+    # Bounding box of the chunk's points
+    bbox: Any = Field(
+        sa_column=Column(
+            Geometry(geometry_type="POLYGON", srid=4326),
+            nullable=False
+        )
+    )
+    
+    # zlib-compressed packed arrays, see services/trajectory.py
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
+class SessionPathLevel(SQLModel, table=True):
+    """
+    A simplified version of a session's computed_path, for one tolerance.
+    
+    Stored when the session ends (services/simplification.py).
+    """
+    __tablename__ = "session_path_levels"
+    __table_args__ = (
+        UniqueConstraint("session_id", "tolerance", name="uq_session_path_levels_session_tolerance"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: int = Field(foreign_key="recording_sessions.id", ondelete="CASCADE")
+    tolerance: float  # Web Mercator meters
+    point_count: int
+    path: Any = Field(
+        sa_column=Column(
+            Geometry(geometry_type="LINESTRING", srid=4326, spatial_index=False),
+            nullable=False
+        )
+    )
+
+
+class SessionMatch(SQLModel, table=True):
+    """
+    The result of map matching a session's location points onto the routes
+    of its line (services/map_matching.py).
+    
+    Per point results are packed into `data`, like trajectory chunks.
+    """
+    __tablename__ = "session_matches"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: int = Field(foreign_key="recording_sessions.id", ondelete="CASCADE", unique=True)
+    # Route most points were matched to
+    route_id: Optional[int] = Field(default=None, foreign_key="routes.id", ondelete="SET NULL")
+    matched_at: datetime = Field(default_factory=datetime.utcnow)
+    point_count: int
+    matched_count: int  # Points within reach of a route
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
+class MatchedPointRead(SQLModel):
+    """A location point snapped onto a route."""
+    timestamp: datetime
+    route_id: Optional[int]  # None when no route was close enough
+    distance_along: Optional[float]  # Meters from the start of the route
+    offset: Optional[float]  # Meters from the route, positive to the left of it
+
+
+class SessionMatchRead(SQLModel):
+    """Schema for reading the map matching result of a session."""
+    session_id: int
+    route_id: Optional[int]
+    matched_at: datetime
+    point_count: int
+    matched_count: int
+    points: list[MatchedPointRead]
+
+
 # ============================================================
 # Sensor Readings - Accelerometer, Gyroscope, Barometer
 # ============================================================
@@ -177,13 +306,23 @@ class SensorReadingBase(SQLModel):
     
     # Magnetometer / Compass
     magnetic_heading: Optional[float] = Field(default=None, ge=0, lt=360)  # Degrees
+    
+    @field_validator("timestamp")
+    @classmethod
+    def validate_timestamp(cls, value: datetime) -> datetime:
+        return naive_utc(value)
 
 
 class SensorReading(SensorReadingBase, table=True):
     """Sensor readings (accelerometer, gyroscope, etc.) from a recording session."""
     __tablename__ = "sensor_readings"
+    __table_args__ = (
+        UniqueConstraint("session_id", "timestamp", name="uq_sensor_readings_session_timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
     
-    id: Optional[int] = Field(default=None, primary_key=True)
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
+    timestamp: datetime = Field(primary_key=True)
     session_id: int = Field(foreign_key="recording_sessions.id", index=True)
     
     session: Optional["RecordingSession"] = Relationship(back_populates="sensor_readings")
@@ -206,9 +345,91 @@ class SensorReadingRead(SensorReadingBase):
 
 class LocationPointBatch(SQLModel):
     """Schema for uploading multiple location points at once."""
+    # Client-generated ID; retrying a batch with the same ID returns the original result
+    batch_id: Optional[str] = Field(default=None, max_length=64)
     points: list[LocationPointCreate]
 
 
 class SensorReadingBatch(SQLModel):
     """Schema for uploading multiple sensor readings at once."""
+    batch_id: Optional[str] = Field(default=None, max_length=64)
     readings: list[SensorReadingCreate]
+
+
+class IngestBatch(SQLModel, table=True):
+    """
+    A batch upload that has been written, keyed by its client-generated ID.
+    
+    Lets a retried upload be answered with the original result
+    instead of being processed again.
+    """
+    __tablename__ = "ingest_batches"
+    __table_args__ = (
+        UniqueConstraint("session_id", "kind", "batch_id", name="uq_ingest_batches_session_kind_batch"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: int = Field(foreign_key="recording_sessions.id", ondelete="CASCADE")
+    kind: str = Field(max_length=20)  # "locations" or "sensors"
+    batch_id: str = Field(max_length=64)
+    added: int  # Rows that were new
+    duplicates: int  # Rows skipped because they were already stored
+    first_timestamp: datetime
+    last_timestamp: datetime
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# Sensor channels, in table column order
+SENSOR_CHANNELS = (
+    "accel_x", "accel_y", "accel_z",
+    "gyro_x", "gyro_y", "gyro_z",
+    "pressure",
+    "magnetic_heading",
+)
+
+
+class SensorReadingColumns(SQLModel):
+    """
+    Schema for uploading sensor readings as one array per channel.
+    
+    A struct-of-arrays alternative to SensorReadingBatch: element i of every
+    channel belongs to timestamp[i]. Channels the device doesn't have can be
+    omitted, and individual missing values can be sent as null.
+    """
+    batch_id: Optional[str] = Field(default=None, max_length=64)
+    timestamp: list[datetime]
+    accel_x: Optional[list[Optional[float]]] = None
+    accel_y: Optional[list[Optional[float]]] = None
+    accel_z: Optional[list[Optional[float]]] = None
+    gyro_x: Optional[list[Optional[float]]] = None
+    gyro_y: Optional[list[Optional[float]]] = None
+    gyro_z: Optional[list[Optional[float]]] = None
+    pressure: Optional[list[Optional[float]]] = None
+    magnetic_heading: Optional[list[Optional[float]]] = None
+    
+    @field_validator("timestamp")
+    @classmethod
+    def validate_timestamps(cls, values: list[datetime]) -> list[datetime]:
+        return [naive_utc(value) for value in values]
+    
+    @model_validator(mode="after")
+    def validate_arrays(self) -> "SensorReadingColumns":
+        """Validate whole channels at once instead of one reading at a time."""
+        length = len(self.timestamp)
+        for channel in SENSOR_CHANNELS:
+            values = getattr(self, channel)
+            if values is not None and len(values) != length:
+                raise ValueError(
+                    f"Channel '{channel}' has {len(values)} values, expected {length} (one per timestamp)"
+                )
+        
+        if self.magnetic_heading is not None:
+            # None becomes NaN, which fails both comparisons and is allowed through
+            heading = np.array(self.magnetic_heading, dtype=np.float64)
+            invalid = (heading < 0) | (heading >= 360)
+            if invalid.any():
+                index = int(np.flatnonzero(invalid)[0])
+                raise ValueError(
+                    f"magnetic_heading must be between 0 and 360, got {heading[index]} at index {index}"
+                )
+        return self
@@ -1,13 +1,16 @@
 from datetime import datetime
 from typing import TYPE_CHECKING, Any, Optional
 
+import shapely
 from geoalchemy2 import Geometry, WKBElement
-from pydantic import field_validator, model_validator
-from shapely import wkb
+from geoalchemy2.shape import to_shape
+from pydantic import ValidationInfo, field_validator, model_validator
 from shapely.geometry import LineString
-from sqlalchemy import Column
+from sqlalchemy import Column, Index, LargeBinary, UniqueConstraint, text
 from sqlmodel import Field, Relationship, SQLModel
 
+from .geometry import GEOMETRY_PRECISION, MAX_GEOMETRY_PRECISION, decode_path, is_encoded_path
+
 if TYPE_CHECKING:
     from .line import Line
 
@@ -26,6 +29,10 @@ class Route(RouteBase, table=True):
     The path is stored as a PostGIS LINESTRING geometry in WGS84 (SRID 4326).
     """
     __tablename__ = "routes"
+    __table_args__ = (
+        # Nearby search in meters (ST_DWithin and KNN `<->` on geography(path))
+        Index("ix_routes_path_geography", text("geography(path)"), postgresql_using="gist"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     line_id: int = Field(foreign_key="lines.id", index=True)
@@ -46,17 +53,116 @@ class Route(RouteBase, table=True):
     line: Optional["Line"] = Relationship(back_populates="routes")
 
 
+class RoutePathLevel(SQLModel, table=True):
+    """
+    A simplified version of a route's path, for one tolerance.
+    
+    Stored whenever the path is written (services/simplification.py).
+    """
+    __tablename__ = "route_path_levels"
+    __table_args__ = (
+        UniqueConstraint("route_id", "tolerance", name="uq_route_path_levels_route_tolerance"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    route_id: int = Field(foreign_key="routes.id", ondelete="CASCADE")
+    tolerance: float  # Web Mercator meters
+    point_count: int
+    path: Any = Field(
+        sa_column=Column(
+            Geometry(geometry_type="LINESTRING", srid=4326, spatial_index=False),
+            nullable=False
+        )
+    )
+
+
+class ConsensusTrack(SQLModel, table=True):
+    """
+    A completed recording's path resampled at equally spaced stations, the
+    input of its line and direction's consensus (services/consensus.py).
+    
+    Stations are packed into `data`, like trajectory chunks.
+    """
+    __tablename__ = "consensus_tracks"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: int = Field(foreign_key="recording_sessions.id", ondelete="CASCADE", unique=True)
+    station_count: int
+    length: float  # Meters
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class RouteConsensus(SQLModel, table=True):
+    """
+    The consensus path of a line's completed recordings in one direction:
+    the median of the recordings that follow it, station by station.
+    
+    A proposal until applied to a route of the line.
+    """
+    __tablename__ = "route_consensus"
+    __table_args__ = (
+        UniqueConstraint("line_id", "direction", name="uq_route_consensus_line_direction"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    line_id: int = Field(foreign_key="lines.id", ondelete="CASCADE")
+    direction: str = Field(max_length=100)
+    path: Any = Field(
+        sa_column=Column(
+            Geometry(geometry_type="LINESTRING", srid=4326, spatial_index=False),
+            nullable=False
+        )
+    )
+    track_count: int  # Recordings the path is the median of
+    outlier_count: int  # Recordings too far from it, e.g. detours
+    spread: float  # Median distance of the recordings from the path, meters
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class RouteConsensusRead(SQLModel):
+    """Schema for reading a consensus path (API response)."""
+    line_id: int
+    direction: str
+    path: list[list[float]]
+    track_count: int
+    outlier_count: int
+    spread: float
+    updated_at: datetime
+    
+    @model_validator(mode="before")
+    @classmethod
+    def convert_geometry(cls, data: Any) -> Any:
+        """Convert PostGIS geometry to coordinate list."""
+        if isinstance(data, RouteConsensus):
+            return {
+                "line_id": data.line_id,
+                "direction": data.direction,
+                "path": [list(point) for point in to_shape(data.path).coords],
+                "track_count": data.track_count,
+                "outlier_count": data.outlier_count,
+                "spread": data.spread,
+                "updated_at": data.updated_at,
+            }
+        return data
+
+
 class RouteCreate(RouteBase):
     """Schema for creating a new route."""
     line_id: int
-    # Accept path as a list of [longitude, latitude] coordinate pairs
-    path: Optional[list[list[float]]] = None
+    # Accept path as a list of [longitude, latitude] coordinate pairs, an
+    # encoded polyline or delta-encoded integers (models/geometry.py)
+    path: Optional[list[list[float]] | str | list[int]] = None
+    path_precision: int = Field(default=GEOMETRY_PRECISION, ge=0, le=MAX_GEOMETRY_PRECISION)
     
     @field_validator("path")
     @classmethod
     def validate_path(cls, v: Optional[list[list[float]]]) -> Optional[list[list[float]]]:
-        if v is None:
+        if v is None or is_encoded_path(v):
+            # Decoded once path_precision is validated, then checked here
             return v
+        if not all(isinstance(point, list) for point in v):
+            raise ValueError("Path must be [longitude, latitude] pairs, an encoded polyline or delta-encoded integers")
         if len(v) < 2:
             raise ValueError("Route path must have at least 2 points")
         for point in v:
@@ -69,6 +175,13 @@ class RouteCreate(RouteBase):
                 raise ValueError(f"Latitude must be between -90 and 90, got {lat}")
         return v
     
+    @model_validator(mode="after")
+    def decode_encoded_path(self) -> "RouteCreate":
+        """Decode a path sent as an encoded polyline or delta-encoded integers."""
+        if self.path is not None and is_encoded_path(self.path):
+            self.path = self.validate_path(decode_path(self.path, self.path_precision))
+        return self
+    
     def to_linestring(self) -> Optional[str]:
         """Convert path to WKT LINESTRING format."""
         if self.path is None:
@@ -81,14 +194,20 @@ class RouteRead(RouteBase):
     """Schema for reading a route (API response)."""
     id: int
     line_id: int
-    path: Optional[list[list[float]]] = None
+    # [[lon, lat], ...], or encoded with `geometry_format` (models/geometry.py)
+    path: Optional[list[list[float]] | str | list[int]] = None
     created_at: datetime
     updated_at: datetime
     
     @model_validator(mode="before")
     @classmethod
-    def convert_geometry(cls, data: Any) -> Any:
-        """Convert PostGIS geometry to coordinate list."""
+    def convert_geometry(cls, data: Any, info: ValidationInfo) -> Any:
+        """
+        Convert PostGIS geometry to coordinate list.
+        
+        The path is left out with `context={"decode_geometry": False}`, for
+        pages whose paths are decoded at once (services/geometry.py).
+        """
         if isinstance(data, Route):
             result = {
                 "id": data.id,
@@ -100,28 +219,38 @@ class RouteRead(RouteBase):
                 "updated_at": data.updated_at,
                 "path": None
             }
-            if data.path is not None:
+            if data.path is not None and (info.context or {}).get("decode_geometry", True):
                 if isinstance(data.path, WKBElement):
-                    shape = wkb.loads(bytes(data.path.data))
-                    result["path"] = list(shape.coords)
+                    shape = to_shape(data.path)
+                    result["path"] = shapely.get_coordinates(shape).tolist()
                 elif isinstance(data.path, (LineString,)):
-                    result["path"] = list(data.path.coords)
+                    result["path"] = shapely.get_coordinates(data.path).tolist()
             return result
         return data
 
 
+class RouteNearbyRead(RouteRead):
+    """Schema for a route found near a point (API response)."""
+    distance_meters: float
+    closest_point: list[float]  # [longitude, latitude] on the route
+
+
 class RouteUpdate(SQLModel):
     """Schema for updating a route (all fields optional)."""
     direction: Optional[str] = Field(default=None, max_length=100)
     distinctive: Optional[str] = Field(default=None, max_length=255)
     color: Optional[str] = Field(default=None, max_length=7)
-    path: Optional[list[list[float]]] = None
+    path: Optional[list[list[float]] | str | list[int]] = None
+    path_precision: int = Field(default=GEOMETRY_PRECISION, ge=0, le=MAX_GEOMETRY_PRECISION)
     
     @field_validator("path")
     @classmethod
     def validate_path(cls, v: Optional[list[list[float]]]) -> Optional[list[list[float]]]:
-        if v is None:
+        if v is None or is_encoded_path(v):
+            # Decoded once path_precision is validated, then checked here
             return v
+        if not all(isinstance(point, list) for point in v):
+            raise ValueError("Path must be [longitude, latitude] pairs, an encoded polyline or delta-encoded integers")
         if len(v) < 2:
             raise ValueError("Route path must have at least 2 points")
         for point in v:
@@ -134,6 +263,13 @@ class RouteUpdate(SQLModel):
                 raise ValueError(f"Latitude must be between -90 and 90, got {lat}")
         return v
     
+    @model_validator(mode="after")
+    def decode_encoded_path(self) -> "RouteUpdate":
+        """Decode a path sent as an encoded polyline or delta-encoded integers."""
+        if self.path is not None and is_encoded_path(self.path):
+            self.path = self.validate_path(decode_path(self.path, self.path_precision))
+        return self
+    
     def to_linestring(self) -> Optional[str]:
         """Convert path to WKT LINESTRING format if path is set."""
         if self.path is None:
@@ -1,5 +1,8 @@
+from .admin import router as admin_router
+from .async_routes import make_async_router
 from .lines import router as lines_router
 from .recordings import router as recordings_router
 from .routes import router as routes_router
+from .tiles import router as tiles_router
 
-__all__ = ["lines_router", "recordings_router", "routes_router"]
+__all__ = ["admin_router", "lines_router", "recordings_router", "routes_router", "tiles_router", "make_async_router"]
@@ -0,0 +1,62 @@
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models.maintenance import MaintenanceRun
+from services.scheduler import SCHEDULER_ENABLED, WORKER_ID, run_summary, scheduler
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/jobs")
+def list_jobs(
+    limit: int = Query(default=50, ge=1, le=1000, description="Recorded runs to return"),
+    db: Session = Depends(get_db)
+) -> dict:
+    """
+    Maintenance jobs of the in-process scheduler, with their run history.
+    
+    `jobs` and their `last_run` are those of the worker answering the
+    request; `runs` are the recorded runs of the exclusive jobs, from all
+    workers, most recent first.
+    """
+    runs = db.execute(
+        select(MaintenanceRun)
+        .order_by(MaintenanceRun.started_at.desc(), MaintenanceRun.id.desc())
+        .limit(limit)
+    ).scalars().all()
+    
+    return {
+        "enabled": SCHEDULER_ENABLED,
+        "worker": WORKER_ID,
+        "jobs": scheduler.describe(),
+        "runs": [
+            {
+                "id": run.id,
+                "job": run.job,
+                "worker": run.worker,
+                "started_at": run.started_at.isoformat(),
+                "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+                "status": run.status.value,
+                "detail": json.loads(run.detail) if run.detail else None,
+            }
+            for run in runs
+        ],
+    }
+
+
+@router.post("/jobs/{name}/run")
+async def run_job(name: str) -> dict:
+    """
+    Run a maintenance job now, in this worker, and wait for it to finish.
+    
+    Exclusive jobs are still skipped while another worker is running them,
+    or if they ran within the last half interval.
+    """
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return run_summary(await scheduler.run_job(name))
@@ -0,0 +1,114 @@
+"""
+Async variants of the API routers, used when DB_MODE=async.
+
+The handlers are written once, against a synchronous `Session`. For async
+mode each handler that takes a database session is wrapped in a coroutine
+that gets an `AsyncSession` (asyncpg) and runs the handler through
+`AsyncSession.run_sync`. The handler then runs on the event loop, and its
+queries are awaited on asyncpg instead of blocking a threadpool worker, so
+slow clients only cost a coroutine each.
+
+Anything else a handler does blocks the event loop for every connection,
+so blocking work besides queries (spool fsyncs, tile files, the sync
+engine, map matching and consensus computation) goes through
+`database.run_blocking`, which runs it in the threadpool in async mode.
+"""
+import inspect
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.params import Depends as DependsParam
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db, get_async_read_db, get_db, get_read_db
+from services.export import SessionStreamingResponse
+
+# Sync session dependencies and their async replacements
+ASYNC_DEPENDENCIES: dict[Callable, Callable] = {
+    get_db: get_async_db,
+    get_read_db: get_async_read_db,
+}
+
+
+def _session_param(endpoint: Callable) -> Optional[str]:
+    """Name of the endpoint's parameter that receives a sync database session."""
+    return next(
+        (
+            name for name, param in inspect.signature(endpoint).parameters.items()
+            if isinstance(param.default, DependsParam)
+            and param.default.dependency in ASYNC_DEPENDENCIES
+        ),
+        None,
+    )
+
+
+async def _iterate_on_session(db: AsyncSession, iterator: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """Step a sync iterator that reads from the session, one item per `run_sync`."""
+    while True:
+        item = await db.run_sync(lambda _: next(iterator, None))
+        if item is None:
+            return
+        yield item
+
+
+def make_async_endpoint(endpoint: Callable) -> Callable:
+    """
+    Wrap a sync endpoint so that it runs on an async session.
+    
+    The wrapper has the endpoint's signature, with the session dependency
+    swapped for its async version, so FastAPI resolves the same
+    parameters and builds the same OpenAPI schema for it.
+    
+    Streaming responses that keep reading from the session while they are
+    sent are stepped on the async session too.
+    """
+    session_param = _session_param(endpoint)
+    signature = inspect.signature(endpoint)
+    
+    async def async_endpoint(**kwargs: Any) -> Any:
+        db: AsyncSession = kwargs.pop(session_param)
+        result = await db.run_sync(
+            lambda sync_db: endpoint(**kwargs, **{session_param: sync_db})
+        )
+        if isinstance(result, SessionStreamingResponse):
+            result.body_iterator = _iterate_on_session(db, result.sync_iterator)
+        return result
+    
+    async_endpoint.__signature__ = signature.replace(parameters=[
+        param.replace(default=Depends(ASYNC_DEPENDENCIES[param.default.dependency]))
+        if name == session_param else param
+        for name, param in signature.parameters.items()
+    ])
+    async_endpoint.__name__ = endpoint.__name__
+    async_endpoint.__qualname__ = endpoint.__qualname__
+    async_endpoint.__doc__ = endpoint.__doc__
+    return async_endpoint
+
+
+def make_async_router(router: APIRouter) -> APIRouter:
+    """Copy a router, replacing its database-backed endpoints with async versions."""
+    async_router = APIRouter()
+    for route in router.routes:
+        if not isinstance(route, APIRoute) or _session_param(route.endpoint) is None:
+            async_router.routes.append(route)
+            continue
+        async_router.add_api_route(
+            route.path,
+            make_async_endpoint(route.endpoint),
+            methods=list(route.methods),
+            response_model=route.response_model,
+            status_code=route.status_code,
+            tags=route.tags,
+            dependencies=route.dependencies,
+            summary=route.summary,
+            description=route.description,
+            response_description=route.response_description,
+            responses=route.responses,
+            deprecated=route.deprecated,
+            operation_id=route.operation_id,
+            include_in_schema=route.include_in_schema,
+            response_class=route.response_class,
+            name=route.name,
+        )
+    return async_router
@@ -1,12 +1,21 @@
+from datetime import datetime
 from typing import Optional, Sequence
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select, update
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import delete, select, update
 from sqlalchemy.orm import Session, selectinload
 
-from database import get_db
+from database import get_db, get_read_db
 from models.line import Line, LineCreate, LineRead, LineReadWithRoutes, LineStatus, LineUpdate
 from models.recording import RecordingSession
+from models.route import Route, RouteConsensus, RouteConsensusRead, RouteRead
+from services.consensus import apply_consensus, get_consensus, line_directions, update_consensus
+from services.etags import not_modified, scope_version
+from services.geojson import GEOJSON_MEDIA_TYPE, GEOJSON_RESPONSES, PrecisionQuery, line_feature_collection
+from services.pagination import CursorQuery, after_cursor, decode_cursor, set_next_cursor
+from services.route_index import route_index
+from services.simplification import ToleranceQuery, ZoomQuery, pick_tolerance
+from services.tiles import invalidate_route_tiles, route_shapes
 
 router = APIRouter(prefix="/lines", tags=["lines"])
 
@@ -26,8 +35,11 @@ def create_line(line_data: LineCreate, db: Session = Depends(get_db)) -> LineRea
 
 @router.get("/", response_model=list[LineRead])
 def list_lines(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = CursorQuery,
     status: Optional[LineStatus] = Query(
         default=LineStatus.APPROVED,
         description="Filter by status. Use 'pending' to see lines awaiting approval."
@@ -36,21 +48,49 @@ def list_lines(
         default=False,
         description="If true, return all lines regardless of status (admin use)."
     ),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ) -> Sequence[LineRead]:
-    """List transit lines. By default, only returns approved lines."""
-    query = select(Line)
+    """
+    List transit lines. By default, only returns approved lines.
     
-    if not include_all:
-        query = query.where(Line.status == status)
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    Send the ETag back as If-None-Match to get a 304 if no line changed.
+    """
+    conditions = [] if include_all else [Line.status == status]
+    cached = not_modified(request, response, scope_version(db, Line, *conditions))
+    if cached is not None:
+        return cached
     
-    lines = db.execute(query.offset(skip).limit(limit)).scalars().all()
+    query = select(Line).where(*conditions)
+    if cursor is not None:
+        query = query.where(after_cursor([Line.id], decode_cursor(cursor, (int,))))
+    
+    lines = db.execute(query.order_by(Line.id).offset(skip).limit(limit)).scalars().all()
+    set_next_cursor(response, lines, limit, lambda ln: (ln.id,))
     return [LineRead.model_validate(ln) for ln in lines]
 
 
 @router.get("/{line_id}", response_model=LineReadWithRoutes)
-def get_line(line_id: int, db: Session = Depends(get_db)) -> LineReadWithRoutes:
-    """Get a specific line by ID with its routes."""
+def get_line(
+    line_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+) -> LineReadWithRoutes:
+    """
+    Get a specific line by ID with its routes.
+    
+    Answers 304 to If-None-Match or If-Modified-Since if neither the line
+    nor its routes changed.
+    """
+    line_version = scope_version(db, Line, Line.id == line_id)
+    if not line_version[0]:
+        raise HTTPException(status_code=404, detail="Line not found")
+    routes_version = scope_version(db, Route, Route.line_id == line_id)
+    cached = not_modified(request, response, line_version, routes_version, modified_since=True)
+    if cached is not None:
+        return cached
+    
     line = db.execute(
         select(Line).where(Line.id == line_id).options(selectinload(Line.routes))
     ).scalar_one_or_none()
@@ -60,6 +100,26 @@ def get_line(line_id: int, db: Session = Depends(get_db)) -> LineReadWithRoutes:
     return LineReadWithRoutes.model_validate(line)
 
 
+@router.get("/{line_id}/geojson", response_class=Response, responses=GEOJSON_RESPONSES)
+def get_line_geojson(
+    line_id: int,
+    precision: Optional[int] = PrecisionQuery,
+    tolerance: Optional[float] = ToleranceQuery,
+    zoom: Optional[int] = ZoomQuery,
+    db: Session = Depends(get_read_db)
+) -> Response:
+    """
+    Get the routes of a line as a GeoJSON FeatureCollection.
+    
+    The document is built by the database in one query. With `tolerance`
+    or `zoom`, paths are simplified to the nearest stored level.
+    """
+    document = line_feature_collection(db, line_id, precision, pick_tolerance(tolerance, zoom))
+    if document is None:
+        raise HTTPException(status_code=404, detail="Line not found")
+    return Response(content=document, media_type=GEOJSON_MEDIA_TYPE)
+
+
 @router.patch("/{line_id}", response_model=LineRead)
 def update_line(
     line_id: int,
@@ -74,10 +134,15 @@ def update_line(
     update_data = line_data.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(line, key, value)
+    line.updated_at = datetime.utcnow()
     
     db.add(line)
     db.commit()
     db.refresh(line)
+    # Tiles show approved lines' routes, with the line's name
+    if update_data.keys() & {"name", "status"}:
+        invalidate_route_tiles(route_shapes(db, line_id=line_id))
+        route_index.routes_changed(db, line_id=line_id)
     return LineRead.model_validate(line)
 
 
@@ -87,8 +152,11 @@ def delete_line(line_id: int, db: Session = Depends(get_db)) -> None:
     line = db.get(Line, line_id)
     if not line:
         raise HTTPException(status_code=404, detail="Line not found")
+    paths = route_shapes(db, line_id=line_id)
     db.delete(line)
     db.commit()
+    invalidate_route_tiles(paths)
+    route_index.routes_changed(db, line_id=line_id)
 
 
 @router.post("/{line_id}/merge/{target_line_id}", response_model=LineRead)
@@ -133,12 +201,19 @@ def merge_line(
         .values(line_id=target_line_id)
     )
     
+    # The source's consensus paths were built from the recordings moved away
+    db.execute(delete(RouteConsensus).where(RouteConsensus.line_id == line_id))
+    
     # Mark source as merged
     source.status = LineStatus.MERGED
     source.merged_into_id = target_line_id
+    source.updated_at = datetime.utcnow()
     
     db.commit()
     db.refresh(target)
+    # A merged line's routes are no longer on the map
+    invalidate_route_tiles(route_shapes(db, line_id=line_id))
+    route_index.routes_changed(db, line_id=line_id)
     
     return LineRead.model_validate(target)
 
@@ -157,7 +232,88 @@ def approve_line(line_id: int, db: Session = Depends(get_db)) -> LineRead:
         )
     
     line.status = LineStatus.APPROVED
+    line.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(line)
+    invalidate_route_tiles(route_shapes(db, line_id=line_id))
+    route_index.routes_changed(db, line_id=line_id)
     
     return LineRead.model_validate(line)
+
+
+# ============================================================
+# Consensus Paths
+# ============================================================
+
+@router.get("/{line_id}/consensus", response_model=list[RouteConsensusRead])
+def list_line_consensus(line_id: int, db: Session = Depends(get_read_db)) -> Sequence[RouteConsensusRead]:
+    """Get the consensus paths built from the line's recordings, one per direction."""
+    consensus = db.execute(
+        select(RouteConsensus)
+        .where(RouteConsensus.line_id == line_id)
+        .order_by(RouteConsensus.direction)
+    ).scalars().all()
+    return [RouteConsensusRead.model_validate(c) for c in consensus]
+
+
+@router.post("/{line_id}/consensus", response_model=list[RouteConsensusRead])
+def build_line_consensus(
+    line_id: int,
+    direction: Optional[str] = Query(default=None, description="Only this direction (default: all)"),
+    rebuild: bool = Query(default=False, description="Recompute from scratch, ignoring the current consensus"),
+    db: Session = Depends(get_db)
+) -> Sequence[RouteConsensusRead]:
+    """
+    Bring the line's consensus paths up to date with its completed recordings (admin operation).
+    
+    Recordings not in a consensus yet are resampled and the consensus is
+    recomputed. The in-process scheduler does this every 15 minutes (job
+    `consensus`). A direction needs a few recordings that agree on a path
+    before it gets one.
+    """
+    if not db.get(Line, line_id):
+        raise HTTPException(status_code=404, detail="Line not found")
+    
+    directions = [direction] if direction is not None else line_directions(db, line_id)
+    updated = [update_consensus(db, line_id, d, rebuild=rebuild) for d in directions]
+    db.commit()
+    return [RouteConsensusRead.model_validate(c) for c in updated if c is not None]
+
+
+@router.post("/{line_id}/consensus/apply", response_model=RouteRead)
+def apply_line_consensus(
+    line_id: int,
+    direction: str = Query(description="Direction of the consensus path to apply"),
+    route_id: Optional[int] = Query(
+        default=None,
+        description="Route of the line to update (default: its only route in that direction, or a new one)"
+    ),
+    db: Session = Depends(get_db)
+) -> RouteRead:
+    """Make a consensus path the path of a route of the line (admin operation)."""
+    consensus = get_consensus(db, line_id, direction)
+    if consensus is None:
+        raise HTTPException(status_code=404, detail=f"No consensus path for direction '{direction}'")
+    
+    if route_id is not None:
+        route = db.get(Route, route_id)
+        if not route or route.line_id != line_id:
+            raise HTTPException(status_code=404, detail="Route not found on this line")
+    else:
+        routes = db.execute(
+            select(Route).where(Route.line_id == line_id).where(Route.direction == direction)
+        ).scalars().all()
+        if len(routes) > 1:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Line has {len(routes)} routes in direction '{direction}'; pass route_id"
+            )
+        route = routes[0] if routes else None
+    
+    old_path = route.path if route is not None else None
+    route = apply_consensus(db, consensus, route)
+    db.commit()
+    db.refresh(route)
+    invalidate_route_tiles([old_path, route.path])
+    route_index.routes_changed(db, [route.id])
+    return RouteRead.model_validate(route)
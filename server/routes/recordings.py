@@ -1,11 +1,14 @@
 from datetime import datetime, timedelta
-from typing import Sequence
+from typing import Optional, Sequence
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import func, select
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, defer
 
-from database import get_db
+from database import get_db, get_read_db, run_blocking
+from models.geometry import GeometryFormat
 from models.line import Line, LineStatus
 from models.recording import (
     LocationPoint,
@@ -18,8 +21,67 @@ from models.recording import (
     RecordingStatus,
     SensorReading,
     SensorReadingBatch,
+    SensorReadingColumns,
     SensorReadingCreate,
     SensorReadingRead,
+    SessionMatch,
+    SessionMatchRead,
+)
+from services.cleanup import CLEANUP_CHUNK_SIZE, abandon_stale_sessions
+from services.consensus import drop_track
+from services.export import (
+    LOCATION_EXPORT_COLUMNS,
+    SENSOR_EXPORT_COLUMNS,
+    ExportFormat,
+    SessionStreamingResponse,
+    export_response,
+    location_blocks,
+    sensor_blocks,
+)
+from services.geometry import GeometryFormatQuery, GeometryPrecisionQuery, page_response, read_model
+from services.ingest import (
+    copy_location_points,
+    copy_sensor_columns,
+    copy_sensor_readings,
+    find_ingest_batch,
+    ingest_batch_result,
+    record_ingest_batch,
+)
+from services.map_matching import (
+    MATCH_BATCH_SIZE,
+    match_read,
+    match_session,
+    match_sessions,
+    unmatched_sessions,
+)
+from services.pagination import CursorQuery, after_cursor, decode_cursor, set_next_cursor
+from services.paths import update_session_path
+from services.partitions import (
+    PARTITION_MONTHS_AHEAD,
+    PARTITIONED_TABLES,
+    add_months,
+    detach_partitions,
+    ensure_partitions,
+    list_partitions,
+    month_start,
+    outside_session_window,
+    session_time_bounds,
+)
+from services.session_cache import session_cache
+from services.simplification import (
+    ToleranceQuery,
+    ZoomQuery,
+    apply_path_level,
+    drop_path_levels,
+    pick_tolerance,
+    store_path_levels,
+)
+from services.spool import get_spool
+from services.trajectory import (
+    TRAJECTORY_STORAGE,
+    compact_finished_sessions,
+    compact_session,
+    session_location_points,
 )
 
 router = APIRouter(prefix="/recordings", tags=["recordings"])
@@ -68,15 +130,30 @@ def start_recording(
 
 @router.get("/", response_model=list[RecordingSessionRead])
 def list_recordings(
+    response: Response,
     user_id: int | None = None,
     line_id: int | None = None,
     status: RecordingStatus | None = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = CursorQuery,
+    tolerance: Optional[float] = ToleranceQuery,
+    zoom: Optional[int] = ZoomQuery,
+    geometry_format: GeometryFormat = GeometryFormatQuery,
+    geometry_precision: int = GeometryPrecisionQuery,
+    db: Session = Depends(get_read_db)
 ) -> Sequence[RecordingSessionRead]:
-    """List recording sessions with optional filters."""
+    """
+    List recording sessions with optional filters, newest first.
+    
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    With `tolerance` or `zoom`, paths are simplified to the nearest stored level.
+    With `geometry_format`, paths are sent as encoded polylines or delta-encoded integers.
+    """
+    level = pick_tolerance(tolerance, zoom)
     query = select(RecordingSession)
+    if level is not None:
+        query = query.options(defer(RecordingSession.computed_path))
     
     if user_id is not None:
         query = query.where(RecordingSession.user_id == user_id)
@@ -85,21 +162,54 @@ def list_recordings(
     if status is not None:
         query = query.where(RecordingSession.status == status)
     
+    keys = [RecordingSession.started_at, RecordingSession.id]
+    if cursor is not None:
+        values = decode_cursor(cursor, (datetime, int))
+        query = query.where(after_cursor(keys, values, descending=True))
+    
     sessions = db.execute(
-        query.order_by(RecordingSession.started_at.desc())
+        query.order_by(*(key.desc() for key in keys))
         .offset(skip).limit(limit)
     ).scalars().all()
     
-    return [RecordingSessionRead.model_validate(s) for s in sessions]
+    set_next_cursor(response, sessions, limit, lambda s: (s.started_at, s.id))
+    apply_path_level(db, sessions, level, response)
+    return page_response(
+        RecordingSessionRead, sessions, "computed_path", response, geometry_format, geometry_precision
+    )
 
 
 @router.get("/{session_id}", response_model=RecordingSessionRead)
-def get_recording(session_id: int, db: Session = Depends(get_db)) -> RecordingSessionRead:
-    """Get a specific recording session."""
-    session = db.get(RecordingSession, session_id)
+def get_recording(
+    session_id: int,
+    response: Response,
+    tolerance: Optional[float] = ToleranceQuery,
+    zoom: Optional[int] = ZoomQuery,
+    geometry_format: GeometryFormat = GeometryFormatQuery,
+    geometry_precision: int = GeometryPrecisionQuery,
+    db: Session = Depends(get_db)
+) -> RecordingSessionRead:
+    """
+    Get a specific recording session, with its path simplified if `tolerance` or `zoom` is given,
+    and encoded if `geometry_format` is.
+    """
+    level = pick_tolerance(tolerance, zoom)
+    session = db.get(
+        RecordingSession,
+        session_id,
+        options=[defer(RecordingSession.computed_path)] if level is not None else None,
+    )
     if not session:
         raise HTTPException(status_code=404, detail="Recording session not found")
-    return RecordingSessionRead.model_validate(session)
+    apply_path_level(db, [session], level, response)
+    return read_model(RecordingSessionRead, session, "computed_path", geometry_format, geometry_precision)
+
+
+def _drain_spool() -> None:
+    """Write the batches waiting in the ingest spool, if uploads are spooled."""
+    spool = get_spool()
+    if spool is not None:
+        run_blocking(spool.drain)
 
 
 @router.post("/{session_id}/end", response_model=RecordingSessionRead)
@@ -108,7 +218,9 @@ def end_recording(session_id: int, db: Session = Depends(get_db)) -> RecordingSe
     End a recording session.
     
     This marks the session as completed, sets the end time,
-    and computes the path from all location points.
+    completes the path from all location points and stores its
+    simplified levels. In spool mode, batches still in the spool are
+    written first, so the path includes them.
     """
     session = db.get(RecordingSession, session_id)
     if not session:
@@ -120,30 +232,27 @@ def end_recording(session_id: int, db: Session = Depends(get_db)) -> RecordingSe
             detail=f"Session is not in progress (current status: {session.status})"
         )
     
-    # Compute path from location points
-    points = db.execute(
-        select(LocationPoint)
-        .where(LocationPoint.session_id == session_id)
-        .order_by(LocationPoint.timestamp)
-    ).scalars().all()
+    _drain_spool()
     
-    if len(points) >= 2:
-        # Create LineString from points
-        coords = [(p.longitude, p.latitude) for p in points]
-        linestring = f"SRID=4326;LINESTRING({', '.join(f'{lon} {lat}' for lon, lat in coords)})"
-        session.computed_path = func.ST_GeomFromEWKT(linestring)
+    # The path is built as points arrive; only points not yet on it are added
+    update_session_path(db, session_id)
+    store_path_levels(db, RecordingSession, [session_id])
     
     session.status = RecordingStatus.COMPLETED
     session.ended_at = datetime.utcnow()
     
+    if TRAJECTORY_STORAGE == "chunks":
+        compact_session(db, session_id)
+    
     db.commit()
+    session_cache.invalidate(session_id)
     db.refresh(session)
     return RecordingSessionRead.model_validate(session)
 
 
 @router.post("/{session_id}/cancel", response_model=RecordingSessionRead)
 def cancel_recording(session_id: int, db: Session = Depends(get_db)) -> RecordingSessionRead:
-    """Cancel an in-progress recording session."""
+    """Cancel an in-progress recording session, after writing its spooled batches."""
     session = db.get(RecordingSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Recording session not found")
@@ -154,10 +263,13 @@ def cancel_recording(session_id: int, db: Session = Depends(get_db)) -> Recordin
             detail=f"Session is not in progress (current status: {session.status})"
         )
     
+    _drain_spool()
+    
     session.status = RecordingStatus.CANCELLED
     session.ended_at = datetime.utcnow()
     
     db.commit()
+    session_cache.invalidate(session_id)
     db.refresh(session)
     return RecordingSessionRead.model_validate(session)
 
@@ -166,6 +278,115 @@ def cancel_recording(session_id: int, db: Session = Depends(get_db)) -> Recordin
 # Location Points - Batch Upload
 # ============================================================
 
+def _session_state(db: Session, session_id: int) -> tuple[RecordingStatus, datetime]:
+    """
+    Status and start time of a recording session, for the upload endpoints.
+    
+    In-progress sessions are served from the session cache, so uploads
+    don't have to load the session row each time.
+    """
+    cached = session_cache.get(session_id)
+    if cached is not None and cached.started_at is not None:
+        return cached.status, cached.started_at
+    
+    session = db.get(RecordingSession, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Recording session not found")
+    if session.status == RecordingStatus.IN_PROGRESS:
+        session_cache.put(session_id, session.status, session.started_at)
+    return session.status, session.started_at
+
+
+def _check_session_window(started_at: datetime, timestamps: Sequence[datetime]) -> None:
+    """Refuse timestamps that reads of the session would not find (e.g. from a wrong device clock)."""
+    outside = outside_session_window(started_at, timestamps)
+    if outside is not None:
+        raise HTTPException(
+            status_code=422,
+            detail=(
+                f"Timestamp {outside.isoformat()} is too far outside the session, "
+                f"which started at {started_at.isoformat()}; check the device clock"
+            ),
+        )
+
+
+def _touch_session(db: Session, session_id: int) -> None:
+    """Bump last_activity_at, at most once per activity interval per session."""
+    if not session_cache.activity_due(session_id):
+        return
+    db.execute(
+        update(RecordingSession)
+        .where(RecordingSession.id == session_id)
+        .values(last_activity_at=datetime.utcnow())
+    )
+
+
+def _commit_batch(
+    db: Session,
+    session_id: int,
+    kind: str,
+    batch_id: str | None,
+    total: int,
+    added: int,
+    first_timestamp: datetime,
+    last_timestamp: datetime,
+) -> dict:
+    """
+    Commit an uploaded batch and build the batch endpoint response.
+    
+    When the client sent a batch ID, the result is stored with it so that
+    retries of the same batch get this response back without writing anything.
+    """
+    _touch_session(db, session_id)
+    
+    if batch_id is None:
+        db.commit()
+        return {
+            "added": added,
+            "duplicates": total - added,
+            "session_id": session_id,
+            "batch_id": None,
+            "first_timestamp": first_timestamp.isoformat(),
+            "last_timestamp": last_timestamp.isoformat(),
+            "replayed": False,
+        }
+    
+    record = record_ingest_batch(
+        db, session_id, kind, batch_id, total, added, first_timestamp, last_timestamp
+    )
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent retry of the same batch committed first
+        db.rollback()
+        previous = find_ingest_batch(db, session_id, kind, batch_id)
+        if previous is None:
+            raise
+        return ingest_batch_result(previous, replayed=True)
+    return ingest_batch_result(record)
+
+
+def _spooled_response(
+    session_id: int,
+    sequence: int,
+    count: int,
+    first_timestamp: datetime,
+    last_timestamp: datetime,
+) -> JSONResponse:
+    """Response for a batch accepted into the ingest spool (written to the database later)."""
+    return JSONResponse(
+        status_code=202,
+        content={
+            "added": count,
+            "session_id": session_id,
+            "first_timestamp": first_timestamp.isoformat(),
+            "last_timestamp": last_timestamp.isoformat(),
+            "sequence": sequence,
+            "spooled": True,
+        }
+    )
+
+
 @router.post("/{session_id}/locations", response_model=LocationPointRead, status_code=201)
 def add_location_point(
     session_id: int,
@@ -173,12 +394,10 @@ def add_location_point(
     db: Session = Depends(get_db)
 ) -> LocationPointRead:
     """Add a single location point to a recording session."""
-    session = db.get(RecordingSession, session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Recording session not found")
-    
-    if session.status != RecordingStatus.IN_PROGRESS:
+    status, started_at = _session_state(db, session_id)
+    if status != RecordingStatus.IN_PROGRESS:
         raise HTTPException(status_code=400, detail="Session is not in progress")
+    _check_session_window(started_at, [point_data.timestamp])
     
     # Create PostGIS point
     point_wkt = f"SRID=4326;POINT({point_data.longitude} {point_data.latitude})"
@@ -189,6 +408,18 @@ def add_location_point(
         point=func.ST_GeomFromEWKT(point_wkt)
     )
     db.add(point)
+    try:
+        db.flush()
+    except IntegrityError:
+        # Retried upload: the point for this timestamp is already stored
+        db.rollback()
+        point = db.execute(
+            select(LocationPoint)
+            .where(LocationPoint.session_id == session_id)
+            .where(LocationPoint.timestamp == point_data.timestamp)
+        ).scalar_one()
+        return LocationPointRead.model_validate(point)
+    update_session_path(db, session_id, point_data.timestamp)
     db.commit()
     db.refresh(point)
     return LocationPointRead.model_validate(point)
@@ -205,61 +436,99 @@ def add_location_batch(
     
     This is the recommended way to upload location data - collect points
     locally on the device and upload in batches every 30-60 seconds.
+    
+    Uploads are idempotent: points already stored for the same timestamp are
+    skipped (and counted as `duplicates`), and a retry carrying the same
+    `batch_id` gets the original response back.
     """
-    session = db.get(RecordingSession, session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Recording session not found")
+    status, started_at = _session_state(db, session_id)
     
-    if session.status != RecordingStatus.IN_PROGRESS:
+    if batch.batch_id is not None:
+        previous = find_ingest_batch(db, session_id, "locations", batch.batch_id)
+        if previous is not None:
+            return ingest_batch_result(previous, replayed=True)
+    
+    if status != RecordingStatus.IN_PROGRESS:
         raise HTTPException(status_code=400, detail="Session is not in progress")
     
     if not batch.points:
         raise HTTPException(status_code=400, detail="Batch cannot be empty")
+    _check_session_window(started_at, [p.timestamp for p in batch.points])
+    
+    # Write-behind mode: acknowledge once the batch is durably spooled
+    spool = get_spool()
+    if spool is not None:
+        sequence = run_blocking(spool.append, "locations", session_id, batch)
+        return _spooled_response(
+            session_id, sequence, len(batch.points),
+            batch.points[0].timestamp, batch.points[-1].timestamp
+        )
     
-    points = []
-    for p in batch.points:
-        point_wkt = f"SRID=4326;POINT({p.longitude} {p.latitude})"
-        points.append(LocationPoint(
-            session_id=session_id,
-            **p.model_dump(),
-            point=func.ST_GeomFromEWKT(point_wkt)
-        ))
-    
-    db.add_all(points)
-    
-    # Update last activity timestamp
-    session.last_activity_at = datetime.utcnow()
-    
-    db.commit()
+    # Stream the whole batch with a single COPY instead of one INSERT per point
+    added = copy_location_points(db, session_id, batch.points)
+    if added:
+        update_session_path(db, session_id, min(p.timestamp for p in batch.points))
     
-    return {
-        "added": len(points),
-        "session_id": session_id,
-        "first_timestamp": batch.points[0].timestamp.isoformat(),
-        "last_timestamp": batch.points[-1].timestamp.isoformat(),
-    }
+    return _commit_batch(
+        db, session_id, "locations", batch.batch_id, len(batch.points), added,
+        batch.points[0].timestamp, batch.points[-1].timestamp
+    )
 
 
 @router.get("/{session_id}/locations", response_model=list[LocationPointRead])
 def get_location_points(
     session_id: int,
+    response: Response,
     skip: int = 0,
     limit: int = 1000,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = CursorQuery,
+    db: Session = Depends(get_read_db)
 ) -> Sequence[LocationPointRead]:
-    """Get all location points for a recording session."""
+    """
+    Get all location points for a recording session.
+    
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    """
     session = db.get(RecordingSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Recording session not found")
     
-    points = db.execute(
-        select(LocationPoint)
-        .where(LocationPoint.session_id == session_id)
-        .order_by(LocationPoint.timestamp)
-        .offset(skip).limit(limit)
-    ).scalars().all()
+    # Timestamps are unique within a session, so they alone are the page key
+    after = decode_cursor(cursor, (datetime,))[0] if cursor is not None else None
+    
+    # The time bounds let Postgres skip the partitions of other months
+    lower, upper = session_time_bounds(session.started_at, session.ended_at)
+    points = session_location_points(db, session_id, lower, upper, skip, limit, after=after)
+    set_next_cursor(response, points, limit, lambda p: (p.timestamp,))
+    return points
+
+
+@router.get(
+    "/{session_id}/locations/export",
+    responses={200: {"content": {"application/x-ndjson": {}, "text/csv": {}}}}
+)
+def export_location_points(
+    session_id: int,
+    format: ExportFormat = Query(default="ndjson", description="ndjson or csv"),
+    db: Session = Depends(get_read_db)
+) -> SessionStreamingResponse:
+    """
+    Download all location points of a recording session as NDJSON or CSV.
     
-    return [LocationPointRead.model_validate(p) for p in points]
+    The rows are streamed from a server-side cursor, so sessions of any
+    length can be exported in a single request.
+    """
+    session = db.get(RecordingSession, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Recording session not found")
+    
+    lower, upper = session_time_bounds(session.started_at, session.ended_at)
+    return export_response(
+        location_blocks(db, session_id, lower, upper),
+        LOCATION_EXPORT_COLUMNS,
+        format,
+        filename=f"session-{session_id}-locations",
+    )
 
 
 # ============================================================
@@ -273,16 +542,24 @@ def add_sensor_reading(
     db: Session = Depends(get_db)
 ) -> SensorReadingRead:
     """Add a single sensor reading to a recording session."""
-    session = db.get(RecordingSession, session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Recording session not found")
-    
-    if session.status != RecordingStatus.IN_PROGRESS:
+    status, started_at = _session_state(db, session_id)
+    if status != RecordingStatus.IN_PROGRESS:
         raise HTTPException(status_code=400, detail="Session is not in progress")
+    _check_session_window(started_at, [reading_data.timestamp])
     
     reading = SensorReading(session_id=session_id, **reading_data.model_dump())
     db.add(reading)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Retried upload: the reading for this timestamp is already stored
+        db.rollback()
+        reading = db.execute(
+            select(SensorReading)
+            .where(SensorReading.session_id == session_id)
+            .where(SensorReading.timestamp == reading_data.timestamp)
+        ).scalar_one()
+        return SensorReadingRead.model_validate(reading)
     db.refresh(reading)
     return SensorReadingRead.model_validate(reading)
 
@@ -290,7 +567,7 @@ def add_sensor_reading(
 @router.post("/{session_id}/sensors/batch", status_code=201)
 def add_sensor_batch(
     session_id: int,
-    batch: SensorReadingBatch,
+    batch: SensorReadingBatch | SensorReadingColumns,
     db: Session = Depends(get_db)
 ) -> dict:
     """
@@ -298,59 +575,278 @@ def add_sensor_batch(
     
     Sensor data is typically collected at higher frequencies than GPS,
     so batching is especially important here.
-    """
-    session = db.get(RecordingSession, session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Recording session not found")
     
-    if session.status != RecordingStatus.IN_PROGRESS:
-        raise HTTPException(status_code=400, detail="Session is not in progress")
+    Accepts either a list of readings (`{"readings": [...]}`) or the columnar
+    format with one array per channel (`{"timestamp": [...], "accel_x": [...]}`),
+    which is much cheaper to validate for high-frequency streams.
     
-    if not batch.readings:
-        raise HTTPException(status_code=400, detail="Batch cannot be empty")
+    Like location batches, uploads are idempotent by timestamp and `batch_id`.
+    """
+    status, started_at = _session_state(db, session_id)
+    
+    if batch.batch_id is not None:
+        previous = find_ingest_batch(db, session_id, "sensors", batch.batch_id)
+        if previous is not None:
+            return ingest_batch_result(previous, replayed=True)
     
-    readings = [
-        SensorReading(session_id=session_id, **r.model_dump())
-        for r in batch.readings
-    ]
+    if status != RecordingStatus.IN_PROGRESS:
+        raise HTTPException(status_code=400, detail="Session is not in progress")
     
-    db.add_all(readings)
+    if isinstance(batch, SensorReadingColumns):
+        timestamps = batch.timestamp
+    else:
+        timestamps = [r.timestamp for r in batch.readings]
     
-    # Update last activity timestamp
-    session.last_activity_at = datetime.utcnow()
+    if not timestamps:
+        raise HTTPException(status_code=400, detail="Batch cannot be empty")
+    _check_session_window(started_at, timestamps)
+    
+    # Write-behind mode: acknowledge once the batch is durably spooled
+    spool = get_spool()
+    if spool is not None:
+        kind = "sensor_columns" if isinstance(batch, SensorReadingColumns) else "sensors"
+        sequence = run_blocking(spool.append, kind, session_id, batch)
+        return _spooled_response(
+            session_id, sequence, len(timestamps), timestamps[0], timestamps[-1]
+        )
     
-    db.commit()
+    if isinstance(batch, SensorReadingColumns):
+        added = copy_sensor_columns(db, session_id, batch)
+    else:
+        added = copy_sensor_readings(db, session_id, batch.readings)
     
-    return {
-        "added": len(readings),
-        "session_id": session_id,
-        "first_timestamp": batch.readings[0].timestamp.isoformat(),
-        "last_timestamp": batch.readings[-1].timestamp.isoformat(),
-    }
+    return _commit_batch(
+        db, session_id, "sensors", batch.batch_id, len(timestamps), added,
+        timestamps[0], timestamps[-1]
+    )
 
 
 @router.get("/{session_id}/sensors", response_model=list[SensorReadingRead])
 def get_sensor_readings(
     session_id: int,
+    response: Response,
     skip: int = 0,
     limit: int = 1000,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = CursorQuery,
+    db: Session = Depends(get_read_db)
 ) -> Sequence[SensorReadingRead]:
-    """Get all sensor readings for a recording session."""
+    """
+    Get all sensor readings for a recording session.
+    
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    """
     session = db.get(RecordingSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Recording session not found")
     
-    readings = db.execute(
+    lower, upper = session_time_bounds(session.started_at, session.ended_at)
+    query = (
         select(SensorReading)
         .where(SensorReading.session_id == session_id)
-        .order_by(SensorReading.timestamp)
+        .where(SensorReading.timestamp.between(lower, upper))
+    )
+    if cursor is not None:
+        # Timestamps are unique within a session, so they alone are the page key
+        query = query.where(after_cursor([SensorReading.timestamp], decode_cursor(cursor, (datetime,))))
+    readings = db.execute(
+        query.order_by(SensorReading.timestamp)
         .offset(skip).limit(limit)
     ).scalars().all()
     
+    set_next_cursor(response, readings, limit, lambda r: (r.timestamp,))
     return [SensorReadingRead.model_validate(r) for r in readings]
 
 
+@router.get(
+    "/{session_id}/sensors/export",
+    responses={200: {"content": {"application/x-ndjson": {}, "text/csv": {}}}}
+)
+def export_sensor_readings(
+    session_id: int,
+    format: ExportFormat = Query(default="ndjson", description="ndjson or csv"),
+    db: Session = Depends(get_read_db)
+) -> SessionStreamingResponse:
+    """
+    Download all sensor readings of a recording session as NDJSON or CSV.
+    
+    The rows are streamed from a server-side cursor, so sessions of any
+    length can be exported in a single request.
+    """
+    session = db.get(RecordingSession, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Recording session not found")
+    
+    lower, upper = session_time_bounds(session.started_at, session.ended_at)
+    return export_response(
+        sensor_blocks(db, session_id, lower, upper),
+        SENSOR_EXPORT_COLUMNS,
+        format,
+        filename=f"session-{session_id}-sensors",
+    )
+
+
+# ============================================================
+# Map Matching
+# ============================================================
+
+# Declared before the /{session_id}/match routes, which would capture its path
+@router.post("/maintenance/match", tags=["admin"])
+def match_recordings(
+    limit: int = Query(default=MATCH_BATCH_SIZE, ge=1, le=5000, description="Maximum sessions to match"),
+    db: Session = Depends(get_db)
+) -> dict:
+    """
+    Match completed sessions that have no current map matching result (admin/cron operation).
+    
+    A result is current unless a route of the session's line changed since.
+    The in-process scheduler runs this hourly (job `map_matching`); for a
+    large backlog use `python -m services.map_matching`, which matches in
+    parallel processes.
+    """
+    session_ids = unmatched_sessions(db, limit=limit)
+    matched = match_sessions(db, session_ids)
+    db.commit()
+    
+    return {
+        "matched_sessions": len(matched),
+        "matched_points": sum(matched.values()),
+        "session_ids": list(matched),
+    }
+
+
+@router.post("/{session_id}/match", response_model=SessionMatchRead)
+def match_recording(session_id: int, db: Session = Depends(get_db)) -> SessionMatchRead:
+    """
+    Snap the session's location points onto the routes of its line.
+    
+    Replaces any stored result. Sessions in progress can be matched too,
+    but only completed ones are (re)matched in bulk.
+    """
+    session = db.get(RecordingSession, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Recording session not found")
+    
+    match = match_session(db, session)
+    db.commit()
+    db.refresh(match)
+    return match_read(match)
+
+
+@router.get("/{session_id}/match", response_model=SessionMatchRead)
+def get_recording_match(session_id: int, db: Session = Depends(get_read_db)) -> SessionMatchRead:
+    """Get the stored map matching result of a session: route, distance along it and offset per point."""
+    match = db.execute(
+        select(SessionMatch).where(SessionMatch.session_id == session_id)
+    ).scalar_one_or_none()
+    if match is None:
+        raise HTTPException(status_code=404, detail="Recording session has not been matched")
+    return match_read(match)
+
+
+# ============================================================
+# Ingest Spool
+# ============================================================
+
+@router.get("/spool/stats", tags=["admin"])
+def get_spool_stats() -> dict:
+    """
+    Depth and flush lag of the write-behind ingest spool (admin/monitoring).
+    
+    Only meaningful when the server runs with INGEST_MODE=spool.
+    """
+    spool = get_spool()
+    if spool is None:
+        return {"enabled": False}
+    return {"enabled": True, **spool.stats()}
+
+
+# ============================================================
+# Partitions
+# ============================================================
+
+@router.get("/maintenance/partitions", tags=["admin"])
+def get_partitions(db: Session = Depends(get_db)) -> dict:
+    """Monthly partitions of the recording data tables (admin/monitoring)."""
+    return {
+        table: [
+            {"name": p.name, "start": p.start.isoformat(), "end": p.end.isoformat()}
+            for p in list_partitions(db, table)
+        ]
+        for table in PARTITIONED_TABLES
+    }
+
+
+@router.post("/maintenance/partitions", tags=["admin"])
+def maintain_partitions(
+    months_ahead: int = Query(
+        default=PARTITION_MONTHS_AHEAD,
+        ge=0,
+        le=24,
+        description="Create monthly partitions this many months past the current one"
+    ),
+    retain_months: Optional[int] = Query(
+        default=None,
+        ge=1,
+        description="Detach partitions of months older than this many months. Keeps everything if not set."
+    ),
+    drop: bool = Query(
+        default=False,
+        description="Drop the old partitions instead of only detaching them"
+    ),
+    db: Session = Depends(get_db)
+) -> dict:
+    """
+    Create upcoming monthly partitions and retire old ones (admin/cron operation).
+    
+    The in-process scheduler creates upcoming partitions daily (job
+    `partitions`), so that they always exist before data for their month
+    arrives. Retiring old partitions is left to this endpoint.
+    """
+    created = ensure_partitions(db, months_ahead=months_ahead)
+    
+    retired: list[str] = []
+    if retain_months is not None:
+        cutoff = add_months(month_start(datetime.utcnow()), -retain_months)
+        retired = detach_partitions(db, before=cutoff, drop=drop)
+    
+    db.commit()
+    
+    return {
+        "created": created,
+        "dropped" if drop else "detached": retired,
+    }
+
+
+@router.post("/maintenance/compact", tags=["admin"])
+def compact_recordings(
+    ended_minutes: int = Query(
+        default=60,
+        ge=0,
+        description="Compact sessions that ended at least this many minutes ago"
+    ),
+    limit: int = Query(default=100, ge=1, le=1000, description="Maximum sessions to compact"),
+    db: Session = Depends(get_db)
+) -> dict:
+    """
+    Pack the location points of finished sessions into trajectory chunks (admin/cron operation).
+    
+    Compacted points are still returned by the location and path endpoints,
+    but take a fraction of the space. Call this periodically via cron job
+    (e.g., hourly), or set TRAJECTORY_STORAGE=chunks to compact sessions as
+    soon as they end.
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=ended_minutes)
+    compacted = compact_finished_sessions(db, ended_before=cutoff, limit=limit)
+    db.commit()
+    
+    return {
+        "ended_before": cutoff.isoformat(),
+        "compacted_sessions": len(compacted),
+        "compacted_points": sum(compacted.values()),
+        "session_ids": list(compacted),
+    }
+
+
 # ============================================================
 # Stale Session Cleanup
 # ============================================================
@@ -362,6 +858,17 @@ def cleanup_stale_sessions(
         ge=5,
         description="Mark sessions as abandoned if no activity for this many minutes"
     ),
+    chunk_size: int = Query(
+        default=CLEANUP_CHUNK_SIZE,
+        ge=1,
+        le=10000,
+        description="Sessions to abandon per transaction"
+    ),
+    max_chunks: Optional[int] = Query(
+        default=None,
+        ge=1,
+        description="Stop after this many chunks (the rest is left for the next run). Runs until done if not set."
+    ),
     db: Session = Depends(get_db)
 ) -> dict:
     """
@@ -369,44 +876,27 @@ def cleanup_stale_sessions(
     
     Sessions with no activity for longer than `inactive_minutes` will be:
     - Marked as ABANDONED
-    - Have their computed_path generated from existing points
+    - Have the points not yet on their computed_path added to it, and
+      its simplified levels stored
     - Have ended_at set to last_activity_at
     
-    Call this periodically via cron job (e.g., every 15 minutes).
+    Sessions are processed in chunks of `chunk_size`, each in its own
+    transaction. Safe to call from several workers at once: only one runs
+    the cleanup, the others return with `locked_out` set.
+    
+    The in-process scheduler runs this every 15 minutes (job
+    `stale_cleanup`); call it directly to run it with other settings.
     """
     cutoff = datetime.utcnow() - timedelta(minutes=inactive_minutes)
-    
-    # Find stale sessions
-    stale_sessions = db.execute(
-        select(RecordingSession)
-        .where(RecordingSession.status == RecordingStatus.IN_PROGRESS)
-        .where(RecordingSession.last_activity_at < cutoff)
-    ).scalars().all()
-    
-    abandoned_count = 0
-    for session in stale_sessions:
-        # Compute path from whatever points we have
-        points = db.execute(
-            select(LocationPoint)
-            .where(LocationPoint.session_id == session.id)
-            .order_by(LocationPoint.timestamp)
-        ).scalars().all()
-        
-        if len(points) >= 2:
-            coords = [(p.longitude, p.latitude) for p in points]
-            linestring = f"SRID=4326;LINESTRING({', '.join(f'{lon} {lat}' for lon, lat in coords)})"
-            session.computed_path = func.ST_GeomFromEWKT(linestring)
-        
-        session.status = RecordingStatus.ABANDONED
-        session.ended_at = session.last_activity_at
-        abandoned_count += 1
-    
-    db.commit()
+    progress = abandon_stale_sessions(db, cutoff, chunk_size=chunk_size, max_chunks=max_chunks)
     
     return {
         "checked_before": cutoff.isoformat(),
-        "abandoned_count": abandoned_count,
-        "session_ids": [s.id for s in stale_sessions]
+        "abandoned_count": len(progress.session_ids),
+        "session_ids": progress.session_ids,
+        "chunks": progress.chunks,
+        "remaining": progress.remaining,
+        "locked_out": progress.locked_out,
     }
 
 
@@ -431,7 +921,11 @@ def resume_recording(session_id: int, db: Session = Depends(get_db)) -> Recordin
     session.status = RecordingStatus.IN_PROGRESS
     session.ended_at = None
     session.last_activity_at = datetime.utcnow()
+    # The path grows again; levels and the consensus track are made anew when the session ends
+    drop_path_levels(db, RecordingSession, [session_id])
+    drop_track(db, session_id)
     
     db.commit()
+    session_cache.invalidate(session_id)
     db.refresh(session)
     return RecordingSessionRead.model_validate(session)
@@ -1,14 +1,35 @@
-import json
-from typing import Sequence
+from datetime import datetime
+from typing import Optional, Sequence
 
-from fastapi import APIRouter, Depends, HTTPException
-from geoalchemy2.functions import ST_AsGeoJSON
-from sqlalchemy import func, select
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, defer
 
-from database import get_db
+from database import get_db, get_read_db
+from models.geometry import GeometryFormat
 from models.line import Line
-from models.route import Route, RouteCreate, RouteRead, RouteUpdate
+from models.route import Route, RouteCreate, RouteNearbyRead, RouteRead, RouteUpdate
+from services.etags import not_modified, scope_version
+from services.geojson import (
+    GEOJSON_MEDIA_TYPE,
+    GEOJSON_RESPONSES,
+    BboxQuery,
+    PrecisionQuery,
+    bbox_feature_collection,
+    parse_bbox,
+    route_feature,
+)
+from services.geometry import GeometryFormatQuery, GeometryPrecisionQuery, page_response, read_model
+from services.pagination import CursorQuery, after_cursor, decode_cursor, set_next_cursor
+from services.route_index import route_index
+from services.simplification import (
+    ToleranceQuery,
+    ZoomQuery,
+    apply_path_level,
+    pick_tolerance,
+    store_path_levels,
+)
+from services.tiles import invalidate_route_tiles
 
 router = APIRouter(prefix="/routes", tags=["routes"])
 
@@ -29,33 +50,108 @@ def create_route(route_data: RouteCreate, db: Session = Depends(get_db)) -> Rout
         path=route_data.to_linestring()
     )
     db.add(route)
+    db.flush()
+    store_path_levels(db, Route, [route.id])
     db.commit()
     db.refresh(route)
+    invalidate_route_tiles([route.path])
+    route_index.routes_changed(db, [route.id])
     return RouteRead.model_validate(route)
 
 
 @router.get("/", response_model=list[RouteRead])
 def list_routes(
+    request: Request,
+    response: Response,
     line_id: int | None = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = CursorQuery,
+    tolerance: Optional[float] = ToleranceQuery,
+    zoom: Optional[int] = ZoomQuery,
+    geometry_format: GeometryFormat = GeometryFormatQuery,
+    geometry_precision: int = GeometryPrecisionQuery,
+    db: Session = Depends(get_read_db)
 ) -> Sequence[RouteRead]:
-    """List all routes, optionally filtered by line."""
-    query = select(Route)
-    if line_id is not None:
-        query = query.where(Route.line_id == line_id)
-    routes = db.execute(query.offset(skip).limit(limit)).scalars().all()
-    return [RouteRead.model_validate(r) for r in routes]
+    """
+    List all routes, optionally filtered by line.
+    
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    With `tolerance` or `zoom`, paths are simplified to the nearest stored level.
+    With `geometry_format`, paths are sent as encoded polylines or delta-encoded integers.
+    Send the ETag back as If-None-Match to get a 304 if no route changed.
+    """
+    conditions = [] if line_id is None else [Route.line_id == line_id]
+    cached = not_modified(request, response, scope_version(db, Route, *conditions))
+    if cached is not None:
+        return cached
+    
+    level = pick_tolerance(tolerance, zoom)
+    query = select(Route).where(*conditions)
+    if level is not None:
+        query = query.options(defer(Route.path))
+    if cursor is not None:
+        query = query.where(after_cursor([Route.id], decode_cursor(cursor, (int,))))
+    routes = db.execute(query.order_by(Route.id).offset(skip).limit(limit)).scalars().all()
+    set_next_cursor(response, routes, limit, lambda r: (r.id,))
+    apply_path_level(db, routes, level, response)
+    return page_response(RouteRead, routes, "path", response, geometry_format, geometry_precision)
+
+
+# Declared before /{route_id}, which would capture its path
+@router.get("/geojson", response_class=Response, responses=GEOJSON_RESPONSES)
+def get_routes_geojson(
+    bbox: str = BboxQuery,
+    precision: Optional[int] = PrecisionQuery,
+    tolerance: Optional[float] = ToleranceQuery,
+    zoom: Optional[int] = ZoomQuery,
+    db: Session = Depends(get_read_db)
+) -> Response:
+    """
+    Get the routes of approved lines crossing a bounding box as a GeoJSON FeatureCollection.
+    
+    The document is built by the database in one query, or comes from the
+    in-memory route index when it is enabled. With `tolerance` or `zoom`,
+    paths are simplified to the nearest stored level.
+    """
+    bounds = parse_bbox(bbox)
+    level = pick_tolerance(tolerance, zoom)
+    if route_index.ready and precision is None and level is None:
+        return Response(content=route_index.bbox(*bounds), media_type=GEOJSON_MEDIA_TYPE)
+    document = bbox_feature_collection(db, bounds, precision, level)
+    return Response(content=document, media_type=GEOJSON_MEDIA_TYPE)
 
 
 @router.get("/{route_id}", response_model=RouteRead)
-def get_route(route_id: int, db: Session = Depends(get_db)) -> RouteRead:
-    """Get a specific route by ID."""
-    route = db.get(Route, route_id)
+def get_route(
+    route_id: int,
+    request: Request,
+    response: Response,
+    tolerance: Optional[float] = ToleranceQuery,
+    zoom: Optional[int] = ZoomQuery,
+    geometry_format: GeometryFormat = GeometryFormatQuery,
+    geometry_precision: int = GeometryPrecisionQuery,
+    db: Session = Depends(get_db)
+) -> RouteRead:
+    """
+    Get a specific route by ID, with its path simplified if `tolerance` or `zoom` is given,
+    and encoded if `geometry_format` is.
+    
+    Answers 304 to If-None-Match or If-Modified-Since if the route did not change.
+    """
+    version = scope_version(db, Route, Route.id == route_id)
+    if not version[0]:
+        raise HTTPException(status_code=404, detail="Route not found")
+    cached = not_modified(request, response, version, modified_since=True)
+    if cached is not None:
+        return cached
+    
+    level = pick_tolerance(tolerance, zoom)
+    route = db.get(Route, route_id, options=[defer(Route.path)] if level is not None else None)
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
-    return RouteRead.model_validate(route)
+    apply_path_level(db, [route], level, response)
+    return read_model(RouteRead, route, "path", geometry_format, geometry_precision)
 
 
 @router.patch("/{route_id}", response_model=RouteRead)
@@ -69,19 +165,29 @@ def update_route(
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
     
-    update_data = route_data.model_dump(exclude_unset=True)
+    update_data = route_data.model_dump(exclude_unset=True, exclude={"path_precision"})
+    # Tiles show the route's attributes too, so the old path's tiles always go
+    old_path = route.path
     
     # Handle path separately as it needs conversion
-    if "path" in update_data and update_data["path"] is not None:
+    path_changed = "path" in update_data and update_data["path"] is not None
+    if path_changed:
         route.path = route_data.to_linestring()
         del update_data["path"]
     
     for key, value in update_data.items():
         setattr(route, key, value)
+    # Map matching results older than this are redone
+    route.updated_at = datetime.utcnow()
     
     db.add(route)
+    if path_changed:
+        db.flush()
+        store_path_levels(db, Route, [route.id])
     db.commit()
     db.refresh(route)
+    invalidate_route_tiles([old_path, route.path] if path_changed else [old_path])
+    route_index.routes_changed(db, [route.id])
     return RouteRead.model_validate(route)
 
 
@@ -91,55 +197,99 @@ def delete_route(route_id: int, db: Session = Depends(get_db)) -> None:
     route = db.get(Route, route_id)
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
+    path = route.path
     db.delete(route)
+    # The line's detail lists its routes
+    db.execute(update(Line).where(Line.id == route.line_id).values(updated_at=datetime.utcnow()))
     db.commit()
+    invalidate_route_tiles([path])
+    route_index.routes_changed(db, [route_id])
 
 
-@router.get("/{route_id}/geojson")
-def get_route_geojson(route_id: int, db: Session = Depends(get_db)) -> dict:
-    """Get route path as GeoJSON Feature."""
-    route = db.get(Route, route_id)
-    if not route:
+@router.get("/{route_id}/geojson", response_class=Response, responses=GEOJSON_RESPONSES)
+def get_route_geojson(
+    route_id: int,
+    request: Request,
+    response: Response,
+    precision: Optional[int] = PrecisionQuery,
+    db: Session = Depends(get_db)
+) -> Response:
+    """
+    Get route path as GeoJSON Feature, built by the database in one query.
+    
+    Answers 304 to If-None-Match or If-Modified-Since if neither the route
+    nor its line changed.
+    """
+    version = scope_version(db, Route, Route.id == route_id)
+    if not version[0]:
         raise HTTPException(status_code=404, detail="Route not found")
+    line_version = scope_version(
+        db, Line, Line.id == select(Route.line_id).where(Route.id == route_id).scalar_subquery()
+    )
+    cached = not_modified(request, response, version, line_version, modified_since=True)
+    if cached is not None:
+        return cached
     
-    if route.path is None:
-        raise HTTPException(status_code=404, detail="Route has no path defined")
+    result = route_feature(db, route_id, precision)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Route not found")
     
-    # Use PostGIS to convert to GeoJSON
-    result = db.execute(
-        select(ST_AsGeoJSON(Route.path)).where(Route.id == route_id)
-    ).scalar()
+    has_path, feature = result
+    if not has_path:
+        raise HTTPException(status_code=404, detail="Route has no path defined")
     
-    return {
-        "type": "Feature",
-        "properties": {
-            "id": route.id,
-            "line_id": route.line_id,
-            "direction": route.direction,
-            "distinctive": route.distinctive
-        },
-        "geometry": json.loads(result)
-    }
+    return Response(content=feature, media_type=GEOJSON_MEDIA_TYPE, headers=response.headers)
 
 
-@router.get("/nearby/", response_model=list[RouteRead])
+@router.get("/nearby/", response_model=list[RouteNearbyRead])
 def find_routes_nearby(
-    longitude: float,
-    latitude: float,
-    radius_meters: float = 1000,
-    db: Session = Depends(get_db)
-) -> Sequence[RouteRead]:
-    """Find routes within a given radius of a point."""
-    # Create a point from the coordinates and find routes within radius
-    point = f"SRID=4326;POINT({longitude} {latitude})"
-    
-    query = select(Route).where(
-        func.ST_DWithin(
-            func.ST_Transform(Route.path, 3857),  # Transform to meters
-            func.ST_Transform(func.ST_GeomFromEWKT(point), 3857),
-            radius_meters
+    response: Response,
+    longitude: float = Query(ge=-180, le=180),
+    latitude: float = Query(ge=-90, le=90),
+    radius_meters: float = Query(default=1000, gt=0, le=50000),
+    limit: int = Query(default=20, ge=1, le=100, description="Maximum routes, nearest first"),
+    tolerance: Optional[float] = ToleranceQuery,
+    zoom: Optional[int] = ZoomQuery,
+    db: Session = Depends(get_read_db)
+) -> Sequence[RouteNearbyRead]:
+    """
+    Find the routes nearest to a point, within a radius, nearest first.
+    
+    Each route comes with its distance from the point and the closest point
+    on its path. The search and the ordering (KNN `<->`) use the geography
+    index on the paths, so they don't scan the whole catalog. With the
+    in-memory route index enabled, full paths are served from memory.
+    """
+    level = pick_tolerance(tolerance, zoom)
+    if route_index.ready and level is None:
+        content = route_index.nearby(longitude, latitude, radius_meters, limit)
+        return Response(content=content, media_type="application/json")
+    point = func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326)
+    # Must match the expression of ix_routes_path_geography
+    path_geography = func.geography(Route.path)
+    point_geography = func.geography(point)
+    closest = func.ST_ClosestPoint(Route.path, point)
+    
+    query = (
+        select(
+            Route,
+            func.ST_Distance(path_geography, point_geography),
+            func.ST_X(closest),
+            func.ST_Y(closest),
         )
+        .where(func.ST_DWithin(path_geography, point_geography, radius_meters))
+        .order_by(path_geography.op("<->")(point_geography))
+        .limit(limit)
     )
-    
-    routes = db.execute(query).scalars().all()
-    return [RouteRead.model_validate(r) for r in routes]
+    if level is not None:
+        query = query.options(defer(Route.path))
+    rows = db.execute(query).all()
+    apply_path_level(db, [row[0] for row in rows], level, response)
+    return [
+        RouteNearbyRead(
+            **RouteRead.model_validate(route).model_dump(),
+            distance_meters=distance,
+            closest_point=[x, y],
+        )
+        for route, distance, x, y in rows
+    ]
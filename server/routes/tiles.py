@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.orm import Session
+
+from database import get_db, run_blocking
+from services.tiles import (
+    TILE_CACHE_HEADER,
+    TILE_MAX_AGE_SECONDS,
+    TILE_MEDIA_TYPE,
+    render_route_tile,
+    tile_cache,
+    valid_tile,
+)
+
+router = APIRouter(prefix="/tiles", tags=["tiles"])
+
+
+@router.get(
+    "/routes/{z}/{x}/{y}.mvt",
+    response_class=Response,
+    responses={200: {"content": {TILE_MEDIA_TYPE: {}}}},
+)
+def get_route_tile(z: int, x: int, y: int, db: Session = Depends(get_db)) -> Response:
+    """
+    Get a Mapbox Vector Tile of the routes of approved lines.
+    
+    The `routes` layer has one feature per route (id, line_id, line_name,
+    direction, distinctive, color), simplified for the zoom level. Tiles
+    are cached on disk until an edit to a route or line they show.
+    """
+    if not valid_tile(z, x, y):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    
+    data = run_blocking(tile_cache.get, z, x, y)
+    status = "hit"
+    if data is None:
+        status = "miss"
+        # Read from the primary: a lagging replica could cache a tile an edit just invalidated
+        generation = run_blocking(tile_cache.generation)
+        data = render_route_tile(db, z, x, y)
+        run_blocking(tile_cache.put, z, x, y, data, generation)
+    
+    return Response(
+        content=data,
+        media_type=TILE_MEDIA_TYPE,
+        headers={
+            TILE_CACHE_HEADER: status,
+            "Cache-Control": f"public, max-age={TILE_MAX_AGE_SECONDS}",
+        },
+    )
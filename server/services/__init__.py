@@ -0,0 +1,15 @@
+from .ingest import copy_location_points, copy_sensor_columns, copy_sensor_readings
+from .session_cache import SessionStateCache, session_cache
+from .spool import IngestSpool, close_spool, get_spool, open_spool
+from .trajectory import compact_finished_sessions, compact_session, pack_points, unpack_points
+
+__all__ = [
+    # Ingest
+    "copy_location_points", "copy_sensor_columns", "copy_sensor_readings",
+    # Session cache
+    "SessionStateCache", "session_cache",
+    # Spool
+    "IngestSpool", "close_spool", "get_spool", "open_spool",
+    # Trajectory storage
+    "compact_finished_sessions", "compact_session", "pack_points", "unpack_points",
+]
@@ -0,0 +1,141 @@
+"""
+Set-based cleanup of stale recording sessions.
+
+Sessions with no upload activity for a while are marked ABANDONED in
+chunks of CLEANUP_CHUNK_SIZE, one statement and one commit per chunk: the
+statement picks the chunk's sessions, appends the points that are not on
+their paths yet (aggregated per session with ST_MakeLine) and updates them;
+the simplified levels of the finished paths are stored in the same chunk.
+Each chunk only holds row locks on its own sessions, and only for as long
+as the chunk takes, so a backlog of thousands of stale sessions (e.g. after
+an outage) is worked through without one huge transaction.
+
+Several API workers can run the cleanup at the same time: a chunk starts
+by taking a transaction-level advisory lock, and a worker that can't get
+it stops, leaving the work to the one that holds it. Sessions locked by an
+in-flight upload are skipped (`SKIP LOCKED`); they are not stale anyway.
+"""
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import bindparam, func, select, text
+from sqlalchemy.orm import Session
+
+from models.recording import RecordingSession, RecordingStatus
+from services.session_cache import session_cache
+from services.simplification import store_path_levels
+
+logger = logging.getLogger(__name__)
+
+CLEANUP_CHUNK_SIZE = int(os.getenv("CLEANUP_CHUNK_SIZE", "500"))
+
+# Key of the advisory lock held while a cleanup chunk runs
+CLEANUP_LOCK_KEY = 0x4F54_0001
+
+_status_type = RecordingSession.__table__.c.status.type
+
+_ABANDON_CHUNK = text("""
+    WITH stale AS (
+        SELECT id, path_end_at, computed_path IS NULL OR path_end_at IS NULL AS rebuild
+        FROM recording_sessions
+        WHERE status = :in_progress AND last_activity_at < :cutoff
+        ORDER BY last_activity_at, id
+        LIMIT :chunk_size
+        FOR UPDATE SKIP LOCKED
+    ),
+    new_points AS (
+        SELECT
+            p.session_id,
+            array_agg(ST_SetSRID(ST_MakePoint(p.longitude, p.latitude), 4326) ORDER BY p."timestamp") AS points,
+            count(*) AS point_count,
+            max(p."timestamp") AS last_timestamp
+        FROM stale
+        JOIN location_points AS p ON p.session_id = stale.id
+        WHERE stale.rebuild OR p."timestamp" > stale.path_end_at
+        GROUP BY p.session_id
+    )
+    UPDATE recording_sessions AS r
+    SET status = :abandoned,
+        ended_at = r.last_activity_at,
+        computed_path = CASE
+            WHEN new_points.points IS NULL THEN r.computed_path
+            WHEN NOT stale.rebuild THEN ST_MakeLine(ARRAY[r.computed_path] || new_points.points)
+            WHEN new_points.point_count >= 2 THEN ST_MakeLine(new_points.points)
+        END,
+        path_end_at = coalesce(new_points.last_timestamp, r.path_end_at)
+    FROM stale
+    LEFT JOIN new_points ON new_points.session_id = stale.id
+    WHERE r.id = stale.id
+    RETURNING r.id
+""").bindparams(
+    bindparam("in_progress", RecordingStatus.IN_PROGRESS, type_=_status_type),
+    bindparam("abandoned", RecordingStatus.ABANDONED, type_=_status_type),
+)
+
+
+@dataclass
+class CleanupProgress:
+    """Outcome of a stale session cleanup run."""
+    session_ids: list[int] = field(default_factory=list)
+    chunks: int = 0
+    # Set when another worker held the cleanup lock
+    locked_out: bool = False
+    # Stale sessions left when the run stopped early
+    remaining: int = 0
+
+
+def count_stale_sessions(db: Session, cutoff: datetime) -> int:
+    """Number of in-progress sessions with no activity since `cutoff`."""
+    return db.execute(
+        select(func.count())
+        .select_from(RecordingSession)
+        .where(RecordingSession.status == RecordingStatus.IN_PROGRESS)
+        .where(RecordingSession.last_activity_at < cutoff)
+    ).scalar()
+
+
+def abandon_stale_sessions(
+    db: Session,
+    cutoff: datetime,
+    chunk_size: int = CLEANUP_CHUNK_SIZE,
+    max_chunks: Optional[int] = None,
+) -> CleanupProgress:
+    """
+    Mark sessions with no activity since `cutoff` as abandoned, chunk by chunk.
+    
+    Each chunk is committed on its own. Stops when no stale sessions are
+    left, after `max_chunks` chunks, or when another worker is running the
+    cleanup.
+    """
+    progress = CleanupProgress()
+    while max_chunks is None or progress.chunks < max_chunks:
+        locked = db.execute(select(func.pg_try_advisory_xact_lock(CLEANUP_LOCK_KEY))).scalar()
+        if not locked:
+            progress.locked_out = True
+            break
+        
+        session_ids = db.execute(
+            _ABANDON_CHUNK, {"cutoff": cutoff, "chunk_size": chunk_size}
+        ).scalars().all()
+        store_path_levels(db, RecordingSession, session_ids)
+        db.commit()
+        if not session_ids:
+            return progress
+        
+        for session_id in session_ids:
+            session_cache.invalidate(session_id)
+        progress.session_ids.extend(session_ids)
+        progress.chunks += 1
+        logger.info(
+            "Stale session cleanup: chunk %d abandoned %d sessions (%d so far)",
+            progress.chunks, len(session_ids), len(progress.session_ids)
+        )
+        if len(session_ids) < chunk_size:
+            return progress
+    
+    # Stopped before running out of stale sessions
+    progress.remaining = count_stale_sessions(db, cutoff)
+    return progress
@@ -0,0 +1,355 @@
+"""
+Consensus route paths built from many recordings.
+
+Every completed recording of a line in a direction is a noisy trace of the
+same route. Its path is resampled at CONSENSUS_STATIONS stations equally
+spaced along it (station i sits at i / (N - 1) of the way), so the traces
+of different trips line up station by station, whatever their GPS rate.
+The consensus path is the median of the traces at each station.
+
+Traces that do not follow the consensus (a detour, a trip recorded in the
+wrong direction, one that started halfway) would pull it off course, so
+only the traces within CONSENSUS_MAX_DEVIATION_METERS of it (mean
+distance over the stations) are kept; the median and the traces kept are
+refined a few times until they agree. The refinement starts from the
+previous consensus when there is one, or from the median of all traces.
+
+The resampled traces are stored (`consensus_tracks`), so a new recording
+only costs resampling its own path; the consensus is then recomputed from
+the stored traces, an (n, N, 2) array, with a few vectorized medians.
+Consensus paths are proposals (`route_consensus`) until an admin applies
+one to a route of the line.
+"""
+import logging
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Sequence
+
+import numpy as np
+from geoalchemy2.shape import to_shape
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from database import run_blocking
+from models.recording import RecordingSession, RecordingStatus
+from models.route import ConsensusTrack, Route, RouteConsensus
+from services.map_matching import local_projection
+from services.paths import linestring_ewkt
+from services.simplification import store_path_levels
+from services.trajectory import shuffle_bytes, unshuffle_bytes
+
+logger = logging.getLogger(__name__)
+
+CONSENSUS_STATIONS = int(os.getenv("CONSENSUS_STATIONS", "500"))
+CONSENSUS_MAX_DEVIATION_METERS = float(os.getenv("CONSENSUS_MAX_DEVIATION_METERS", "50"))
+CONSENSUS_MIN_TRACKS = int(os.getenv("CONSENSUS_MIN_TRACKS", "3"))
+
+# Rounds of refining the consensus and the traces it is the median of
+_ITERATIONS = 5
+
+# Vertices averaged when measuring the distance along a path
+_SMOOTHING_WINDOW = 5
+
+TRACK_MAGIC = b"CTR1"
+_HEADER = struct.Struct("<4sI")
+
+
+@dataclass
+class Consensus:
+    """The consensus of a set of traces."""
+    path: np.ndarray  # (N, 2) longitude/latitude
+    members: np.ndarray  # bool per trace, whether the path is its median
+    deviation: np.ndarray  # Mean distance of each trace from the path, meters
+    
+    @property
+    def spread(self) -> float:
+        """Median deviation of the member traces."""
+        return float(np.median(self.deviation[self.members])) if self.members.any() else 0.0
+
+
+# ============================================================
+# Resampling and consensus
+# ============================================================
+
+def _moving_average(xy: np.ndarray, window: int = _SMOOTHING_WINDOW) -> np.ndarray:
+    """Centered moving average of the vertices of a path, keeping its ends."""
+    if len(xy) <= window:
+        return xy
+    pad = window // 2
+    padded = np.concatenate([np.repeat(xy[:1], pad, axis=0), xy, np.repeat(xy[-1:], pad, axis=0)])
+    sums = np.cumsum(np.concatenate([np.zeros((1, 2)), padded]), axis=0)
+    return (sums[window:] - sums[:-window]) / window
+
+
+def resample_paths(paths: Sequence[np.ndarray], stations: int = CONSENSUS_STATIONS) -> np.ndarray:
+    """
+    Resample paths, given as (n, 2) longitude/latitude arrays, at equally
+    spaced stations. Returns an (len(paths), stations, 2) array.
+    
+    All paths are interpolated with one `np.interp` call per coordinate:
+    they are laid end to end on a common distance axis, one meter apart.
+    Paths need a nonzero length.
+    """
+    if not paths:
+        return np.empty((0, stations, 2))
+    coords = np.concatenate([np.asarray(path, dtype="<f8") for path in paths])
+    meters_per_degree = local_projection(coords[:, 1])
+    xy = coords * meters_per_degree
+    counts = np.array([len(path) for path in paths])
+    ends = np.cumsum(counts) - 1
+    firsts = ends - counts + 1
+    
+    # Distances along the paths are measured on a moving average of the
+    # vertices: GPS jitter would add length unevenly and misalign stations
+    smooth = np.concatenate([_moving_average(part) for part in np.split(xy, firsts[1:])])
+    step = np.hypot(*np.diff(smooth, axis=0).T)
+    # The step from the last vertex of a path to the first of the next
+    step[ends[:-1]] = 1.0
+    along = np.concatenate(([0.0], np.cumsum(step)))
+    
+    start = along[firsts]
+    length = along[ends] - start
+    targets = start[:, None] + length[:, None] * np.linspace(0, 1, stations)
+    resampled = np.stack(
+        [np.interp(targets, along, xy[:, axis]) for axis in (0, 1)], axis=-1
+    )
+    return resampled / meters_per_degree
+
+
+def path_length(path: np.ndarray) -> float:
+    """Length of a longitude/latitude path in meters."""
+    xy = np.asarray(path, dtype="<f8") * local_projection(np.asarray(path)[:, 1])
+    return float(np.hypot(*np.diff(xy, axis=0).T).sum())
+
+
+def build_consensus(
+    tracks: np.ndarray,
+    reference: Optional[np.ndarray] = None,
+    max_deviation: float = CONSENSUS_MAX_DEVIATION_METERS,
+) -> Consensus:
+    """
+    The consensus of resampled traces, an (n, N, 2) longitude/latitude array.
+    
+    `reference` is an (N, 2) path to start the refinement from, usually
+    the previous consensus.
+    """
+    meters_per_degree = local_projection(tracks[..., 1])
+    xy = tracks * meters_per_degree
+    
+    def deviation_from(center: np.ndarray) -> np.ndarray:
+        return np.hypot(*(xy - center).transpose(2, 0, 1)).mean(axis=1)
+    
+    if reference is None:
+        center = np.median(xy, axis=0)
+    else:
+        center = np.asarray(reference, dtype="<f8") * meters_per_degree
+    members = None
+    for _ in range(_ITERATIONS):
+        close = deviation_from(center) <= max_deviation
+        if not close.any() or (members is not None and np.array_equal(close, members)):
+            break
+        members = close
+        center = np.median(xy[members], axis=0)
+    
+    deviation = deviation_from(center)
+    return Consensus(center / meters_per_degree, deviation <= max_deviation, deviation)
+
+
+# ============================================================
+# Storage
+# ============================================================
+
+def pack_stations(stations: np.ndarray) -> bytes:
+    """Pack an (N, 2) longitude/latitude array into `consensus_tracks.data`."""
+    return zlib.compress(b"".join([
+        _HEADER.pack(TRACK_MAGIC, len(stations)),
+        shuffle_bytes(stations[:, 0].astype("<f8")),
+        shuffle_bytes(stations[:, 1].astype("<f8")),
+    ]), level=6)
+
+
+def unpack_stations(data: bytes) -> np.ndarray:
+    """Unpack data written by `pack_stations`."""
+    raw = zlib.decompress(data)
+    magic, count = _HEADER.unpack_from(raw)
+    if magic != TRACK_MAGIC:
+        raise ValueError(f"Not a consensus track (magic {magic!r})")
+    size = count * 8
+    return np.column_stack([
+        unshuffle_bytes(raw[_HEADER.size + i * size:_HEADER.size + (i + 1) * size], "<f8", count)
+        for i in range(2)
+    ])
+
+
+def _group_sessions(line_id: int, direction: str):
+    """Query of the completed sessions of a line and direction with a path."""
+    return (
+        select(RecordingSession.id)
+        .where(RecordingSession.line_id == line_id)
+        .where(RecordingSession.direction == direction)
+        .where(RecordingSession.status == RecordingStatus.COMPLETED)
+        .where(RecordingSession.computed_path.is_not(None))
+    )
+
+
+def _current_track():
+    return (
+        select(ConsensusTrack.id)
+        .where(ConsensusTrack.session_id == RecordingSession.id)
+        .where(ConsensusTrack.station_count == CONSENSUS_STATIONS)
+    )
+
+
+def add_tracks(db: Session, line_id: int, direction: str) -> int:
+    """
+    Resample the paths of the completed sessions of a line and direction
+    that have no track yet. Returns the number of tracks added.
+    
+    A path without length (e.g. every fix at one spot) can't be resampled.
+    Its session gets an empty track of zero length instead, so the session
+    no longer counts as pending, and the track is left out of consensus.
+    """
+    rows = db.execute(
+        select(RecordingSession.id, RecordingSession.computed_path)
+        .where(RecordingSession.id.in_(_group_sessions(line_id, direction)))
+        .where(~_current_track().exists())
+        .order_by(RecordingSession.id)
+    ).all()
+    if not rows:
+        return 0
+    
+    paths = {session_id: np.asarray(to_shape(path).coords) for session_id, path in rows}
+    lengths = {session_id: path_length(path) for session_id, path in paths.items()}
+    session_ids = [session_id for session_id, length in lengths.items() if length > 0]
+    
+    db.execute(delete(ConsensusTrack).where(ConsensusTrack.session_id.in_(list(paths))))
+    resampled = run_blocking(resample_paths, [paths[session_id] for session_id in session_ids])
+    db.add_all([
+        ConsensusTrack(
+            session_id=session_id,
+            station_count=CONSENSUS_STATIONS,
+            length=lengths[session_id],
+            data=pack_stations(stations),
+        )
+        for session_id, stations in zip(session_ids, resampled)
+    ])
+    db.add_all([
+        ConsensusTrack(session_id=session_id, station_count=CONSENSUS_STATIONS, length=0.0, data=b"")
+        for session_id, length in lengths.items() if length <= 0
+    ])
+    db.flush()
+    return len(session_ids)
+
+
+def drop_track(db: Session, session_id: int) -> None:
+    """Remove the track of a session whose path is going to change."""
+    db.execute(delete(ConsensusTrack).where(ConsensusTrack.session_id == session_id))
+
+
+def get_consensus(db: Session, line_id: int, direction: str) -> Optional[RouteConsensus]:
+    """The stored consensus of a line and direction."""
+    return db.execute(
+        select(RouteConsensus)
+        .where(RouteConsensus.line_id == line_id)
+        .where(RouteConsensus.direction == direction)
+    ).scalar_one_or_none()
+
+
+def _fit_consensus(tracks: np.ndarray, reference: Optional[np.ndarray]) -> Consensus:
+    result = build_consensus(tracks, reference)
+    if reference is not None and result.members.sum() < CONSENSUS_MIN_TRACKS:
+        # The recordings moved away from the previous consensus
+        result = build_consensus(tracks)
+    return result
+
+
+def update_consensus(
+    db: Session,
+    line_id: int,
+    direction: str,
+    rebuild: bool = False,
+) -> Optional[RouteConsensus]:
+    """
+    Bring the consensus of a line and direction up to date.
+    
+    Resamples the sessions without a track, then recomputes the consensus
+    from all tracks, starting from the previous consensus unless `rebuild`
+    is set. Returns None while fewer than CONSENSUS_MIN_TRACKS recordings
+    agree on a path.
+    """
+    add_tracks(db, line_id, direction)
+    data = db.execute(
+        select(ConsensusTrack.data)
+        .where(ConsensusTrack.session_id.in_(_group_sessions(line_id, direction)))
+        .where(ConsensusTrack.station_count == CONSENSUS_STATIONS)
+        .where(ConsensusTrack.length > 0)
+        .order_by(ConsensusTrack.session_id)
+    ).scalars().all()
+    consensus = get_consensus(db, line_id, direction)
+    if len(data) < CONSENSUS_MIN_TRACKS:
+        return consensus
+    
+    tracks = np.stack([unpack_stations(d) for d in data])
+    reference = None
+    if consensus is not None and not rebuild:
+        reference = np.asarray(to_shape(consensus.path).coords)
+        if len(reference) != CONSENSUS_STATIONS:
+            reference = None
+    result = run_blocking(_fit_consensus, tracks, reference)
+    if result.members.sum() < CONSENSUS_MIN_TRACKS:
+        return consensus
+    
+    if consensus is None:
+        consensus = RouteConsensus(line_id=line_id, direction=direction)
+        db.add(consensus)
+    consensus.path = func.ST_GeomFromEWKT(linestring_ewkt(result.path.tolist()))
+    consensus.track_count = int(result.members.sum())
+    consensus.outlier_count = int((~result.members).sum())
+    consensus.spread = result.spread
+    consensus.updated_at = datetime.utcnow()
+    db.flush()
+    db.refresh(consensus)
+    return consensus
+
+
+def line_directions(db: Session, line_id: int) -> list[str]:
+    """Directions of the completed recordings of a line."""
+    return db.execute(
+        select(RecordingSession.direction)
+        .where(RecordingSession.line_id == line_id)
+        .where(RecordingSession.status == RecordingStatus.COMPLETED)
+        .where(RecordingSession.direction.is_not(None))
+        .distinct()
+        .order_by(RecordingSession.direction)
+    ).scalars().all()
+
+
+def pending_consensus(db: Session) -> list[tuple[int, str]]:
+    """Lines and directions with completed recordings not in their consensus yet."""
+    return db.execute(
+        select(RecordingSession.line_id, RecordingSession.direction)
+        .where(RecordingSession.status == RecordingStatus.COMPLETED)
+        .where(RecordingSession.direction.is_not(None))
+        .where(RecordingSession.computed_path.is_not(None))
+        .where(~_current_track().exists())
+        .distinct()
+        .order_by(RecordingSession.line_id, RecordingSession.direction)
+    ).all()
+
+
+def apply_consensus(db: Session, consensus: RouteConsensus, route: Optional[Route] = None) -> Route:
+    """
+    Make a consensus path the path of a route of its line, a new one in the
+    consensus's direction unless `route` is given.
+    """
+    if route is None:
+        route = Route(line_id=consensus.line_id, direction=consensus.direction)
+        db.add(route)
+    route.path = consensus.path
+    route.updated_at = datetime.utcnow()
+    db.flush()
+    store_path_levels(db, Route, [route.id])
+    return route
@@ -0,0 +1,100 @@
+"""
+Conditional GET for the catalog endpoints.
+
+The app fetches lines and routes on every launch, and the catalog rarely
+changes in between. Each catalog response therefore carries a strong ETag
+and a Last-Modified date, and a request that sends them back
+(`If-None-Match`/`If-Modified-Since`) gets an empty 304 when nothing
+changed, without the rows being loaded or serialized.
+
+Neither is derived from the body. The endpoint first asks the database for
+the row count and the latest `updated_at` of each table in the scope of
+the query (e.g. the routes of one line, ignoring pagination), which is a
+single aggregate. The ETag is a hash of these with the request's path and
+query string and the API version; the count catches deletions, which leave
+no `updated_at` behind.
+
+If-Modified-Since is only honored for single resources: a collection can
+lose a row without any remaining row getting newer, which only its ETag
+reflects.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import ColumnElement, func, select
+from sqlalchemy.orm import Session
+
+# Clients may keep a response but must check it is current before using it
+CACHE_CONTROL = "no-cache"
+
+# Row count and latest updated_at of a scope
+Version = tuple[int, Optional[datetime]]
+
+
+def scope_version(db: Session, model: Any, *conditions: ColumnElement[bool]) -> Version:
+    """Row count and latest `updated_at` of the model's rows matching the conditions."""
+    count, updated_at = db.execute(
+        select(func.count(), func.max(model.updated_at)).select_from(model).where(*conditions)
+    ).one()
+    return count, updated_at
+
+
+def _etag(request: Request, versions: tuple[Version, ...]) -> str:
+    variant = repr((
+        request.app.version,
+        request.url.path,
+        sorted(request.query_params.multi_items()),
+        [(count, updated_at.isoformat() if updated_at else None) for count, updated_at in versions],
+    ))
+    return '"' + hashlib.sha256(variant.encode()).hexdigest()[:32] + '"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, as for any GET
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _not_modified_since(if_modified_since: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole seconds
+    return last_modified.replace(microsecond=0) <= since
+
+
+def not_modified(
+    request: Request,
+    response: Response,
+    *versions: Version,
+    modified_since: bool = False,
+) -> Optional[Response]:
+    """
+    Set the ETag and Last-Modified of a response from the versions of its
+    scopes, and return a 304 response to send instead if the client's copy
+    is current. `modified_since` honors If-Modified-Since too.
+    """
+    etag = _etag(request, versions)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    updated = [updated_at for _, updated_at in versions if updated_at is not None]
+    last_modified = max(updated).replace(tzinfo=timezone.utc) if updated else None
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    response.headers.update(headers)
+    
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        current = _matches(if_none_match, etag)
+    elif modified_since and if_modified_since is not None and last_modified is not None:
+        current = _not_modified_since(if_modified_since, last_modified)
+    else:
+        current = False
+    return Response(status_code=304, headers=headers) if current else None
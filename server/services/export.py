@@ -0,0 +1,193 @@
+"""
+Streaming export of a session's raw recording data.
+
+Rows are read through a server-side cursor (`yield_per`), a fixed number at
+a time, and each block is encoded as NDJSON or CSV and sent before the next
+one is fetched. Only one block is held in memory, however long the trip is,
+and no ORM objects or pydantic models are built for the rows.
+"""
+import csv
+import heapq
+import io
+import json
+import math
+import os
+from itertools import batched
+from operator import itemgetter
+from typing import Any, Iterable, Iterator, Literal, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
+
+from models.recording import SENSOR_CHANNELS, LocationPoint, SensorReading, TrajectoryChunk
+from services.trajectory import FLOAT_COLUMNS, unpack_points
+
+EXPORT_FETCH_ROWS = int(os.getenv("EXPORT_FETCH_ROWS", "5000"))
+
+ExportFormat = Literal["ndjson", "csv"]
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+LOCATION_EXPORT_COLUMNS = (
+    "id",
+    "timestamp",
+    "latitude",
+    "longitude",
+    "altitude",
+    "speed",
+    "bearing",
+    "horizontal_accuracy",
+    "vertical_accuracy",
+)
+
+SENSOR_EXPORT_COLUMNS = ("id", "timestamp", *SENSOR_CHANNELS)
+
+
+class SessionStreamingResponse(StreamingResponse):
+    """
+    A streaming response whose (sync) content reads from the request's
+    database session while it is sent.
+    
+    The iterator is kept, so that the async routers can step it on their
+    async session instead of in the threadpool (see routes/async_routes.py).
+    """
+    
+    def __init__(self, content: Iterator[bytes], **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self.sync_iterator = content
+
+
+def fetch_blocks(db: Session, query, fetch_rows: int = EXPORT_FETCH_ROWS) -> Iterator[Sequence]:
+    """Run a query on a server-side cursor, yielding its rows `fetch_rows` at a time."""
+    result = db.execute(query.execution_options(yield_per=fetch_rows))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+def _chunk_rows(db: Session, session_id: int, lower, upper) -> Iterator[tuple]:
+    """Location points packed in a session's trajectory chunks, in export column order."""
+    chunk_ids = db.execute(
+        select(TrajectoryChunk.id)
+        .where(TrajectoryChunk.session_id == session_id)
+        .where(TrajectoryChunk.end_time >= lower)
+        .where(TrajectoryChunk.start_time <= upper)
+        .order_by(TrajectoryChunk.start_time, TrajectoryChunk.sequence)
+    ).scalars().all()
+    
+    for chunk_id in chunk_ids:
+        # One chunk is unpacked at a time
+        data = db.execute(
+            select(TrajectoryChunk.data).where(TrajectoryChunk.id == chunk_id)
+        ).scalar_one()
+        points = unpack_points(data)
+        columns = [points["id"].tolist(), points["timestamp"].astype(object).tolist()]
+        columns.extend(points[name].tolist() for name in FLOAT_COLUMNS)
+        by_name = dict(zip(("id", "timestamp", *FLOAT_COLUMNS), columns))
+        for row in zip(*(by_name[name] for name in LOCATION_EXPORT_COLUMNS)):
+            if lower <= row[1] <= upper:
+                yield tuple(None if isinstance(v, float) and math.isnan(v) else v for v in row)
+
+
+def location_blocks(
+    db: Session,
+    session_id: int,
+    lower,
+    upper,
+    fetch_rows: int = EXPORT_FETCH_ROWS,
+) -> Iterator[Sequence]:
+    """
+    Blocks of a session's location points between `lower` and `upper`,
+    ordered by timestamp, including points packed in trajectory chunks.
+    """
+    rows = fetch_blocks(
+        db,
+        select(*(getattr(LocationPoint, c) for c in LOCATION_EXPORT_COLUMNS))
+        .where(LocationPoint.session_id == session_id)
+        .where(LocationPoint.timestamp.between(lower, upper))
+        .order_by(LocationPoint.timestamp),
+        fetch_rows,
+    )
+    has_chunks = db.execute(
+        select(select(TrajectoryChunk.id).where(TrajectoryChunk.session_id == session_id).exists())
+    ).scalar()
+    if not has_chunks:
+        yield from rows
+        return
+    
+    merged = heapq.merge(
+        _chunk_rows(db, session_id, lower, upper),
+        (row for block in rows for row in block),
+        key=itemgetter(1),
+    )
+    yield from batched(merged, fetch_rows)
+
+
+def sensor_blocks(
+    db: Session,
+    session_id: int,
+    lower,
+    upper,
+    fetch_rows: int = EXPORT_FETCH_ROWS,
+) -> Iterator[Sequence]:
+    """Blocks of a session's sensor readings between `lower` and `upper`, ordered by timestamp."""
+    return fetch_blocks(
+        db,
+        select(*(getattr(SensorReading, c) for c in SENSOR_EXPORT_COLUMNS))
+        .where(SensorReading.session_id == session_id)
+        .where(SensorReading.timestamp.between(lower, upper))
+        .order_by(SensorReading.timestamp),
+        fetch_rows,
+    )
+
+
+def _json_value(value: Any) -> Any:
+    """Timestamps as ISO 8601 strings, everything else as is."""
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def encode_blocks(
+    blocks: Iterable[Sequence],
+    columns: Sequence[str],
+    format: ExportFormat,
+) -> Iterator[bytes]:
+    """Encode blocks of rows as NDJSON (one object per line) or CSV with a header row."""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for block in blocks:
+            writer.writerows(
+                tuple(_json_value(v) for v in row) for row in block
+            )
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+        return
+    
+    for block in blocks:
+        yield "".join(
+            json.dumps(dict(zip(columns, map(_json_value, row)))) + "\n"
+            for row in block
+        ).encode()
+
+
+def export_response(
+    blocks: Iterable[Sequence],
+    columns: Sequence[str],
+    format: ExportFormat,
+    filename: str,
+) -> SessionStreamingResponse:
+    """Stream blocks of rows as a downloadable NDJSON or CSV file."""
+    return SessionStreamingResponse(
+        encode_blocks(blocks, columns, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
@@ -0,0 +1,146 @@
+"""
+GeoJSON documents of routes, built in PostgreSQL.
+
+A Feature or FeatureCollection is assembled by one statement
+(`json_build_object`/`json_agg` around `ST_AsGeoJSON`) and comes back as
+text, which the endpoints send as is: nothing is parsed or re-serialized
+in Python, and a line's routes cost one round trip however many there
+are. Coordinates are written with GEOJSON_PRECISION decimal places (6 is
+about 10 cm) unless a request asks for another precision, and paths can be
+swapped for a stored simplified level (services/simplification.py).
+"""
+import os
+from typing import Optional
+
+from fastapi import HTTPException, Query
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from models.line import Line, LineStatus
+
+GEOJSON_PRECISION = int(os.getenv("GEOJSON_PRECISION", "6"))
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+# OpenAPI description of the endpoints' responses
+GEOJSON_RESPONSES = {200: {"content": {GEOJSON_MEDIA_TYPE: {}}}}
+
+PrecisionQuery = Query(
+    default=None,
+    ge=0,
+    le=15,
+    description=f"Decimal places of the coordinates (default {GEOJSON_PRECISION})",
+)
+
+BboxQuery = Query(
+    description="Bounding box as west,south,east,north in degrees",
+    examples=["-74.02,40.70,-73.97,40.75"],
+)
+
+# One Feature per route; `level` is the route's stored simplified path, if any
+_FEATURE = """
+    json_build_object(
+        'type', 'Feature',
+        'id', r.id,
+        'properties', json_build_object(
+            'id', r.id,
+            'line_id', r.line_id,
+            'line_name', l.name,
+            'direction', r.direction,
+            'distinctive', r.distinctive,
+            'color', r.color
+        ),
+        'geometry', ST_AsGeoJSON(coalesce(level.path, r.path), :precision)::json
+    )
+"""
+
+_ROUTES = """
+    FROM routes AS r
+    JOIN lines AS l ON l.id = r.line_id
+    LEFT JOIN route_path_levels AS level
+        ON level.route_id = r.id AND level.tolerance = :tolerance
+"""
+
+
+def _collection(where: str) -> str:
+    return f"""
+        SELECT json_build_object(
+            'type', 'FeatureCollection',
+            'features', coalesce(json_agg({_FEATURE} ORDER BY r.id), '[]'::json)
+        )::text
+        {_ROUTES}
+        WHERE r.path IS NOT NULL AND {where}
+    """
+
+
+_ROUTE_FEATURE = text(f"""
+    SELECT r.path IS NOT NULL, CASE WHEN r.path IS NOT NULL THEN {_FEATURE}::text END
+    {_ROUTES}
+    WHERE r.id = :route_id
+""")
+
+# The subquery keeps the line's row (and so a document) when it has no routes
+_LINE_COLLECTION = text(f"""
+    SELECT ({_collection("r.line_id = :line_id")})
+    FROM lines
+    WHERE id = :line_id
+""")
+
+_BBOX_COLLECTION = text(_collection(
+    "l.status = :approved AND ST_Intersects(r.path, ST_MakeEnvelope(:west, :south, :east, :north, 4326))"
+)).bindparams(bindparam("approved", LineStatus.APPROVED, type_=Line.__table__.c.status.type))
+
+
+def parse_bbox(bbox: str) -> tuple[float, float, float, float]:
+    """Parse a west,south,east,north bounding box, raising 400 if it is invalid."""
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be west,south,east,north")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise HTTPException(status_code=400, detail="bbox is out of range or inverted")
+    return west, south, east, north
+
+
+def _params(precision: Optional[int], tolerance: Optional[float]) -> dict:
+    return {
+        "precision": GEOJSON_PRECISION if precision is None else precision,
+        # No stored level has tolerance 0, so the full path is used
+        "tolerance": tolerance if tolerance is not None else 0.0,
+    }
+
+
+def route_feature(
+    db: Session,
+    route_id: int,
+    precision: Optional[int] = None,
+    tolerance: Optional[float] = None,
+) -> Optional[tuple[bool, Optional[str]]]:
+    """
+    A route as a GeoJSON Feature. Returns None if the route does not
+    exist, else whether it has a path and the Feature (None without one).
+    """
+    row = db.execute(_ROUTE_FEATURE, {"route_id": route_id, **_params(precision, tolerance)}).one_or_none()
+    return tuple(row) if row is not None else None
+
+
+def line_feature_collection(
+    db: Session,
+    line_id: int,
+    precision: Optional[int] = None,
+    tolerance: Optional[float] = None,
+) -> Optional[str]:
+    """The routes of a line as a GeoJSON FeatureCollection, or None if the line does not exist."""
+    return db.execute(_LINE_COLLECTION, {"line_id": line_id, **_params(precision, tolerance)}).scalar()
+
+
+def bbox_feature_collection(
+    db: Session,
+    bbox: tuple[float, float, float, float],
+    precision: Optional[int] = None,
+    tolerance: Optional[float] = None,
+) -> str:
+    """The routes of approved lines crossing a bounding box, as a GeoJSON FeatureCollection."""
+    west, south, east, north = bbox
+    return db.execute(_BBOX_COLLECTION, {
+        "west": west, "south": south, "east": east, "north": north,
+        **_params(precision, tolerance),
+    }).scalar()
@@ -0,0 +1,132 @@
+"""
+Decoding of route and session paths for list responses.
+
+Converted row by row, a page of paths costs a WKB parse per row, a list of
+coordinate tuples per path, and two pydantic validations of every float
+(into the read model, then against the endpoint's response model) before
+the page is finally encoded. For a page of long trips that is millions of
+Python objects built and checked several times.
+
+`decode_paths` instead parses the WKB of a whole page with one
+`shapely.from_wkb` call and copies every coordinate into one numpy buffer
+with `shapely.get_coordinates`; each path is a view of that buffer.
+`page_response` builds the page's read models without their paths, attaches
+the decoded coordinates and encodes the page with pydantic-core, so the
+floats are written by its Rust serializer and never validated.
+
+Endpoints taking `geometry_format` send paths as encoded polylines or
+delta-encoded integers instead (models/geometry.py), from the same buffer.
+"""
+from functools import cache
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import shapely
+from fastapi import Query, Response
+from geoalchemy2 import WKBElement
+from pydantic import TypeAdapter
+from shapely.geometry.base import BaseGeometry
+from sqlmodel import SQLModel
+
+from models.geometry import GEOMETRY_PRECISION, MAX_GEOMETRY_PRECISION, GeometryFormat, encode_path
+
+# Validation context of read models that leaves their geometry out
+SKIP_GEOMETRY = {"decode_geometry": False}
+
+GeometryFormatQuery = Query(
+    default=GeometryFormat.COORDINATES,
+    description="Encoding of paths: [lon, lat] pairs, a Google encoded polyline or delta-encoded integers",
+)
+
+GeometryPrecisionQuery = Query(
+    default=GEOMETRY_PRECISION,
+    ge=0,
+    le=MAX_GEOMETRY_PRECISION,
+    description="Decimal places of polyline and delta-encoded coordinates",
+)
+
+
+def decode_paths(values: Sequence[Any]) -> list[Optional[np.ndarray]]:
+    """
+    Coordinates of a page of paths (WKB elements, shapely geometries or
+    None), decoded at once: an (n, 2) array per path, or None.
+    """
+    geometries = np.array(
+        [value if isinstance(value, BaseGeometry) else None for value in values], dtype=object
+    )
+    encoded = [i for i, value in enumerate(values) if isinstance(value, WKBElement)]
+    if encoded:
+        # Bytes for binary elements, hex strings for textual ones
+        geometries[encoded] = shapely.from_wkb([
+            data if isinstance(data := values[i].data, str) else bytes(data) for i in encoded
+        ])
+    coordinates, index = shapely.get_coordinates(geometries, return_index=True)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(index, minlength=len(values)))])
+    return [
+        coordinates[start:end] if geometry is not None else None
+        for geometry, start, end in zip(geometries, offsets[:-1], offsets[1:])
+    ]
+
+
+@cache
+def _page_adapter(model: type[SQLModel]) -> TypeAdapter:
+    return TypeAdapter(list[model])
+
+
+def _read_models(
+    model: type[SQLModel],
+    objects: Sequence[Any],
+    field: str,
+    geometry_format: GeometryFormat,
+    precision: int,
+) -> list[SQLModel]:
+    paths = decode_paths([getattr(obj, field) for obj in objects])
+    items = []
+    for obj, path in zip(objects, paths):
+        item = model.model_validate(obj, context=SKIP_GEOMETRY)
+        setattr(item, field, encode_path(path, geometry_format, precision) if path is not None else None)
+        items.append(item)
+    return items
+
+
+def read_model(
+    model: type[SQLModel],
+    obj: Any,
+    field: str,
+    geometry_format: GeometryFormat = GeometryFormat.COORDINATES,
+    precision: int = GEOMETRY_PRECISION,
+) -> SQLModel:
+    """The read model of a row, with its `field` path in the given format."""
+    if geometry_format == GeometryFormat.COORDINATES:
+        return model.model_validate(obj)
+    return _read_models(model, [obj], field, geometry_format, precision)[0]
+
+
+def page_json(
+    model: type[SQLModel],
+    objects: Sequence[Any],
+    field: str,
+    geometry_format: GeometryFormat = GeometryFormat.COORDINATES,
+    precision: int = GEOMETRY_PRECISION,
+) -> bytes:
+    """The JSON of a page of rows as read models, their `field` paths decoded at once."""
+    return _page_adapter(model).dump_json(_read_models(model, objects, field, geometry_format, precision))
+
+
+def page_response(
+    model: type[SQLModel],
+    objects: Sequence[Any],
+    field: str,
+    response: Response,
+    geometry_format: GeometryFormat = GeometryFormat.COORDINATES,
+    precision: int = GEOMETRY_PRECISION,
+) -> Response:
+    """
+    A list endpoint's response, bypassing its response model's validation.
+    Carries the headers set on the endpoint's `response` (e.g. its cursor).
+    """
+    return Response(
+        content=page_json(model, objects, field, geometry_format, precision),
+        media_type="application/json",
+        headers=response.headers,
+    )
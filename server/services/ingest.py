@@ -0,0 +1,283 @@
+"""
+Bulk ingest of recording data using PostgreSQL COPY.
+
+Batch uploads are streamed with `COPY ... FROM STDIN` in a single round
+trip, instead of one INSERT per ORM object. Rows are copied into a
+per-connection staging table and then moved into the real table with
+`ON CONFLICT DO NOTHING`, so points that are already stored for the same
+session and timestamp (e.g. from a retried upload) are skipped.
+"""
+import csv
+import io
+from collections import Counter
+from datetime import datetime
+from itertools import repeat
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+
+from models.recording import (
+    SENSOR_CHANNELS,
+    IngestBatch,
+    LocationPointCreate,
+    SensorReadingColumns,
+    SensorReadingCreate,
+)
+
+LOCATION_POINT_COLUMNS = (
+    "session_id",
+    "timestamp",
+    "latitude",
+    "longitude",
+    "altitude",
+    "speed",
+    "bearing",
+    "horizontal_accuracy",
+    "vertical_accuracy",
+    "point",
+)
+
+SENSOR_READING_COLUMNS = ("session_id", "timestamp", *SENSOR_CHANNELS)
+
+
+def copy_rows(
+    db: Session,
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+) -> None:
+    """
+    Stream rows into a table with COPY FROM STDIN (CSV format).
+    
+    Runs on the session's own connection, so the rows are part of the
+    current transaction and are committed (or rolled back) with it.
+    `None` values are written as empty unquoted fields, which COPY reads as NULL.
+    
+    Works with both psycopg2 and asyncpg (a sync session from
+    `AsyncSession.run_sync`, where the copy is awaited in place).
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    
+    connection = db.connection()
+    if connection.dialect.driver == "asyncpg":
+        driver_connection = connection.connection.driver_connection
+        await_only(driver_connection.copy_to_table(
+            table,
+            source=io.BytesIO(buffer.getvalue().encode()),
+            columns=list(columns),
+            format="csv",
+        ))
+        return
+    
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    dbapi_connection = connection.connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+
+def insert_skipping_duplicates(
+    db: Session,
+    table: str,
+    columns: Sequence[str],
+    tagged_rows: Iterable[tuple[int, Sequence[Any]]],
+) -> Counter:
+    """
+    COPY rows into `table`, skipping any whose (session_id, timestamp) already exists.
+    
+    Each row comes tagged with a caller-chosen integer (e.g. the index of the
+    batch it belongs to), and the result counts the newly inserted rows per tag,
+    so one COPY can serve several batches and still report on each of them.
+    """
+    staging = f"_staging_{table}"
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    
+    # Temp tables live as long as the pooled connection; rows go away at commit
+    db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DELETE ROWS AS "
+        f"SELECT 0::bigint AS batch_tag, {column_list} FROM {table} WITH NO DATA"
+    ))
+    copy_rows(
+        db, staging, ("batch_tag", *columns),
+        ((tag, *row) for tag, row in tagged_rows)
+    )
+    
+    # The lowest tag wins when the same point appears in several batches
+    counts = db.execute(text(f"""
+        WITH inserted AS (
+            INSERT INTO {table} ({column_list})
+            SELECT {column_list} FROM {staging} ORDER BY batch_tag
+            ON CONFLICT (session_id, "timestamp") DO NOTHING
+            RETURNING session_id, "timestamp"
+        ),
+        tagged AS (
+            SELECT DISTINCT ON (session_id, "timestamp") batch_tag, session_id, "timestamp"
+            FROM {staging}
+            ORDER BY session_id, "timestamp", batch_tag
+        )
+        SELECT tagged.batch_tag, count(*)
+        FROM inserted JOIN tagged USING (session_id, "timestamp")
+        GROUP BY tagged.batch_tag
+    """)).all()
+    db.execute(text(f"TRUNCATE {staging}"))
+    return Counter({tag: count for tag, count in counts})
+
+
+def location_point_rows(
+    session_id: int,
+    points: Sequence[LocationPointCreate],
+) -> Iterator[tuple]:
+    """
+    Build location_points rows for COPY.
+    
+    The PostGIS point is written as EWKT in the same row, so the geometry
+    is built by the server's geometry input function during the copy.
+    """
+    for p in points:
+        yield (
+            session_id,
+            p.timestamp.isoformat(),
+            p.latitude,
+            p.longitude,
+            p.altitude,
+            p.speed,
+            p.bearing,
+            p.horizontal_accuracy,
+            p.vertical_accuracy,
+            f"SRID=4326;POINT({p.longitude} {p.latitude})",
+        )
+
+
+def sensor_reading_rows(
+    session_id: int,
+    readings: Sequence[SensorReadingCreate],
+) -> Iterator[tuple]:
+    """Build sensor_readings rows for COPY from a list of readings."""
+    for r in readings:
+        yield (
+            session_id,
+            r.timestamp.isoformat(),
+            *(getattr(r, channel) for channel in SENSOR_CHANNELS),
+        )
+
+
+def sensor_column_rows(
+    session_id: int,
+    columns: SensorReadingColumns,
+) -> Iterator[tuple]:
+    """
+    Build sensor_readings rows for COPY from a columnar batch.
+    
+    The channel arrays are zipped straight into rows, without building
+    a model object per reading. Omitted channels are written as NULL.
+    """
+    channels = [
+        getattr(columns, channel) or repeat(None)
+        for channel in SENSOR_CHANNELS
+    ]
+    return zip(
+        repeat(session_id),
+        (t.isoformat() for t in columns.timestamp),
+        *channels,
+    )
+
+
+def copy_location_points(
+    db: Session,
+    session_id: int,
+    points: Sequence[LocationPointCreate],
+) -> int:
+    """Insert a batch of location points with a single COPY. Returns the number of new rows."""
+    rows = location_point_rows(session_id, points)
+    counts = insert_skipping_duplicates(
+        db, "location_points", LOCATION_POINT_COLUMNS, zip(repeat(0), rows)
+    )
+    return counts[0]
+
+
+def copy_sensor_readings(
+    db: Session,
+    session_id: int,
+    readings: Sequence[SensorReadingCreate],
+) -> int:
+    """Insert a batch of sensor readings with a single COPY. Returns the number of new rows."""
+    rows = sensor_reading_rows(session_id, readings)
+    counts = insert_skipping_duplicates(
+        db, "sensor_readings", SENSOR_READING_COLUMNS, zip(repeat(0), rows)
+    )
+    return counts[0]
+
+
+def copy_sensor_columns(
+    db: Session,
+    session_id: int,
+    columns: SensorReadingColumns,
+) -> int:
+    """Insert a columnar sensor batch with a single COPY. Returns the number of new rows."""
+    rows = sensor_column_rows(session_id, columns)
+    counts = insert_skipping_duplicates(
+        db, "sensor_readings", SENSOR_READING_COLUMNS, zip(repeat(0), rows)
+    )
+    return counts[0]
+
+
+# ============================================================
+# Client batch IDs
+# ============================================================
+
+def find_ingest_batch(
+    db: Session,
+    session_id: int,
+    kind: str,
+    batch_id: str,
+) -> Optional[IngestBatch]:
+    """Look up a previously written batch by its client-generated ID."""
+    return db.execute(
+        select(IngestBatch)
+        .where(IngestBatch.session_id == session_id)
+        .where(IngestBatch.kind == kind)
+        .where(IngestBatch.batch_id == batch_id)
+    ).scalar_one_or_none()
+
+
+def record_ingest_batch(
+    db: Session,
+    session_id: int,
+    kind: str,
+    batch_id: str,
+    total: int,
+    added: int,
+    first_timestamp: datetime,
+    last_timestamp: datetime,
+) -> IngestBatch:
+    """Remember the result of a written batch so retries can be answered from it."""
+    record = IngestBatch(
+        session_id=session_id,
+        kind=kind,
+        batch_id=batch_id,
+        added=added,
+        duplicates=total - added,
+        first_timestamp=first_timestamp,
+        last_timestamp=last_timestamp,
+    )
+    db.add(record)
+    return record
+
+
+def ingest_batch_result(record: IngestBatch, replayed: bool = False) -> dict:
+    """Batch endpoint response for a recorded batch."""
+    return {
+        "added": record.added,
+        "duplicates": record.duplicates,
+        "session_id": record.session_id,
+        "batch_id": record.batch_id,
+        "first_timestamp": record.first_timestamp.isoformat(),
+        "last_timestamp": record.last_timestamp.isoformat(),
+        "replayed": replayed,
+    }
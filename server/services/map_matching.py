@@ -0,0 +1,505 @@
+"""
+Map matching of recording sessions onto the routes of their line.
+
+Each GPS fix of a session is snapped onto one of the routes of the
+session's line with a hidden Markov model (Newson & Krumm, 2009):
+
+- Candidates: for every fix, the closest points of each route, one per
+  stretch of the route that passes near the fix (local minima of the
+  distance along the route), keeping the MATCH_CANDIDATES nearest within
+  MATCH_MAX_OFFSET_METERS.
+- Emission: Gaussian in the distance from the fix to the candidate, with
+  the fix's horizontal accuracy (at least MATCH_GPS_SIGMA_METERS).
+- Transition: exponential in the difference between the distance travelled
+  along the route and the straight-line distance between the fixes. Moving
+  backwards along a route is not allowed, and switching routes costs
+  MATCH_SWITCH_PENALTY.
+
+The most likely sequence is found with Viterbi. Candidates, emissions and
+transitions are computed for all fixes at once with NumPy; only the
+max-plus recursion steps through the fixes, on K x K arrays. Fixes far
+from every route break the chain and are left unmatched.
+
+Coordinates are projected to meters with an equirectangular projection
+around the session's mean latitude, which is accurate to well under a
+meter at city scale.
+
+Results (route, distance along it and signed offset per fix) are packed
+into `session_matches`. To match historical sessions in bulk, run::
+
+    python -m services.map_matching --ended-after 2026-10-01 --workers 8
+"""
+import argparse
+import logging
+import os
+import struct
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+from geoalchemy2.shape import to_shape
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from database import run_blocking
+from models.recording import (
+    MatchedPointRead,
+    RecordingSession,
+    RecordingStatus,
+    SessionMatch,
+    SessionMatchRead,
+)
+from models.route import Route
+from services.partitions import session_time_bounds
+from services.trajectory import session_points, shuffle_bytes, unshuffle_bytes
+
+logger = logging.getLogger(__name__)
+
+MATCH_GPS_SIGMA_METERS = float(os.getenv("MATCH_GPS_SIGMA_METERS", "10"))
+MATCH_MAX_OFFSET_METERS = float(os.getenv("MATCH_MAX_OFFSET_METERS", "75"))
+MATCH_BETA_METERS = float(os.getenv("MATCH_BETA_METERS", "15"))
+MATCH_SWITCH_PENALTY = float(os.getenv("MATCH_SWITCH_PENALTY", "10"))
+MATCH_CANDIDATES = int(os.getenv("MATCH_CANDIDATES", "6"))
+MATCH_BATCH_SIZE = int(os.getenv("MATCH_BATCH_SIZE", "200"))
+
+# Consecutive fixes whose candidates are searched together, among the
+# route segments near them
+_BLOCK_FIXES = 128
+
+EARTH_RADIUS_METERS = 6371008.8
+
+MATCH_MAGIC = b"MTC1"
+_HEADER = struct.Struct("<4sI")
+_EPOCH = np.datetime64(0, "us")
+
+
+@dataclass
+class MatchParams:
+    """Tuning of the matcher, see the module docstring."""
+    gps_sigma: float = MATCH_GPS_SIGMA_METERS
+    max_offset: float = MATCH_MAX_OFFSET_METERS
+    beta: float = MATCH_BETA_METERS
+    switch_penalty: float = MATCH_SWITCH_PENALTY
+    candidates: int = MATCH_CANDIDATES
+
+
+@dataclass
+class MatchResult:
+    """Per fix result of matching a trajectory."""
+    route_id: np.ndarray  # int64, -1 for unmatched fixes
+    distance_along: np.ndarray  # float64 meters, NaN for unmatched fixes
+    offset: np.ndarray  # float64 meters (left of the route is positive), NaN for unmatched fixes
+
+
+@dataclass
+class _Segments:
+    """The segments of all candidate routes, in projected meters."""
+    route_id: np.ndarray
+    start: np.ndarray  # (S, 2)
+    vector: np.ndarray  # (S, 2)
+    length2: np.ndarray
+    along: np.ndarray  # Distance along the route at the segment's start
+    first: np.ndarray  # First segment of its route
+    last: np.ndarray  # Last segment of its route
+
+
+def local_projection(latitude: np.ndarray) -> np.ndarray:
+    """Meters per degree of longitude and latitude around the mean latitude."""
+    scale = np.pi / 180 * EARTH_RADIUS_METERS
+    return np.array([scale * np.cos(np.radians(np.mean(latitude))), scale])
+
+
+def _segments(routes: Sequence[tuple[int, np.ndarray]], meters_per_degree: np.ndarray) -> _Segments:
+    """Segments of the routes, given as (route id, (n, 2) longitude/latitude) pairs."""
+    parts = []
+    for route_id, coords in routes:
+        if len(coords) < 2:
+            continue
+        xy = np.asarray(coords, dtype="<f8") * meters_per_degree
+        vector = np.diff(xy, axis=0)
+        length = np.hypot(vector[:, 0], vector[:, 1])
+        count = len(vector)
+        parts.append((
+            np.full(count, route_id, dtype=np.int64),
+            xy[:-1],
+            vector,
+            length ** 2,
+            np.concatenate(([0.0], np.cumsum(length)[:-1])),
+            np.arange(count) == 0,
+            np.arange(count) == count - 1,
+        ))
+    if not parts:
+        empty = np.empty(0)
+        return _Segments(
+            np.empty(0, dtype=np.int64), np.empty((0, 2)), np.empty((0, 2)),
+            empty, empty, empty.astype(bool), empty.astype(bool),
+        )
+    return _Segments(*(np.concatenate(arrays) for arrays in zip(*parts)))
+
+
+def _candidates(xy: np.ndarray, segments: _Segments, params: MatchParams):
+    """
+    The candidate matches of every fix: route id, distance along the route,
+    signed offset, distance and projected position, each (T, K). Missing
+    candidates have route id -1 and an infinite distance.
+    """
+    count, k = len(xy), params.candidates
+    route_id = np.full((count, k), -1, dtype=np.int64)
+    along = np.full((count, k), np.nan)
+    offset = np.full((count, k), np.nan)
+    distance = np.full((count, k), np.inf)
+    position = np.full((count, k, 2), np.nan)
+    total = len(segments.route_id)
+    if total == 0:
+        return route_id, along, offset, distance, position
+    
+    low = np.minimum(segments.start, segments.start + segments.vector)
+    high = np.maximum(segments.start, segments.start + segments.vector)
+    for lo in range(0, count, _BLOCK_FIXES):
+        p = xy[lo:lo + _BLOCK_FIXES]
+        # Only the segments near this stretch of the trajectory, in route order
+        near = np.flatnonzero(
+            np.all(low <= p.max(axis=0) + params.max_offset, axis=1)
+            & np.all(high >= p.min(axis=0) - params.max_offset, axis=1)
+        )
+        if len(near) == 0:
+            continue
+        start = segments.start[near]
+        vector = segments.vector[near]
+        length2 = segments.length2[near]
+        # A segment whose neighbour was left out starts or ends a stretch
+        gap = np.diff(near) != 1
+        first = segments.first[near] | np.concatenate(([True], gap))
+        last = segments.last[near] | np.concatenate((gap, [True]))
+        
+        rel = p[:, None, :] - start[None, :, :]
+        t = np.clip((rel * vector).sum(axis=2) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+        projected = start + t[:, :, None] * vector
+        d = np.hypot(*(p[:, None, :] - projected).transpose(2, 0, 1))
+        
+        # One candidate per stretch of a route passing by: local minima along the route
+        before = np.concatenate([np.full((len(p), 1), np.inf), d[:, :-1]], axis=1)
+        before[:, first] = np.inf
+        after = np.concatenate([d[:, 1:], np.full((len(p), 1), np.inf)], axis=1)
+        after[:, last] = np.inf
+        d = np.where((d <= before) & (d < after) & (d <= params.max_offset), d, np.inf)
+        
+        kk = min(k, len(near))
+        nearest = np.argpartition(d, kk - 1, axis=1)[:, :kk]
+        rows = np.arange(len(p))[:, None]
+        nearest = nearest[rows, np.argsort(d[rows, nearest], axis=1)]
+        chosen = d[rows, nearest]
+        valid = np.isfinite(chosen)
+        
+        side = np.sign(vector[nearest, 0] * rel[rows, nearest, 1] - vector[nearest, 1] * rel[rows, nearest, 0])
+        rows_out = slice(lo, lo + len(p))
+        route_id[rows_out, :kk] = np.where(valid, segments.route_id[near][nearest], -1)
+        distance[rows_out, :kk] = chosen
+        along[rows_out, :kk] = np.where(
+            valid,
+            segments.along[near][nearest] + t[rows, nearest] * np.sqrt(length2[nearest]),
+            np.nan,
+        )
+        offset[rows_out, :kk] = np.where(valid, np.where(side < 0, -chosen, chosen), np.nan)
+        position[rows_out, :kk] = np.where(valid[:, :, None], projected[rows, nearest], np.nan)
+    return route_id, along, offset, distance, position
+
+
+def _viterbi(emission: np.ndarray, transition: np.ndarray) -> np.ndarray:
+    """
+    Most likely state per step given log emission (T, K) and log transition
+    (T - 1, K, K) probabilities; -1 where no state is possible. The chain
+    restarts after a step where every state is impossible.
+    """
+    count, k = emission.shape
+    scores = np.empty((count, k))
+    back = np.full((count, k), -1, dtype=np.int64)
+    columns = np.arange(k)
+    scores[0] = emission[0]
+    for t in range(1, count):
+        total = scores[t - 1][:, None] + transition[t - 1]
+        best = total.argmax(axis=0)
+        current = total[best, columns] + emission[t]
+        if np.isfinite(current).any():
+            scores[t] = current
+            back[t] = np.where(np.isfinite(current), best, -1)
+        else:
+            scores[t] = emission[t]
+    
+    states = np.full(count, -1, dtype=np.int64)
+    t = count - 1
+    while t >= 0:
+        if not np.isfinite(scores[t]).any():
+            t -= 1
+            continue
+        state = int(scores[t].argmax())
+        while t >= 0:
+            states[t] = state
+            state = int(back[t, state])
+            t -= 1
+            if state < 0:
+                break
+    return states
+
+
+def match_points(
+    longitude: np.ndarray,
+    latitude: np.ndarray,
+    accuracy: Optional[np.ndarray],
+    routes: Sequence[tuple[int, np.ndarray]],
+    params: Optional[MatchParams] = None,
+) -> MatchResult:
+    """
+    Match a trajectory (fixes in time order) onto routes given as
+    (route id, (n, 2) longitude/latitude array) pairs.
+    """
+    params = params or MatchParams()
+    count = len(longitude)
+    if count == 0:
+        return MatchResult(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+    
+    meters_per_degree = local_projection(latitude)
+    xy = np.column_stack((longitude, latitude)) * meters_per_degree
+    route_id, along, offset, distance, position = _candidates(xy, _segments(routes, meters_per_degree), params)
+    valid = route_id >= 0
+    
+    sigma = np.full(count, params.gps_sigma)
+    if accuracy is not None:
+        sigma = np.fmax(sigma, accuracy)
+    with np.errstate(invalid="ignore"):
+        emission = np.where(valid, -0.5 * (distance / sigma[:, None]) ** 2, -np.inf)
+        
+        # Straight-line distance between consecutive fixes
+        step = np.hypot(*np.diff(xy, axis=0).T)[:, None, None]
+        moved = along[1:, None, :] - along[:-1, :, None]
+        same_route = route_id[:-1, :, None] == route_id[1:, None, :]
+        jump = np.hypot(*(position[1:, None, :, :] - position[:-1, :, None, :]).transpose(3, 0, 1, 2))
+        cost = np.where(
+            same_route,
+            np.abs(moved - step) / params.beta,
+            params.switch_penalty + np.abs(jump - step) / params.beta,
+        )
+        # Backwards along the same route, beyond GPS noise
+        cost = np.where(same_route & (moved < -2 * params.gps_sigma), np.inf, cost)
+        transition = np.where(valid[:-1, :, None] & valid[1:, None, :], -cost, -np.inf)
+    
+    states = _viterbi(emission, transition)
+    matched = states >= 0
+    rows = np.arange(count)
+    pick = np.where(matched, states, 0)
+    return MatchResult(
+        route_id=np.where(matched, route_id[rows, pick], -1),
+        distance_along=np.where(matched, along[rows, pick], np.nan),
+        offset=np.where(matched, offset[rows, pick], np.nan),
+    )
+
+
+# ============================================================
+# Storage
+# ============================================================
+
+def pack_match(timestamps: np.ndarray, result: MatchResult) -> bytes:
+    """Pack per fix results into the compressed `session_matches.data` format."""
+    micros = (timestamps.astype("datetime64[us]") - _EPOCH).astype("<i8")
+    return zlib.compress(b"".join([
+        _HEADER.pack(MATCH_MAGIC, len(micros)),
+        shuffle_bytes(np.diff(micros, prepend=np.int64(0))),
+        shuffle_bytes(result.route_id.astype("<i8")),
+        shuffle_bytes(result.distance_along.astype("<f8")),
+        shuffle_bytes(result.offset.astype("<f8")),
+    ]), level=6)
+
+
+def unpack_match(data: bytes) -> tuple[np.ndarray, MatchResult]:
+    """Unpack data written by `pack_match` into timestamps and results."""
+    raw = zlib.decompress(data)
+    magic, count = _HEADER.unpack_from(raw)
+    if magic != MATCH_MAGIC:
+        raise ValueError(f"Not a map matching result (magic {magic!r})")
+    size = count * 8
+    columns = [
+        unshuffle_bytes(raw[_HEADER.size + i * size:_HEADER.size + (i + 1) * size], dtype, count)
+        for i, dtype in enumerate(("<i8", "<i8", "<f8", "<f8"))
+    ]
+    timestamps = _EPOCH + np.cumsum(columns[0]).astype("timedelta64[us]")
+    return timestamps, MatchResult(*columns[1:])
+
+
+def line_routes(db: Session, line_id: int) -> list[tuple[int, np.ndarray]]:
+    """The routes of a line with a path, as (route id, longitude/latitude array) pairs."""
+    rows = db.execute(
+        select(Route.id, Route.path)
+        .where(Route.line_id == line_id)
+        .where(Route.path.is_not(None))
+        .order_by(Route.id)
+    ).all()
+    return [(route_id, np.asarray(to_shape(path).coords)) for route_id, path in rows]
+
+
+@dataclass
+class _MatchInput:
+    """What matching a session needs, loaded from the database."""
+    session_id: int
+    timestamps: np.ndarray
+    longitude: np.ndarray
+    latitude: np.ndarray
+    accuracy: np.ndarray
+    routes: list[tuple[int, np.ndarray]]
+
+
+def _load_input(db: Session, session: RecordingSession, routes: list[tuple[int, np.ndarray]]) -> _MatchInput:
+    points = session_points(db, session.id, *session_time_bounds(session.started_at, session.ended_at))
+    return _MatchInput(
+        session.id, points["timestamp"], points["longitude"], points["latitude"],
+        points["horizontal_accuracy"], routes,
+    )
+
+
+def _run(match_input: _MatchInput) -> MatchResult:
+    return match_points(match_input.longitude, match_input.latitude, match_input.accuracy, match_input.routes)
+
+
+def _store(db: Session, match_input: _MatchInput, result: MatchResult) -> SessionMatch:
+    matched = result.route_id[result.route_id >= 0]
+    common = Counter(matched.tolist()).most_common(1)
+    db.execute(delete(SessionMatch).where(SessionMatch.session_id == match_input.session_id))
+    match = SessionMatch(
+        session_id=match_input.session_id,
+        route_id=common[0][0] if common else None,
+        point_count=len(result.route_id),
+        matched_count=len(matched),
+        data=pack_match(match_input.timestamps, result),
+    )
+    db.add(match)
+    db.flush()
+    return match
+
+
+def match_session(db: Session, session: RecordingSession) -> SessionMatch:
+    """Match a session onto the routes of its line and store the result."""
+    match_input = _load_input(db, session, line_routes(db, session.line_id))
+    return _store(db, match_input, run_blocking(_run, match_input))
+
+
+def _inputs(db: Session, session_ids: Sequence[int]) -> Iterator[_MatchInput]:
+    """Load the sessions one at a time, reading each line's routes only once."""
+    routes: dict[int, list[tuple[int, np.ndarray]]] = {}
+    for session_id in session_ids:
+        session = db.get(RecordingSession, session_id)
+        if session is None:
+            continue
+        if session.line_id not in routes:
+            routes[session.line_id] = line_routes(db, session.line_id)
+        yield _load_input(db, session, routes[session.line_id])
+
+
+def match_sessions(db: Session, session_ids: Sequence[int], workers: int = 1) -> dict[int, int]:
+    """
+    Match sessions and store the results. Returns matched points per session.
+    
+    With several workers, the matching itself runs in a process pool while
+    this process loads the sessions and stores the results.
+    """
+    matched = {}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            inputs = list(_inputs(db, session_ids))
+            results = run_blocking(lambda: list(pool.map(_run, inputs, chunksize=4)))
+            for match_input, result in zip(inputs, results):
+                matched[match_input.session_id] = _store(db, match_input, result).matched_count
+    else:
+        for match_input in _inputs(db, session_ids):
+            matched[match_input.session_id] = _store(db, match_input, run_blocking(_run, match_input)).matched_count
+    return matched
+
+
+def unmatched_sessions(
+    db: Session,
+    ended_after: Optional[datetime] = None,
+    limit: Optional[int] = MATCH_BATCH_SIZE,
+) -> list[int]:
+    """
+    Completed sessions that have not been matched yet, or were matched
+    before a route of their line last changed.
+    """
+    routes_changed = (
+        select(func.max(Route.updated_at))
+        .where(Route.line_id == RecordingSession.line_id)
+        .scalar_subquery()
+    )
+    current = (
+        select(SessionMatch.id)
+        .where(SessionMatch.session_id == RecordingSession.id)
+        .where(SessionMatch.matched_at >= func.coalesce(routes_changed, SessionMatch.matched_at))
+    )
+    query = (
+        select(RecordingSession.id)
+        .where(RecordingSession.status == RecordingStatus.COMPLETED)
+        .where(~current.exists())
+        .order_by(RecordingSession.ended_at, RecordingSession.id)
+        .limit(limit)
+    )
+    if ended_after is not None:
+        query = query.where(RecordingSession.ended_at >= ended_after)
+    return db.execute(query).scalars().all()
+
+
+def match_read(match: SessionMatch) -> SessionMatchRead:
+    """Turn a stored match into the API schema."""
+    timestamps, result = unpack_match(match.data)
+    matched = result.route_id >= 0
+    return SessionMatchRead(
+        session_id=match.session_id,
+        route_id=match.route_id,
+        matched_at=match.matched_at,
+        point_count=match.point_count,
+        matched_count=match.matched_count,
+        points=[
+            MatchedPointRead(
+                timestamp=timestamp,
+                route_id=route_id if ok else None,
+                distance_along=along if ok else None,
+                offset=offset if ok else None,
+            )
+            for timestamp, ok, route_id, along, offset in zip(
+                timestamps.astype(datetime).tolist(),
+                matched.tolist(),
+                result.route_id.tolist(),
+                result.distance_along.tolist(),
+                result.offset.tolist(),
+            )
+        ],
+    )
+
+
+def main() -> None:
+    """Match the completed sessions that need it, in bulk."""
+    from database import SessionLocal
+    
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--ended-after", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=MATCH_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    
+    total = 0
+    with SessionLocal() as db:
+        while session_ids := unmatched_sessions(db, args.ended_after, limit=args.batch_size):
+            matched = match_sessions(db, session_ids, workers=args.workers)
+            db.commit()
+            total += len(matched)
+            logger.info(
+                "Matched %d sessions, %d points (%d sessions so far)",
+                len(matched), sum(matched.values()), total
+            )
+            if len(session_ids) < args.batch_size:
+                break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Keyset (cursor) pagination for the list endpoints.
+
+With `OFFSET`, Postgres reads and throws away every row before the page,
+so deep pages get slower and slower. A cursor instead encodes the sort key
+of the last row of a page, and the next page starts with a range condition
+on that key (`WHERE (started_at, id) < (...)`), which is one index range
+scan however deep the page is.
+
+List endpoints return the cursor for the next page in the X-Next-Cursor
+response header when the page is full, and accept it back as `?cursor=`.
+`skip` keeps working for older clients.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Optional, Sequence
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import ColumnElement, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+CursorQuery = Query(
+    default=None,
+    description=f"Cursor from the {NEXT_CURSOR_HEADER} header of the previous page",
+)
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode the sort key of a row as an opaque cursor."""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> tuple:
+    """Decode a cursor made by `encode_cursor` into values of the given types."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(payload, list) or len(payload) != len(types):
+            raise ValueError("Wrong number of values")
+        return tuple(
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for kind, value in zip(types, payload)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_cursor(
+    keys: Sequence[ColumnElement],
+    values: tuple,
+    descending: bool = False,
+) -> ColumnElement[bool]:
+    """Condition selecting the rows that sort after the cursor's key."""
+    key = keys[0] if len(keys) == 1 else tuple_(*keys)
+    value = values[0] if len(values) == 1 else tuple_(*values)
+    return key < value if descending else key > value
+
+
+def set_next_cursor(
+    response: Response,
+    items: Sequence[Any],
+    limit: Optional[int],
+    key: Callable[[Any], tuple],
+) -> None:
+    """Send the cursor of the page after `items`, unless this page was the last one."""
+    if items and limit is not None and len(items) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(items[-1]))
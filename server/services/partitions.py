@@ -0,0 +1,202 @@
+"""
+Monthly partition maintenance for the recording data tables.
+
+`location_points` and `sensor_readings` are range partitioned by month of
+`timestamp` (see migration 004). Each table has one partition per month,
+named like `location_points_2026_10`, and a DEFAULT partition that catches
+rows outside of them (e.g. from devices with a wrong clock).
+
+Partitions should be created ahead of time, so that inserts never land in
+the default partition, and old months can be detached (kept as plain
+tables, e.g. for archiving) or dropped outright.
+"""
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+PARTITIONED_TABLES = ("location_points", "sensor_readings")
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+# Recording data is read back within the session's time range widened by this
+# margin, which lets Postgres skip the partitions of other months. Uploads
+# outside half of it are refused, so the reads never miss a stored row.
+PARTITION_PRUNE_MARGIN = timedelta(hours=float(os.getenv("PARTITION_PRUNE_MARGIN_HOURS", "24")))
+
+_BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+@dataclass
+class Partition:
+    """A monthly partition and its bounds (`start` inclusive, `end` exclusive)."""
+    table: str
+    name: str
+    start: datetime
+    end: datetime
+
+
+def month_start(moment: datetime) -> datetime:
+    """First instant of the month containing `moment`."""
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    """Shift a month start by a number of months."""
+    month = moment.month - 1 + months
+    return moment.replace(year=moment.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_{start:%Y_%m}"
+
+
+def list_partitions(db: Session | Connection, table: str) -> list[Partition]:
+    """Monthly partitions attached to a table, oldest first (the default partition is left out)."""
+    rows = db.execute(
+        text("""
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = :table
+        """),
+        {"table": table}
+    ).all()
+    
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_PATTERN.search(bound)
+        if match:
+            partitions.append(Partition(
+                table=table,
+                name=name,
+                start=datetime.fromisoformat(match.group(1)),
+                end=datetime.fromisoformat(match.group(2)),
+            ))
+    return sorted(partitions, key=lambda p: p.start)
+
+
+def create_partition(db: Session | Connection, table: str, start: datetime) -> Optional[str]:
+    """
+    Create the partition for the month starting at `start`, unless it exists.
+    
+    Rows for that month already sitting in the default partition are moved
+    into the new partition. Returns the name of the created partition.
+    """
+    name = partition_name(table, start)
+    exists = db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+    if exists is not None:
+        return None
+    
+    bounds = {"start": start, "end": add_months(start, 1)}
+    default = f"{table}_default"
+    stray_rows = db.execute(
+        text(f'SELECT EXISTS (SELECT 1 FROM {default} WHERE "timestamp" >= :start AND "timestamp" < :end)'),
+        bounds
+    ).scalar()
+    
+    if stray_rows:
+        # A new partition can't overlap rows in the default one: move them over
+        db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+        db.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{bounds['end'].isoformat()}')"
+        ))
+        db.execute(
+            text(
+                f'WITH moved AS (DELETE FROM {default} WHERE "timestamp" >= :start AND "timestamp" < :end RETURNING *) '
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ),
+            bounds
+        )
+        db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+    else:
+        db.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{bounds['end'].isoformat()}')"
+        ))
+    return name
+
+
+def ensure_partitions(
+    db: Session | Connection,
+    months_ahead: int = PARTITION_MONTHS_AHEAD,
+    now: Optional[datetime] = None,
+) -> list[str]:
+    """
+    Create the default partitions and the monthly partitions from the current
+    month through `months_ahead` months ahead. Returns the created partitions.
+    """
+    current = month_start(now or datetime.utcnow())
+    created = []
+    for table in PARTITIONED_TABLES:
+        db.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+        for offset in range(months_ahead + 1):
+            name = create_partition(db, table, add_months(current, offset))
+            if name is not None:
+                created.append(name)
+    return created
+
+
+def detach_partitions(
+    db: Session | Connection,
+    before: datetime,
+    drop: bool = False,
+) -> list[str]:
+    """
+    Detach the monthly partitions that end on or before `before`.
+    
+    Detached partitions are kept as standalone tables unless `drop` is set.
+    Returns the names of the affected partitions.
+    """
+    affected = []
+    for table in PARTITIONED_TABLES:
+        for partition in list_partitions(db, table):
+            if partition.end > before:
+                continue
+            db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition.name}"))
+            if drop:
+                db.execute(text(f"DROP TABLE {partition.name}"))
+            affected.append(partition.name)
+    return affected
+
+
+def session_time_bounds(
+    started_at: datetime,
+    ended_at: Optional[datetime],
+) -> tuple[datetime, datetime]:
+    """
+    Time range to read a session's recorded data from.
+    
+    Filtering on it in addition to `session_id` lets the planner prune the
+    partitions of unrelated months.
+    """
+    end = ended_at or datetime.utcnow()
+    return started_at - PARTITION_PRUNE_MARGIN, end + PARTITION_PRUNE_MARGIN
+
+
+def outside_session_window(started_at: datetime, timestamps: Sequence[datetime]) -> Optional[datetime]:
+    """
+    A timestamp of an upload to an in-progress session that reads bounded
+    by `session_time_bounds` could miss, or None.
+    
+    The accepted window is the session's time range so far widened by half
+    the margin. The other half covers a session whose `ended_at` is set a
+    little before its last upload (e.g. abandoned at its last recorded
+    activity).
+    """
+    if not timestamps:
+        return None
+    margin = PARTITION_PRUNE_MARGIN / 2
+    earliest, latest = min(timestamps), max(timestamps)
+    if earliest < started_at - margin:
+        return earliest
+    if latest > datetime.utcnow() + margin:
+        return latest
+    return None
@@ -0,0 +1,111 @@
+"""
+Incremental maintenance of recording session paths.
+
+`recording_sessions.computed_path` is extended as location points arrive,
+instead of being built from every point of the trip when it ends.
+`path_end_at` holds the timestamp of the path's last vertex: a batch whose
+points all come after it only appends those points to the path, in the
+database. A batch reaching back before it (out-of-order upload) rebuilds
+the path from the session's points, also in the database.
+
+The path is readable while the trip is in progress, and ending a session
+only appends whatever arrived since the last batch.
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.orm import Session
+
+from models.recording import RecordingSession
+from services.partitions import session_time_bounds
+from services.trajectory import has_chunks, session_points
+
+_APPEND_PATH = text("""
+    UPDATE recording_sessions AS s
+    SET computed_path = ST_MakeLine(ARRAY[s.computed_path] || new.points),
+        path_end_at = new.last_timestamp
+    FROM (
+        SELECT
+            array_agg(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326) ORDER BY "timestamp") AS points,
+            max("timestamp") AS last_timestamp
+        FROM location_points
+        WHERE session_id = :session_id AND "timestamp" > :after
+    ) AS new
+    WHERE s.id = :session_id AND new.last_timestamp IS NOT NULL
+""")
+
+# A path needs two points; until then it stays NULL
+_REBUILD_PATH = text("""
+    UPDATE recording_sessions AS s
+    SET computed_path = CASE WHEN all_points.count >= 2 THEN ST_MakeLine(all_points.points) END,
+        path_end_at = all_points.last_timestamp
+    FROM (
+        SELECT
+            array_agg(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326) ORDER BY "timestamp") AS points,
+            count(*) AS count,
+            max("timestamp") AS last_timestamp
+        FROM location_points
+        WHERE session_id = :session_id AND "timestamp" BETWEEN :lower AND :upper
+    ) AS all_points
+    WHERE s.id = :session_id
+""")
+
+
+def linestring_ewkt(coords: list[tuple[float, float]]) -> str:
+    """EWKT of a WGS84 LineString through (longitude, latitude) pairs."""
+    return f"SRID=4326;LINESTRING({', '.join(f'{lon} {lat}' for lon, lat in coords)})"
+
+
+def rebuild_session_path(db: Session, session_id: int, started_at: datetime) -> None:
+    """Recompute a session's path from all of its location points."""
+    lower, upper = session_time_bounds(started_at, None)
+    if not has_chunks(db, session_id):
+        db.execute(_REBUILD_PATH, {"session_id": session_id, "lower": lower, "upper": upper})
+        return
+    
+    # Points packed in trajectory chunks can only be read back here
+    points = session_points(db, session_id, lower, upper)
+    coords = list(zip(points["longitude"].tolist(), points["latitude"].tolist()))
+    db.execute(
+        update(RecordingSession)
+        .where(RecordingSession.id == session_id)
+        .values(
+            computed_path=func.ST_GeomFromEWKT(linestring_ewkt(coords)) if len(coords) >= 2 else None,
+            path_end_at=points["timestamp"][-1].astype(datetime) if coords else None,
+        )
+    )
+
+
+def update_session_path(
+    db: Session,
+    session_id: int,
+    first_timestamp: Optional[datetime] = None,
+) -> None:
+    """
+    Bring a session's path up to date after location points were added.
+    
+    `first_timestamp` is the earliest timestamp of the new points. If it is
+    not after the end of the current path, the path is rebuilt; otherwise
+    (or when it is not given) the points after the end of the path are
+    appended. Locks the session row until the transaction ends, so
+    concurrent batches for a session extend its path one after the other.
+    """
+    state = db.execute(
+        select(
+            RecordingSession.started_at,
+            RecordingSession.path_end_at,
+            RecordingSession.computed_path.is_not(None),
+        )
+        .where(RecordingSession.id == session_id)
+        .with_for_update()
+    ).one_or_none()
+    if state is None:
+        return
+    
+    started_at, path_end_at, has_path = state
+    in_order = first_timestamp is None or (path_end_at is not None and first_timestamp > path_end_at)
+    if has_path and path_end_at is not None and in_order:
+        db.execute(_APPEND_PATH, {"session_id": session_id, "after": path_end_at})
+    else:
+        rebuild_session_path(db, session_id, started_at)
@@ -0,0 +1,313 @@
+"""
+Optional in-process spatial index of the route catalog.
+
+With ROUTE_INDEX_ENABLED, every worker loads all routes with a path at
+startup into a shapely STRtree, together with their API responses already
+serialized (the RouteRead JSON and the GeoJSON Feature). Nearby searches
+and bounding box collections are then answered from memory, without a
+database round trip or any WKB parsing; requests for simplified paths or
+another coordinate precision still go to the database.
+
+Distances are computed in meters on an equirectangular projection around
+the catalog's mean latitude, which is accurate to a fraction of a percent
+over a city.
+
+Writes keep the index current incrementally: the endpoints that change
+routes or lines reload just the affected routes, and publish the change
+with Postgres NOTIFY on ROUTE_INDEX_CHANNEL so that the other workers,
+which LISTEN on a dedicated connection, reload them too. A worker that
+loses its listening connection reloads the whole catalog once it is back.
+Changed routes are kept beside the tree until ROUTE_INDEX_REBUILD_AFTER of
+them have piled up, then the tree is rebuilt.
+"""
+import json
+import logging
+import os
+import select
+import socket
+import threading
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import numpy as np
+import shapely
+from geoalchemy2.shape import to_shape
+from shapely.geometry import Point, box
+from shapely.geometry.base import BaseGeometry
+from sqlalchemy import Engine, func
+from sqlalchemy import select as sql_select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, engine, run_blocking
+from models.line import Line, LineStatus
+from models.route import Route, RouteRead
+from services.geojson import GEOJSON_PRECISION
+from services.map_matching import local_projection
+
+logger = logging.getLogger(__name__)
+
+ROUTE_INDEX_ENABLED = os.getenv("ROUTE_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+ROUTE_INDEX_CHANNEL = "route_index"
+ROUTE_INDEX_REBUILD_AFTER = int(os.getenv("ROUTE_INDEX_REBUILD_AFTER", "64"))
+ROUTE_INDEX_RETRY_SECONDS = 5.0
+
+# Identifies this worker's own notifications
+_ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class _Entry:
+    """An indexed route."""
+    route_id: int
+    line_id: int
+    approved: bool
+    geometry: BaseGeometry  # Projected to meters
+    route_json: bytes  # RouteRead
+    feature_json: bytes  # GeoJSON Feature, coordinates at GEOJSON_PRECISION
+
+
+def _feature_json(route: Route, line_name: str, shape: BaseGeometry) -> bytes:
+    """The GeoJSON Feature of a route, as services/geojson.py builds it."""
+    return json.dumps({
+        "type": "Feature",
+        "id": route.id,
+        "properties": {
+            "id": route.id,
+            "line_id": route.line_id,
+            "line_name": line_name,
+            "direction": route.direction,
+            "distinctive": route.distinctive,
+            "color": route.color,
+        },
+        "geometry": {
+            "type": "LineString",
+            "coordinates": np.round(np.asarray(shape.coords), GEOJSON_PRECISION).tolist(),
+        },
+    }, separators=(",", ":")).encode()
+
+
+class RouteIndex:
+    """STRtree of the routes with their serialized responses. Thread-safe."""
+    
+    def __init__(self, bind: Engine = engine, rebuild_after: int = ROUTE_INDEX_REBUILD_AFTER):
+        self.bind = bind
+        self.rebuild_after = rebuild_after
+        self.ready = False
+        self._lock = threading.Lock()
+        self._scale = np.array([1.0, 1.0])
+        self._entries: dict[int, _Entry] = {}
+        self._tree: Optional[shapely.STRtree] = None
+        self._tree_entries: list[_Entry] = []
+        # Routes in the tree that changed since it was built, and their new versions
+        self._stale: set[int] = set()
+        self._pending: dict[int, _Entry] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    # ------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------
+    
+    def _load_entries(self, db: Session, route_ids: Optional[Iterable[int]] = None, line_id: Optional[int] = None):
+        query = (
+            sql_select(Route, Line.name, Line.status)
+            .join(Line, Line.id == Route.line_id)
+            .where(Route.path.is_not(None))
+        )
+        if route_ids is not None:
+            query = query.where(Route.id.in_(list(route_ids)))
+        if line_id is not None:
+            query = query.where(Route.line_id == line_id)
+        return [(route, name, status, to_shape(route.path)) for route, name, status in db.execute(query).all()]
+    
+    def _entry(self, route: Route, line_name: str, status: LineStatus, shape: BaseGeometry) -> _Entry:
+        return _Entry(
+            route_id=route.id,
+            line_id=route.line_id,
+            approved=status == LineStatus.APPROVED,
+            geometry=shapely.transform(shape, lambda coords: coords * self._scale),
+            route_json=RouteRead.model_validate(route).model_dump_json().encode(),
+            feature_json=_feature_json(route, line_name, shape),
+        )
+    
+    def _rebuild(self) -> None:
+        self._tree_entries = list(self._entries.values())
+        self._tree = shapely.STRtree([entry.geometry for entry in self._tree_entries])
+        self._stale.clear()
+        self._pending.clear()
+    
+    def load(self, db: Session) -> None:
+        """(Re)load the whole catalog."""
+        rows = self._load_entries(db)
+        latitudes = np.concatenate([np.asarray(shape.coords)[:, 1] for *_, shape in rows]) if rows else [0.0]
+        with self._lock:
+            self._scale = local_projection(latitudes)
+            self._entries = {route.id: self._entry(route, name, status, shape) for route, name, status, shape in rows}
+            self._rebuild()
+            self.ready = True
+        logger.info("Route index loaded: %d routes", len(rows))
+    
+    def refresh(self, db: Session, route_ids: Optional[Iterable[int]] = None, line_id: Optional[int] = None) -> None:
+        """Reload some routes, or all routes of a line, dropping those that are gone."""
+        if not self.ready:
+            return
+        route_ids = list(route_ids) if route_ids is not None else None
+        rows = self._load_entries(db, route_ids, line_id)
+        with self._lock:
+            if route_ids is not None:
+                expected = set(route_ids)
+            else:
+                expected = {entry.route_id for entry in self._entries.values() if entry.line_id == line_id}
+            for route_id in expected:
+                self._entries.pop(route_id, None)
+                self._pending.pop(route_id, None)
+                self._stale.add(route_id)
+            for route, name, status, shape in rows:
+                self._entries[route.id] = self._pending[route.id] = self._entry(route, name, status, shape)
+            if len(self._stale) + len(self._pending) > self.rebuild_after:
+                self._rebuild()
+    
+    # ------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------
+    
+    def _candidates(self, geometry: BaseGeometry, predicate: str, **kwargs) -> list[_Entry]:
+        found = [
+            self._tree_entries[i]
+            for i in self._tree.query(geometry, predicate=predicate, **kwargs)
+            if self._tree_entries[i].route_id not in self._stale
+        ]
+        pending = list(self._pending.values())
+        if pending:
+            matches = getattr(shapely, predicate)([entry.geometry for entry in pending], geometry, **kwargs)
+            found.extend(entry for entry, match in zip(pending, matches) if match)
+        return found
+    
+    def nearby(self, longitude: float, latitude: float, radius_meters: float, limit: int) -> bytes:
+        """The JSON response of /routes/nearby/: routes within the radius, nearest first."""
+        with self._lock:
+            point = Point(longitude * self._scale[0], latitude * self._scale[1])
+            entries = self._candidates(point, "dwithin", distance=radius_meters)
+            if not entries:
+                return b"[]"
+            geometries = [entry.geometry for entry in entries]
+            distances = shapely.distance(geometries, point)
+            order = np.argsort(distances, kind="stable")[:limit]
+            closest = shapely.get_coordinates(
+                shapely.shortest_line([geometries[i] for i in order], point)
+            )[::2] / self._scale
+            items = [
+                b'{"distance_meters":%s,"closest_point":%s,%s' % (
+                    json.dumps(float(distances[i])).encode(),
+                    json.dumps(point_coords.tolist()).encode(),
+                    entries[i].route_json[1:],
+                )
+                for i, point_coords in zip(order, closest)
+            ]
+        return b"[" + b",".join(items) + b"]"
+    
+    def bbox(self, west: float, south: float, east: float, north: float) -> bytes:
+        """The GeoJSON FeatureCollection of the approved routes crossing a bounding box."""
+        with self._lock:
+            area = box(west * self._scale[0], south * self._scale[1], east * self._scale[0], north * self._scale[1])
+            entries = sorted(
+                (entry for entry in self._candidates(area, "intersects") if entry.approved),
+                key=lambda entry: entry.route_id,
+            )
+            features = b",".join(entry.feature_json for entry in entries)
+        return b'{"type":"FeatureCollection","features":[' + features + b"]}"
+    
+    def stats(self) -> dict:
+        """Size of the index, for monitoring."""
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "routes": len(self._entries),
+                "pending": len(self._pending),
+                "stale": len(self._stale),
+            }
+    
+    # ------------------------------------------------------------
+    # Change notifications
+    # ------------------------------------------------------------
+    
+    def routes_changed(self, db: Session, route_ids: Iterable[int] = (), line_id: Optional[int] = None) -> None:
+        """
+        Reload routes, or the routes of a line, after a committed write, and
+        tell the other workers to do the same.
+        """
+        if not self.ready:
+            return
+        route_ids = list(route_ids)
+        if route_ids:
+            self.refresh(db, route_ids=route_ids)
+        if line_id is not None:
+            self.refresh(db, line_id=line_id)
+        payload = json.dumps({"origin": _ORIGIN, "routes": route_ids, "line": line_id})
+        run_blocking(self._notify, payload)
+    
+    def _notify(self, payload: str) -> None:
+        # The write is committed already, so the notification goes on its own
+        with self.bind.begin() as connection:
+            connection.execute(sql_select(func.pg_notify(ROUTE_INDEX_CHANNEL, payload)))
+    
+    def _apply(self, payload: str) -> None:
+        change = json.loads(payload)
+        if change.get("origin") == _ORIGIN:
+            return
+        with SessionLocal() as db:
+            if change.get("routes"):
+                self.refresh(db, route_ids=change["routes"])
+            if change.get("line") is not None:
+                self.refresh(db, line_id=change["line"])
+    
+    def _listen(self) -> None:
+        reconnecting = False
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = self.bind.raw_connection()
+                connection.detach()
+                dbapi_connection = connection.dbapi_connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {ROUTE_INDEX_CHANNEL}")
+                if reconnecting:
+                    # Notifications sent while disconnected are lost
+                    with SessionLocal() as db:
+                        self.load(db)
+                while not self._stop.is_set():
+                    if not select.select([dbapi_connection], [], [], 1.0)[0]:
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        self._apply(dbapi_connection.notifies.pop(0).payload)
+            except Exception:
+                logger.exception("Route index listener failed, reconnecting in %.0fs", ROUTE_INDEX_RETRY_SECONDS)
+                reconnecting = True
+                self._stop.wait(ROUTE_INDEX_RETRY_SECONDS)
+            finally:
+                if connection is not None:
+                    connection.close()
+    
+    # ------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------
+    
+    def start(self) -> None:
+        """Load the catalog and start listening for changes made by other workers."""
+        with SessionLocal() as db:
+            self.load(db)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name="route-index-listener", daemon=True)
+        self._thread.start()
+    
+    def stop(self) -> None:
+        """Stop listening."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+route_index = RouteIndex()
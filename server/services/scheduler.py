@@ -0,0 +1,357 @@
+"""
+In-process scheduler for the periodic maintenance jobs.
+
+Every API worker starts the scheduler from the app lifespan, and runs each
+job on its own asyncio task: a random delay at startup, then the job, then
+the job's interval plus a random jitter, so that workers started together
+don't all wake up at the same moment.
+
+Jobs that work on the shared database (stale session cleanup, partition
+upkeep, map matching, consensus paths) are exclusive: a worker runs one only while it holds
+the job's Postgres advisory lock, and skips it if another worker holds the
+lock or has run the job within the last half interval. Their runs are
+recorded in `maintenance_runs`. Jobs that refresh per-worker state (the session cache,
+replica health) run in every worker and are only kept in memory.
+
+Jobs run in a thread. An exclusive job runs under a `statement_timeout` of
+its timeout, and when it overruns, its current query is cancelled and the
+run is recorded as a timeout.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import zlib
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from sqlalchemy import Connection, Engine, func, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from database import engine, replica_set
+from models.maintenance import MaintenanceRun, MaintenanceRunStatus
+from services.cleanup import abandon_stale_sessions
+from services.consensus import pending_consensus, update_consensus
+from services.map_matching import match_sessions, unmatched_sessions
+from services.partitions import ensure_partitions
+from services.session_cache import session_cache
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+SCHEDULER_JITTER_SECONDS = float(os.getenv("SCHEDULER_JITTER_SECONDS", "30"))
+SCHEDULER_HISTORY_SIZE = int(os.getenv("SCHEDULER_HISTORY_SIZE", "100"))
+STALE_SESSION_MINUTES = int(os.getenv("STALE_SESSION_MINUTES", "30"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Status of a run that did not start (in memory only)
+SKIPPED = "skipped"
+
+
+@dataclass
+class Job:
+    """A periodic maintenance job."""
+    name: str
+    # Exclusive jobs get a database session; the others take no arguments.
+    # Either may return a JSON-serializable summary of what it did.
+    run: Callable[..., Optional[dict]]
+    interval_seconds: float
+    timeout_seconds: float
+    # Run in one worker at a time, with the run recorded in the database
+    exclusive: bool = True
+
+
+@dataclass
+class JobRun:
+    """A run of a job in this worker."""
+    job: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    status: str = MaintenanceRunStatus.RUNNING.value
+    detail: Optional[dict] = None
+    run_id: Optional[int] = None  # maintenance_runs row of an exclusive job
+
+
+@dataclass
+class _RunState:
+    """What the waiting coroutine needs to cancel a run in its thread."""
+    deadline: float
+    connection: Optional[Connection] = None
+    timed_out: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    
+    @property
+    def overran(self) -> bool:
+        """Whether the run was cancelled, or got past its deadline (`statement_timeout`)."""
+        return self.timed_out or time.monotonic() >= self.deadline
+    
+    def cancel(self) -> None:
+        """Mark the run as timed out and cancel its current query, if any."""
+        with self.lock:
+            self.timed_out = True
+            if self.connection is not None:
+                self.connection.connection.dbapi_connection.cancel()
+
+
+def job_lock_key(name: str) -> int:
+    """Advisory lock key of an exclusive job."""
+    return zlib.crc32(f"maintenance:{name}".encode())
+
+
+class Scheduler:
+    """Runs maintenance jobs periodically on the event loop of this worker."""
+    
+    def __init__(
+        self,
+        jobs: list[Job],
+        bind: Engine = engine,
+        jitter_seconds: float = SCHEDULER_JITTER_SECONDS,
+        history_size: int = SCHEDULER_HISTORY_SIZE,
+    ):
+        self.jobs = {job.name: job for job in jobs}
+        self.bind = bind
+        self.jitter_seconds = jitter_seconds
+        self.history: deque[JobRun] = deque(maxlen=history_size)
+        self.running: set[str] = set()
+        self._tasks: list[asyncio.Task] = []
+    
+    def start(self) -> None:
+        """Start a task per job on the running event loop."""
+        self._tasks = [
+            asyncio.create_task(self._loop(job), name=f"maintenance:{job.name}")
+            for job in self.jobs.values()
+        ]
+        logger.info("Maintenance scheduler started in worker %s: %s", WORKER_ID, ", ".join(self.jobs))
+    
+    async def stop(self) -> None:
+        """Cancel the job tasks. A job already running in a thread finishes on its own."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    async def _loop(self, job: Job) -> None:
+        await asyncio.sleep(random.uniform(0, self.jitter_seconds))
+        while True:
+            await self.run_job(job.name)
+            await asyncio.sleep(job.interval_seconds + random.uniform(0, self.jitter_seconds))
+    
+    async def run_job(self, name: str) -> JobRun:
+        """Run a job now, in a thread, and wait for it to finish or time out."""
+        job = self.jobs[name]
+        run = JobRun(job=name, started_at=datetime.utcnow())
+        if name in self.running:
+            return self._finish(run, SKIPPED, {"reason": "already running in this worker"})
+        
+        self.running.add(name)
+        state = _RunState(deadline=time.monotonic() + job.timeout_seconds)
+        future = asyncio.ensure_future(asyncio.to_thread(self._execute, job, run, state))
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), job.timeout_seconds)
+            except TimeoutError:
+                logger.warning("Maintenance job %s exceeded its %ss timeout", name, job.timeout_seconds)
+                state.cancel()
+                await future
+        except Exception as e:
+            # Failures around the job itself, e.g. the database being unreachable
+            logger.exception("Maintenance job %s could not run", name)
+            if run.finished_at is None:
+                self._finish(run, MaintenanceRunStatus.ERROR.value, {"error": str(e)})
+        finally:
+            if future.done():
+                self.running.discard(name)
+            else:
+                # Cancelled while waiting (shutdown): still running in its thread
+                future.add_done_callback(lambda _: self.running.discard(name))
+        return run
+    
+    def _finish(self, run: JobRun, status: str, detail: Optional[dict]) -> JobRun:
+        run.finished_at = datetime.utcnow()
+        run.status = status
+        run.detail = detail
+        self.history.append(run)
+        if status != SKIPPED:
+            logger.info("Maintenance job %s: %s %s", run.job, status, detail)
+        return run
+    
+    def _execute(self, job: Job, run: JobRun, state: _RunState) -> None:
+        """Run a job in the current (worker) thread."""
+        if not job.exclusive:
+            try:
+                detail = job.run()
+            except Exception as e:
+                logger.exception("Maintenance job %s failed", job.name)
+                self._finish(run, MaintenanceRunStatus.ERROR.value, {"error": str(e)})
+                return
+            status = MaintenanceRunStatus.TIMEOUT if state.overran else MaintenanceRunStatus.OK
+            self._finish(run, status.value, detail)
+            return
+        
+        with self.bind.connect() as conn:
+            with state.lock:
+                state.connection = conn
+            try:
+                self._execute_exclusive(job, run, state, conn)
+            finally:
+                with state.lock:
+                    state.connection = None
+    
+    def _execute_exclusive(self, job: Job, run: JobRun, state: _RunState, conn: Connection) -> None:
+        key = job_lock_key(job.name)
+        if not conn.execute(select(func.pg_try_advisory_lock(key))).scalar():
+            conn.rollback()
+            self._finish(run, SKIPPED, {"reason": "running in another worker"})
+            return
+        
+        try:
+            last_run = conn.execute(
+                select(func.max(MaintenanceRun.started_at))
+                .where(MaintenanceRun.job == job.name)
+                .where(MaintenanceRun.status == MaintenanceRunStatus.OK)
+            ).scalar()
+            if last_run is not None and run.started_at - last_run < timedelta(seconds=job.interval_seconds / 2):
+                conn.rollback()
+                self._finish(run, SKIPPED, {"reason": "ran recently", "last_run": last_run.isoformat()})
+                return
+            
+            run.run_id = conn.execute(
+                insert(MaintenanceRun)
+                .values(job=job.name, worker=WORKER_ID, started_at=run.started_at,
+                        status=MaintenanceRunStatus.RUNNING)
+                .returning(MaintenanceRun.id)
+            ).scalar_one()
+            # Session level, so that it outlives the job's own commits
+            conn.execute(
+                text("SELECT set_config('statement_timeout', :timeout, false)"),
+                {"timeout": f"{int(job.timeout_seconds * 1000)}ms"},
+            )
+            conn.commit()
+            
+            # The session starts its own transactions on the connection
+            with Session(bind=conn) as db:
+                try:
+                    detail = job.run(db)
+                    db.commit()
+                    status = MaintenanceRunStatus.TIMEOUT if state.overran else MaintenanceRunStatus.OK
+                except Exception as e:
+                    db.rollback()
+                    if state.overran:
+                        status = MaintenanceRunStatus.TIMEOUT
+                    else:
+                        status = MaintenanceRunStatus.ERROR
+                        logger.exception("Maintenance job %s failed", job.name)
+                    detail = {"error": str(e)}
+            
+            self._finish(run, status.value, detail)
+            conn.execute(
+                update(MaintenanceRun)
+                .where(MaintenanceRun.id == run.run_id)
+                .values(finished_at=run.finished_at, status=status,
+                        detail=json.dumps(detail, default=str) if detail is not None else None)
+            )
+            conn.commit()
+        finally:
+            conn.rollback()
+            conn.execute(text("RESET statement_timeout"))
+            conn.execute(select(func.pg_advisory_unlock(key)))
+            conn.commit()
+    
+    def describe(self) -> list[dict[str, Any]]:
+        """The jobs, with their last run in this worker."""
+        last_runs = {run.job: run for run in self.history}
+        return [
+            {
+                "name": job.name,
+                "interval_seconds": job.interval_seconds,
+                "timeout_seconds": job.timeout_seconds,
+                "exclusive": job.exclusive,
+                "running": job.name in self.running,
+                "last_run": run_summary(last_runs[job.name]) if job.name in last_runs else None,
+            }
+            for job in self.jobs.values()
+        ]
+
+
+def run_summary(run: JobRun) -> dict[str, Any]:
+    """JSON-friendly view of a job run."""
+    summary = asdict(run)
+    summary["started_at"] = run.started_at.isoformat()
+    summary["finished_at"] = run.finished_at.isoformat() if run.finished_at else None
+    return summary
+
+
+# ============================================================
+# Jobs
+# ============================================================
+
+def cleanup_stale_sessions_job(db: Session) -> dict:
+    """Abandon the sessions with no activity for STALE_SESSION_MINUTES."""
+    cutoff = datetime.utcnow() - timedelta(minutes=STALE_SESSION_MINUTES)
+    progress = abandon_stale_sessions(db, cutoff)
+    return {
+        "abandoned_count": len(progress.session_ids),
+        "chunks": progress.chunks,
+        "locked_out": progress.locked_out,
+    }
+
+
+def consensus_job(db: Session) -> dict:
+    """Update the consensus paths of the lines and directions with new recordings."""
+    pending = pending_consensus(db)
+    for line_id, direction in pending:
+        update_consensus(db, line_id, direction)
+    return {"updated": [f"{line_id}/{direction}" for line_id, direction in pending]}
+
+
+def ensure_partitions_job(db: Session) -> dict:
+    """Create the upcoming monthly partitions."""
+    return {"created": ensure_partitions(db)}
+
+
+def match_sessions_job(db: Session) -> dict:
+    """Map match the completed sessions without a current result."""
+    matched = match_sessions(db, unmatched_sessions(db))
+    return {"matched_sessions": len(matched), "matched_points": sum(matched.values())}
+
+
+def prune_session_cache_job() -> dict:
+    """Drop expired session cache entries."""
+    return {"pruned": session_cache.prune(), "size": len(session_cache)}
+
+
+def refresh_replicas_job() -> dict:
+    """Health check the read replicas."""
+    replica_set.refresh()
+    return {
+        replica.engine.url.render_as_string(hide_password=True): replica.lag_seconds
+        for replica in replica_set.replicas
+    }
+
+
+def default_jobs() -> list[Job]:
+    """The maintenance jobs run by every worker."""
+    jobs = [
+        Job("stale_cleanup", cleanup_stale_sessions_job, interval_seconds=15 * 60, timeout_seconds=5 * 60),
+        Job("partitions", ensure_partitions_job, interval_seconds=24 * 3600, timeout_seconds=60),
+        Job("map_matching", match_sessions_job, interval_seconds=3600, timeout_seconds=10 * 60),
+        Job("consensus", consensus_job, interval_seconds=15 * 60, timeout_seconds=5 * 60),
+        Job("session_cache_prune", prune_session_cache_job, interval_seconds=60, timeout_seconds=10,
+            exclusive=False),
+    ]
+    if replica_set.replicas:
+        jobs.append(Job(
+            "replica_health", refresh_replicas_job,
+            interval_seconds=replica_set.check_interval_seconds, timeout_seconds=10, exclusive=False,
+        ))
+    return jobs
+
+
+scheduler = Scheduler(default_jobs())
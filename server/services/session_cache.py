@@ -0,0 +1,140 @@
+"""
+In-process cache of recording session state for the ingest endpoints.
+
+Every upload has to check that its session exists and is in progress (and
+its timestamps against the session's start), and batch uploads bump
+`last_activity_at` on the session row. The cache keeps
+the state of in-progress sessions for a short TTL, so uploads skip the
+SELECT, and writes `last_activity_at` at most once per
+SESSION_ACTIVITY_WRITE_INTERVAL_SECONDS per session.
+
+Entries are invalidated by the endpoints that change a session's status.
+With several worker processes, a status change made by another worker is
+only picked up once the entry expires, so the TTL bounds how long a worker
+can keep accepting uploads for a session that was just ended.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from models.recording import RecordingStatus
+
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "10.0"))
+SESSION_ACTIVITY_WRITE_INTERVAL_SECONDS = float(
+    os.getenv("SESSION_ACTIVITY_WRITE_INTERVAL_SECONDS", "15.0")
+)
+
+
+@dataclass
+class CachedSession:
+    """Cached state of a recording session."""
+    status: RecordingStatus
+    loaded_at: float
+    activity_written_at: Optional[float] = None
+    started_at: Optional[datetime] = None
+
+
+class SessionStateCache:
+    """Bounded LRU cache of session state with TTL expiry. Thread-safe."""
+    
+    def __init__(
+        self,
+        max_size: int = SESSION_CACHE_SIZE,
+        ttl_seconds: float = SESSION_CACHE_TTL_SECONDS,
+        activity_interval_seconds: float = SESSION_ACTIVITY_WRITE_INTERVAL_SECONDS,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.activity_interval_seconds = activity_interval_seconds
+        self._entries: OrderedDict[int, CachedSession] = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, session_id: int) -> Optional[CachedSession]:
+        """Cached state of a session, or None if it is not cached or has expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or now - entry.loaded_at > self.ttl_seconds:
+                # Expired entries stay until reloaded, to keep their activity write time
+                return None
+            self._entries.move_to_end(session_id)
+            return entry
+    
+    def put(
+        self,
+        session_id: int,
+        status: RecordingStatus,
+        started_at: Optional[datetime] = None,
+    ) -> CachedSession:
+        """Cache the state of a session just loaded from the database."""
+        entry = CachedSession(status=status, loaded_at=time.monotonic(), started_at=started_at)
+        with self._lock:
+            previous = self._entries.pop(session_id, None)
+            if previous is not None:
+                # Keep the activity write time across reloads
+                entry.activity_written_at = previous.activity_written_at
+            self._entries[session_id] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+    
+    def invalidate(self, session_id: int) -> None:
+        """Drop a session whose status changed."""
+        with self._lock:
+            self._entries.pop(session_id, None)
+    
+    def prune(self) -> int:
+        """
+        Drop expired entries whose activity write time no longer matters.
+        
+        Returns the number of entries dropped.
+        """
+        now = time.monotonic()
+        with self._lock:
+            stale = [
+                session_id for session_id, entry in self._entries.items()
+                if now - entry.loaded_at > self.ttl_seconds
+                and (
+                    entry.activity_written_at is None
+                    or now - entry.activity_written_at >= self.activity_interval_seconds
+                )
+            ]
+            for session_id in stale:
+                del self._entries[session_id]
+        return len(stale)
+    
+    def clear(self) -> None:
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+    
+    def activity_due(self, session_id: int) -> bool:
+        """
+        Whether `last_activity_at` should be written for an upload now.
+        
+        Returns True at most once per activity interval for a cached session
+        (and always for one that is not cached), and records the write.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return True
+            if (
+                entry.activity_written_at is not None
+                and now - entry.activity_written_at < self.activity_interval_seconds
+            ):
+                return False
+            entry.activity_written_at = now
+            return True
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+session_cache = SessionStateCache()
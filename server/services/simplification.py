@@ -0,0 +1,136 @@
+"""
+Precomputed levels of detail for route and session paths.
+
+A map showing a route list at city zoom renders a few hundred vertices per
+path, while a 1 Hz recording of a long trip has thousands. Paths are
+therefore also stored simplified (Douglas-Peucker, `ST_Simplify`) at each
+tolerance of PATH_LOD_TOLERANCES: a route's whenever its path is written,
+a session's when it ends. The read endpoints take a `tolerance` (or a map
+`zoom`, converted to the size of a pixel at that zoom) and return the
+stored level with the largest tolerance that does not exceed it.
+
+Tolerances are in Web Mercator (EPSG:3857) meters, the unit of web map
+tiles, so a zoom level maps to a tolerance exactly. A path without stored
+levels (e.g. of a session still in progress) is simplified on the fly.
+"""
+import os
+from typing import Any, Optional, Sequence
+
+from fastapi import Query, Response
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models.recording import RecordingSession, SessionPathLevel
+from models.route import Route, RoutePathLevel
+
+PATH_LOD_TOLERANCES = tuple(sorted(
+    float(t) for t in os.getenv("PATH_LOD_TOLERANCES", "1,5,20,75,300").split(",") if t.strip()
+))
+
+PATH_TOLERANCE_HEADER = "X-Path-Tolerance"
+
+# Web Mercator meters per pixel of a 256 px tile at zoom 0
+ZOOM_0_RESOLUTION = 156543.03392804097
+
+ToleranceQuery = Query(
+    default=None,
+    gt=0,
+    description="Simplify paths to about this many Web Mercator meters (uses the nearest stored level)",
+)
+
+ZoomQuery = Query(
+    default=None,
+    ge=0,
+    le=24,
+    description="Simplify paths for display at this map zoom level (instead of `tolerance`)",
+)
+
+# Path column of each model with stored levels, and the levels' model and key
+PATH_LEVELS: dict[type, tuple[str, type, str]] = {
+    Route: ("path", RoutePathLevel, "route_id"),
+    RecordingSession: ("computed_path", SessionPathLevel, "session_id"),
+}
+
+
+def pick_tolerance(tolerance: Optional[float] = None, zoom: Optional[int] = None) -> Optional[float]:
+    """
+    The stored tolerance to serve for a requested tolerance or zoom level.
+    
+    None means the full path: nothing was requested, or the request is
+    finer than the finest stored level.
+    """
+    if zoom is not None:
+        tolerance = ZOOM_0_RESOLUTION / 2 ** zoom
+    if tolerance is None:
+        return None
+    return max((t for t in PATH_LOD_TOLERANCES if t <= tolerance), default=None)
+
+
+def _simplified(path, tolerance):
+    """SQL expression simplifying a WGS84 path in Web Mercator meters."""
+    return func.ST_Transform(
+        func.ST_Simplify(func.ST_Transform(path, 3857), tolerance, True), 4326
+    )
+
+
+def drop_path_levels(db: Session, model: type, ids: Sequence[int]) -> None:
+    """Remove the stored levels of paths that are going to change."""
+    if not ids:
+        return
+    _, level_model, key = PATH_LEVELS[model]
+    db.execute(text(f"DELETE FROM {level_model.__tablename__} WHERE {key} = ANY(:ids)"), {"ids": list(ids)})
+
+
+def store_path_levels(db: Session, model: type, ids: Sequence[int]) -> None:
+    """(Re)compute the stored levels of the paths of the given routes or sessions."""
+    if not ids:
+        return
+    drop_path_levels(db, model, ids)
+    column, level_model, key = PATH_LEVELS[model]
+    db.execute(text(f"""
+        INSERT INTO {level_model.__tablename__} ({key}, tolerance, point_count, path)
+        SELECT o.id, t.tolerance, ST_NPoints(s.path), s.path
+        FROM {model.__tablename__} AS o
+        CROSS JOIN unnest(CAST(:tolerances AS double precision[])) AS t(tolerance)
+        CROSS JOIN LATERAL (
+            SELECT ST_Transform(ST_Simplify(ST_Transform(o.{column}, 3857), t.tolerance, true), 4326) AS path
+        ) AS s
+        WHERE o.id = ANY(:ids) AND o.{column} IS NOT NULL
+    """), {"ids": list(ids), "tolerances": list(PATH_LOD_TOLERANCES)})
+
+
+def apply_path_level(
+    db: Session,
+    objects: Sequence[Any],
+    tolerance: Optional[float],
+    response: Optional[Response] = None,
+) -> None:
+    """
+    Swap the paths of loaded routes or sessions for their simplified level.
+    
+    Loads the stored level of each path (simplifying on the fly where none
+    is stored) in one query. The objects' paths are replaced without being
+    marked as changed, so load them with the path deferred to skip reading
+    the full geometries. Sets the X-Path-Tolerance header when `response`
+    is given.
+    """
+    if tolerance is None or not objects:
+        return
+    model = type(objects[0])
+    column, level_model, key = PATH_LEVELS[model]
+    path = getattr(model, column)
+    level = (
+        select(level_model.path)
+        .where(getattr(level_model, key) == model.id)
+        .where(level_model.tolerance == tolerance)
+        .scalar_subquery()
+    )
+    paths = dict(db.execute(
+        select(model.id, func.coalesce(level, _simplified(path, tolerance)))
+        .where(model.id.in_([o.id for o in objects]))
+    ).all())
+    for obj in objects:
+        set_committed_value(obj, column, paths.get(obj.id))
+    if response is not None:
+        response.headers[PATH_TOLERANCE_HEADER] = f"{tolerance:g}"
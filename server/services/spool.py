@@ -0,0 +1,580 @@
+"""
+Durable write-behind spool for recording uploads.
+
+In spool mode (INGEST_MODE=spool) the batch endpoints validate an upload,
+append it to an append-only segment file and acknowledge right away with
+a sequence number. A background flusher drains the spool into the database,
+coalescing the pending batches of all sessions into one COPY per table.
+
+Records are fsynced before the upload is acknowledged, and the flusher only
+advances its checkpoint after the database commit, so acknowledged data
+survives process restarts. Delivery is at-least-once: a crash between the
+commit and the checkpoint replays the last flush.
+
+Ending or cancelling a session first drains the worker's spool, so the
+session's completed path includes every batch acknowledged for it.
+
+Each worker process takes an exclusive lock on its own slot directory
+(`INGEST_SPOOL_DIR/slot-N`), so several workers can share one spool root.
+A restarted worker picks up any unlocked slot, including its predecessor's.
+"""
+import fcntl
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import chain, repeat
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional, Union
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.recording import (
+    IngestBatch,
+    LocationPointBatch,
+    RecordingSession,
+    RecordingStatus,
+    SensorReadingBatch,
+    SensorReadingColumns,
+)
+from services.ingest import (
+    LOCATION_POINT_COLUMNS,
+    SENSOR_READING_COLUMNS,
+    insert_skipping_duplicates,
+    location_point_rows,
+    sensor_column_rows,
+    sensor_reading_rows,
+)
+from services.paths import update_session_path
+from services.simplification import store_path_levels
+
+logger = logging.getLogger(__name__)
+
+INGEST_MODE = os.getenv("INGEST_MODE", "direct")  # "direct" or "spool"
+SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("INGEST_SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+SPOOL_FLUSH_INTERVAL_SECONDS = float(os.getenv("INGEST_SPOOL_FLUSH_INTERVAL_SECONDS", "1.0"))
+SPOOL_FLUSH_MAX_RECORDS = int(os.getenv("INGEST_SPOOL_FLUSH_MAX_RECORDS", "500"))
+SPOOL_RETRY_SECONDS = float(os.getenv("INGEST_SPOOL_RETRY_SECONDS", "5.0"))
+SPOOL_MAX_SLOTS = 64
+
+# Record header: sequence, spooled_at (unix time), payload length, payload crc32
+_HEADER = struct.Struct(">QdII")
+
+SpooledBatch = Union[LocationPointBatch, SensorReadingBatch, SensorReadingColumns]
+
+BATCH_KINDS: dict[str, type[SpooledBatch]] = {
+    "locations": LocationPointBatch,
+    "sensors": SensorReadingBatch,
+    "sensor_columns": SensorReadingColumns,
+}
+
+
+@dataclass
+class SpoolRecord:
+    """A batch read back from the spool."""
+    sequence: int
+    spooled_at: float
+    kind: str
+    session_id: int
+    batch: SpooledBatch
+    
+    @property
+    def timestamps(self) -> list[datetime]:
+        """Timestamps of the batch's points or readings, in upload order."""
+        if self.kind == "locations":
+            return [p.timestamp for p in self.batch.points]
+        if self.kind == "sensors":
+            return [r.timestamp for r in self.batch.readings]
+        return self.batch.timestamp
+    
+    def rows(self):
+        """COPY rows for this record's batch."""
+        if self.kind == "locations":
+            return location_point_rows(self.session_id, self.batch.points)
+        if self.kind == "sensors":
+            return sensor_reading_rows(self.session_id, self.batch.readings)
+        return sensor_column_rows(self.session_id, self.batch)
+
+
+def _segment_name(first_sequence: int) -> str:
+    return f"segment-{first_sequence:020d}.log"
+
+
+def _segment_first_sequence(path: Path) -> int:
+    return int(path.stem.split("-", 1)[1])
+
+
+def _fsync_directory(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _read_frames(file: BinaryIO, skip_below: int = 0):
+    """
+    Yield (offset, sequence, spooled_at, payload) for each intact record in a segment.
+    
+    Payloads of records below `skip_below` are seeked over instead of read.
+    Stops at the first torn or corrupt record.
+    """
+    while True:
+        offset = file.tell()
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        sequence, spooled_at, length, crc = _HEADER.unpack(header)
+        if sequence < skip_below:
+            file.seek(length, os.SEEK_CUR)
+            yield offset, sequence, spooled_at, None
+            continue
+        payload = file.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            file.seek(offset)
+            return
+        yield offset, sequence, spooled_at, payload
+
+
+class IngestSpool:
+    """Append-only on-disk spool of validated upload batches, with a background flusher."""
+    
+    def __init__(
+        self,
+        directory: Path,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        self.directory = directory
+        self._session_factory = session_factory
+        
+        # Fails with BlockingIOError if another process owns this directory
+        self._lock_file = open(directory / "spool.lock", "a+")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise
+        
+        self._lock = threading.Lock()  # Guards the writer state and _pending
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+        self._segment: Optional[BinaryIO] = None
+        self._segment_first = 0
+        self._segment_size = 0
+        self._pending: deque[tuple[int, float]] = deque()  # (sequence, spooled_at) not yet flushed
+        
+        self._last_flush_at: Optional[datetime] = None
+        self._flushed_records = 0
+        self._rejected_records = 0
+        
+        self._checkpoint = self._read_checkpoint()
+        self._next_sequence = self._recover()
+    
+    # ------------------------------------------------------------
+    # Recovery and checkpoint
+    # ------------------------------------------------------------
+    
+    def _segments(self) -> list[Path]:
+        return sorted(self.directory.glob("segment-*.log"))
+    
+    def _read_checkpoint(self) -> int:
+        try:
+            return int((self.directory / "checkpoint").read_text().strip())
+        except FileNotFoundError:
+            return 0
+    
+    def _write_checkpoint(self, sequence: int) -> None:
+        tmp = self.directory / "checkpoint.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(sequence))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.directory / "checkpoint")
+        _fsync_directory(self.directory)
+    
+    def _recover(self) -> int:
+        """
+        Scan existing segments after a restart.
+        
+        Rebuilds the list of unflushed records and truncates a torn record left
+        at the end of a segment by a crash mid-append (it was never acknowledged).
+        Returns the next sequence number to assign.
+        """
+        last_sequence = self._checkpoint
+        for path in self._segments():
+            with open(path, "r+b") as f:
+                end = 0
+                for _, sequence, spooled_at, _ in _read_frames(f):
+                    end = f.tell()
+                    last_sequence = max(last_sequence, sequence)
+                    if sequence > self._checkpoint:
+                        self._pending.append((sequence, spooled_at))
+                if end < os.fstat(f.fileno()).st_size:
+                    logger.warning("Truncating torn record at offset %d in %s", end, path)
+                    f.truncate(end)
+                    os.fsync(f.fileno())
+        return last_sequence + 1
+    
+    # ------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------
+    
+    def _rotate(self, first_sequence: int) -> None:
+        if self._segment is not None:
+            self._segment.close()
+        self._segment = open(self.directory / _segment_name(first_sequence), "ab")
+        self._segment_first = first_sequence
+        self._segment_size = 0
+        _fsync_directory(self.directory)
+    
+    def append(self, kind: str, session_id: int, batch: SpooledBatch) -> int:
+        """Durably append a validated batch. Returns its sequence number."""
+        payload = json.dumps({
+            "kind": kind,
+            "session_id": session_id,
+            "batch": batch.model_dump(mode="json"),
+        }).encode()
+        
+        with self._lock:
+            sequence = self._next_sequence
+            if self._segment is None or self._segment_size >= SPOOL_SEGMENT_BYTES:
+                self._rotate(sequence)
+            spooled_at = time.time()
+            self._segment.write(
+                _HEADER.pack(sequence, spooled_at, len(payload), zlib.crc32(payload)) + payload
+            )
+            self._segment.flush()
+            os.fsync(self._segment.fileno())
+            self._segment_size += _HEADER.size + len(payload)
+            self._next_sequence += 1
+            self._pending.append((sequence, spooled_at))
+            depth = len(self._pending)
+        
+        if depth >= SPOOL_FLUSH_MAX_RECORDS:
+            self._wakeup.set()
+        return sequence
+    
+    # ------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------
+    
+    def _read_pending(self, limit: int) -> tuple[list[SpoolRecord], int]:
+        """
+        Read up to `limit` unflushed records, in sequence order, and the
+        sequence of the last one read. Records that no longer parse (e.g.
+        after a schema change) are set aside instead of returned.
+        """
+        with self._lock:
+            # Records at or above this sequence may still be mid-write
+            end_sequence = self._next_sequence
+        
+        segments = self._segments()
+        firsts = [_segment_first_sequence(p) for p in segments]
+        # Skip segments whose records are all at or below the checkpoint
+        start = 0
+        for i, first in enumerate(firsts):
+            if first <= self._checkpoint + 1:
+                start = i
+        
+        records: list[SpoolRecord] = []
+        last_sequence, read = self._checkpoint, 0
+        for path in segments[start:]:
+            with open(path, "rb") as f:
+                for _, sequence, spooled_at, payload in _read_frames(f, skip_below=self._checkpoint + 1):
+                    if payload is None:
+                        continue
+                    if sequence >= end_sequence or read >= limit:
+                        return records, last_sequence
+                    last_sequence, read = sequence, read + 1
+                    try:
+                        data = json.loads(payload)
+                        records.append(SpoolRecord(
+                            sequence=sequence,
+                            spooled_at=spooled_at,
+                            kind=data["kind"],
+                            session_id=data["session_id"],
+                            batch=BATCH_KINDS[data["kind"]].model_validate(data["batch"]),
+                        ))
+                    except (ValueError, KeyError) as e:
+                        logger.error("Rejecting unreadable spooled record %d: %s", sequence, e)
+                        self._set_aside(sequence, spooled_at, {
+                            "payload": payload.decode(errors="replace"),
+                            "error": str(e),
+                        })
+        return records, last_sequence
+    
+    def _write(self, records: list[SpoolRecord]) -> None:
+        """
+        Write records to the database in one transaction, one COPY per table.
+        
+        Rows already stored (e.g. replayed after a crash) are skipped, and
+        batches uploaded with a client batch ID are recorded with their counts.
+        """
+        # Rows are tagged with their record's index to count new rows per batch
+        location_records = [(i, r) for i, r in enumerate(records) if r.kind == "locations"]
+        sensor_records = [(i, r) for i, r in enumerate(records) if r.kind != "locations"]
+        
+        # Last upload time per session, applied as a single executemany
+        activity: dict[int, float] = {}
+        for r in records:
+            activity[r.session_id] = max(activity.get(r.session_id, 0.0), r.spooled_at)
+        
+        db = self._session_factory()
+        try:
+            added: Counter = Counter()
+            if location_records:
+                added += insert_skipping_duplicates(
+                    db, "location_points", LOCATION_POINT_COLUMNS, chain.from_iterable(
+                        zip(repeat(i), r.rows()) for i, r in location_records
+                    )
+                )
+            # Extend the paths of sessions that got new points, from their earliest new point
+            path_updates: dict[int, datetime] = {}
+            for i, r in location_records:
+                if added[i]:
+                    first = min(r.timestamps)
+                    path_updates[r.session_id] = min(path_updates.get(r.session_id, first), first)
+            for session_id, first in sorted(path_updates.items()):
+                update_session_path(db, session_id, first)
+            if path_updates:
+                # Ending a session drains this worker's spool, not the other
+                # workers'; their late points change its stored levels too
+                ended = db.execute(
+                    select(RecordingSession.id).where(
+                        RecordingSession.id.in_(list(path_updates)),
+                        RecordingSession.status != RecordingStatus.IN_PROGRESS,
+                    )
+                ).scalars().all()
+                store_path_levels(db, RecordingSession, ended)
+            
+            if sensor_records:
+                added += insert_skipping_duplicates(
+                    db, "sensor_readings", SENSOR_READING_COLUMNS, chain.from_iterable(
+                        zip(repeat(i), r.rows()) for i, r in sensor_records
+                    )
+                )
+            
+            batches = []
+            for i, r in enumerate(records):
+                if r.batch.batch_id is None:
+                    continue
+                timestamps = r.timestamps
+                batches.append({
+                    "session_id": r.session_id,
+                    "kind": "locations" if r.kind == "locations" else "sensors",
+                    "batch_id": r.batch.batch_id,
+                    "added": added[i],
+                    "duplicates": len(timestamps) - added[i],
+                    "first_timestamp": timestamps[0],
+                    "last_timestamp": timestamps[-1],
+                    "created_at": datetime.utcfromtimestamp(r.spooled_at),
+                })
+            if batches:
+                # A replayed flush keeps the counts recorded the first time
+                db.execute(pg_insert(IngestBatch).values(batches).on_conflict_do_nothing())
+            db.execute(
+                text(
+                    "UPDATE recording_sessions "
+                    "SET last_activity_at = greatest(last_activity_at, :activity_at) "
+                    "WHERE id = :session_id"
+                ),
+                [
+                    {"session_id": session_id, "activity_at": datetime.utcfromtimestamp(at)}
+                    for session_id, at in activity.items()
+                ]
+            )
+            db.commit()
+        finally:
+            db.close()
+    
+    def _reject(self, record: SpoolRecord, error: Exception) -> None:
+        """Move a record that can't be written (e.g. its session was deleted) aside."""
+        logger.error("Rejecting spooled batch %d for session %d: %s", record.sequence, record.session_id, error)
+        self._set_aside(record.sequence, record.spooled_at, {
+            "kind": record.kind,
+            "session_id": record.session_id,
+            "batch": record.batch.model_dump(mode="json"),
+            "error": str(error),
+        })
+    
+    def _set_aside(self, sequence: int, spooled_at: float, entry: dict) -> None:
+        """Append an entry to rejected.log, framed like a spool record."""
+        payload = json.dumps(entry).encode()
+        with open(self.directory / "rejected.log", "ab") as f:
+            f.write(_HEADER.pack(sequence, spooled_at, len(payload), zlib.crc32(payload)) + payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self._rejected_records += 1
+    
+    def flush(self) -> int:
+        """
+        Flush one group of pending records to the database.
+        
+        Connection errors propagate so the flusher retries later without
+        advancing the checkpoint. Any other error (the database rejecting
+        the group's data, or a batch that fails to convert) is blamed on the
+        data: records are retried one at a time and the offending ones set
+        aside, so one bad record can't hold up the spool.
+        Returns the number of records processed.
+        """
+        with self._flush_lock:
+            records, last_sequence = self._read_pending(SPOOL_FLUSH_MAX_RECORDS)
+            if last_sequence == self._checkpoint:
+                return 0
+            
+            try:
+                if records:
+                    self._write(records)
+            except (OperationalError, InterfaceError):
+                raise
+            except Exception:
+                for record in records:
+                    try:
+                        self._write([record])
+                    except (OperationalError, InterfaceError):
+                        raise
+                    except Exception as e:
+                        self._reject(record, e)
+            
+            processed = last_sequence - self._checkpoint
+            self._checkpoint = last_sequence
+            self._write_checkpoint(self._checkpoint)
+            with self._lock:
+                while self._pending and self._pending[0][0] <= self._checkpoint:
+                    self._pending.popleft()
+                current_segment = self._segment_first if self._segment is not None else None
+            self._last_flush_at = datetime.utcnow()
+            self._flushed_records += len(records)
+            self._remove_flushed_segments(current_segment)
+            return processed
+    
+    def drain(self) -> None:
+        """
+        Flush every record appended so far, e.g. before a session ends.
+        Connection errors propagate, leaving the records spooled.
+        """
+        with self._lock:
+            last_sequence = self._next_sequence - 1
+        while self._checkpoint < last_sequence and self.flush():
+            pass
+    
+    def _remove_flushed_segments(self, current_segment: Optional[int]) -> None:
+        """Delete segments whose records are all at or below the checkpoint."""
+        segments = self._segments()
+        for path, next_path in zip(segments, segments[1:]):
+            first = _segment_first_sequence(path)
+            if first == current_segment:
+                continue
+            if _segment_first_sequence(next_path) <= self._checkpoint + 1:
+                path.unlink()
+    
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait(SPOOL_FLUSH_INTERVAL_SECONDS)
+            self._wakeup.clear()
+            try:
+                # Keep going while there is a full group waiting
+                while self.flush() >= SPOOL_FLUSH_MAX_RECORDS and not self._stop.is_set():
+                    pass
+            except Exception:
+                logger.exception("Ingest spool flush failed, retrying in %.0fs", SPOOL_RETRY_SECONDS)
+                self._stop.wait(SPOOL_RETRY_SECONDS)
+    
+    # ------------------------------------------------------------
+    # Lifecycle and monitoring
+    # ------------------------------------------------------------
+    
+    def start(self) -> None:
+        """Start the background flusher thread."""
+        self._thread = threading.Thread(target=self._run, name="ingest-spool-flusher", daemon=True)
+        self._thread.start()
+    
+    def close(self) -> None:
+        """Stop the flusher, attempt a final flush and release the directory."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            while self.flush():
+                pass
+        except Exception:
+            logger.exception("Final ingest spool flush failed; records stay spooled for the next start")
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+    
+    def stats(self) -> dict:
+        """Spool depth and flush lag, for monitoring."""
+        with self._lock:
+            depth = len(self._pending)
+            oldest = self._pending[0][1] if depth else None
+            next_sequence = self._next_sequence
+        segments = self._segments()
+        return {
+            "directory": str(self.directory),
+            "depth": depth,
+            "next_sequence": next_sequence,
+            "flushed_sequence": self._checkpoint,
+            "segments": len(segments),
+            "bytes": sum(p.stat().st_size for p in segments),
+            "flush_lag_seconds": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+            "last_flush_at": self._last_flush_at.isoformat() if self._last_flush_at else None,
+            "flushed_records": self._flushed_records,
+            "rejected_records": self._rejected_records,
+        }
+
+
+# ============================================================
+# Process-wide spool
+# ============================================================
+
+_spool: Optional[IngestSpool] = None
+
+
+def get_spool() -> Optional[IngestSpool]:
+    """The running spool, or None when uploads are written directly."""
+    return _spool
+
+
+def open_spool() -> IngestSpool:
+    """Open the first free slot under INGEST_SPOOL_DIR and start flushing it."""
+    global _spool
+    root = Path(SPOOL_DIR)
+    for slot in range(SPOOL_MAX_SLOTS):
+        directory = root / f"slot-{slot}"
+        directory.mkdir(parents=True, exist_ok=True)
+        try:
+            spool = IngestSpool(directory)
+        except BlockingIOError:
+            continue
+        spool.start()
+        _spool = spool
+        logger.info("Ingest spool opened at %s (%d pending)", directory, spool.stats()["depth"])
+        return spool
+    raise RuntimeError(f"All {SPOOL_MAX_SLOTS} ingest spool slots under {root} are in use")
+
+
+def close_spool() -> None:
+    """Flush and close the process-wide spool, if open."""
+    global _spool
+    if _spool is not None:
+        _spool.close()
+        _spool = None
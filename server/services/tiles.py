@@ -0,0 +1,307 @@
+"""
+Mapbox Vector Tiles of the routes of approved lines.
+
+Tiles are generated in PostGIS (`ST_AsMVTGeom`/`ST_AsMVT`) from the
+route paths that intersect the tile, using the stored simplified level
+(services/simplification.py) that fits a pixel at the tile's zoom, so a
+tile never reads full geometries and a map only fetches the tiles it
+shows.
+
+Generated tiles are kept on disk under TILE_CACHE_DIR as `{z}/{x}/{y}.mvt`
+and evicted least recently used first once they take more than
+TILE_CACHE_MAX_BYTES. Edits to routes and lines invalidate the cached tiles
+that the old and new paths pass through, found from the paths' bounding
+boxes and checked against each tile's bounds (a Web Mercator tile is a
+longitude/latitude rectangle).
+
+Worker processes share the directory: invalidation removes files from it
+directly, so every worker stops serving them, and replaces a generation
+token kept next to them, so no worker stores a tile it rendered before. Each
+worker only counts the tiles it found at startup and those it wrote against
+the size limit.
+"""
+import logging
+import math
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Optional
+
+from geoalchemy2.shape import to_shape
+from shapely.geometry import box
+from shapely.geometry.base import BaseGeometry
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.orm import Session
+
+from database import run_blocking
+from models.line import Line, LineStatus
+from models.route import Route
+from services.simplification import pick_tolerance
+
+logger = logging.getLogger(__name__)
+
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", "tile_cache")
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+TILE_MAX_AGE_SECONDS = int(os.getenv("TILE_MAX_AGE_SECONDS", "60"))
+TILE_MAX_ZOOM = 22
+
+TILE_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+TILE_CACHE_HEADER = "X-Tile-Cache"
+
+# Tile grid size and the margin around a tile that is kept in it, in
+# grid units, so that lines crossing tile edges join up when drawn
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# What a cached tile counts for on top of its size (a file system block),
+# so that empty tiles count too
+_ENTRY_OVERHEAD = 4096
+
+# File in the cache directory holding the generation token
+_GENERATION_FILE = "generation"
+
+_ROUTE_TILE = text("""
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(:z, :x, :y) AS tile,
+               ST_Transform(ST_TileEnvelope(:z, :x, :y, margin => :margin), 4326) AS search
+    ),
+    features AS (
+        SELECT
+            ST_AsMVTGeom(
+                ST_Transform(coalesce(level.path, r.path), 3857), bounds.tile, :extent, :buffer, true
+            ) AS geom,
+            r.id,
+            r.line_id,
+            l.name AS line_name,
+            r.direction,
+            r.distinctive,
+            r.color
+        FROM routes AS r
+        JOIN lines AS l ON l.id = r.line_id
+        CROSS JOIN bounds
+        LEFT JOIN route_path_levels AS level
+            ON level.route_id = r.id AND level.tolerance = :tolerance
+        WHERE l.status = :approved AND r.path && bounds.search
+    )
+    SELECT ST_AsMVT(features, 'routes', :extent, 'geom')
+    FROM features
+    WHERE geom IS NOT NULL
+""").bindparams(bindparam("approved", LineStatus.APPROVED, type_=Line.__table__.c.status.type))
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    """Whether z/x/y names a tile of the Web Mercator grid."""
+    return 0 <= z <= TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _latitude(z: int, y: float) -> float:
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / 2 ** z))))
+
+
+def tile_bounds(z: int, x: int, y: int, margin: float = 0.0) -> tuple[float, float, float, float]:
+    """
+    (west, south, east, north) of a tile in degrees, grown by `margin`
+    (a fraction of the tile's size) on every side.
+    """
+    n = 2 ** z
+    return (
+        (x - margin) / n * 360 - 180,
+        _latitude(z, y + 1 + margin),
+        (x + 1 + margin) / n * 360 - 180,
+        _latitude(z, y - margin),
+    )
+
+
+def _tile_x(z: int, longitude: float) -> int:
+    return math.floor((longitude + 180) / 360 * 2 ** z)
+
+
+def _tile_y(z: int, latitude: float) -> int:
+    latitude = max(min(latitude, 85.0511), -85.0511)
+    return math.floor((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * 2 ** z)
+
+
+def render_route_tile(db: Session, z: int, x: int, y: int) -> bytes:
+    """Generate the routes tile z/x/y."""
+    tolerance = pick_tolerance(zoom=z)
+    return bytes(db.execute(_ROUTE_TILE, {
+        "z": z, "x": x, "y": y,
+        "margin": TILE_BUFFER / TILE_EXTENT,
+        "extent": TILE_EXTENT,
+        "buffer": TILE_BUFFER,
+        "tolerance": tolerance if tolerance is not None else 0.0,
+    }).scalar() or b"")
+
+
+class TileCache:
+    """On-disk tile cache bounded in bytes, evicting least recently used tiles. Thread-safe."""
+    
+    def __init__(self, directory: str = TILE_CACHE_DIR, max_bytes: int = TILE_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[int, int, int], int] = OrderedDict()
+        self._size = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+    
+    def _path(self, z: int, x: int, y: int) -> Path:
+        return self.directory / str(z) / str(x) / f"{y}.mvt"
+    
+    def generation(self) -> str:
+        """Token replaced by every invalidation, in any worker, to pass to `put`."""
+        try:
+            return (self.directory / _GENERATION_FILE).read_text()
+        except FileNotFoundError:
+            return ""
+    
+    def _next_generation(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / _GENERATION_FILE
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        temporary.write_text(uuid.uuid4().hex)
+        os.replace(temporary, path)
+    
+    def _load(self) -> None:
+        """Index the tiles already on disk, least recently modified first."""
+        tiles = []
+        for path in self.directory.glob("*/*/*.mvt"):
+            try:
+                stat = path.stat()
+                key = (int(path.parent.parent.name), int(path.parent.name), int(path.stem))
+            except (OSError, ValueError):
+                continue
+            tiles.append((stat.st_mtime, key, stat.st_size + _ENTRY_OVERHEAD))
+        for _, key, size in sorted(tiles):
+            self._entries[key] = size
+            self._size += size
+        self._loaded = True
+        self._evict()
+    
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self._path(*key).unlink(missing_ok=True)
+    
+    def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """A cached tile, or None."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+        try:
+            data = self._path(z, x, y).read_bytes()
+        except FileNotFoundError:
+            data = None
+        with self._lock:
+            if data is None:
+                # Possibly invalidated by another worker
+                self._size -= self._entries.pop((z, x, y), 0)
+            elif (z, x, y) in self._entries:
+                self._entries.move_to_end((z, x, y))
+        return data
+    
+    def put(self, z: int, x: int, y: int, data: bytes, generation: str) -> None:
+        """
+        Cache a tile rendered while the cache was at `generation`; dropped
+        if tiles were invalidated in the meantime.
+        """
+        with self._lock:
+            if generation != self.generation():
+                return
+            if not self._loaded:
+                self._load()
+            path = self._path(z, x, y)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            temporary.write_bytes(data)
+            os.replace(temporary, path)
+            # Checked again once written: an invalidation in another worker
+            # since the first check may have missed the file
+            if generation != self.generation():
+                path.unlink(missing_ok=True)
+                return
+            self._size -= self._entries.pop((z, x, y), 0)
+            self._entries[(z, x, y)] = len(data) + _ENTRY_OVERHEAD
+            self._size += len(data) + _ENTRY_OVERHEAD
+            self._evict()
+    
+    def invalidate(self, geometries: Iterable[Optional[BaseGeometry]]) -> int:
+        """Remove the cached tiles that the geometries (WGS84) pass through. Returns how many."""
+        geometries = [g for g in geometries if g is not None and not g.is_empty]
+        removed = 0
+        with self._lock:
+            self._next_generation()
+            if not geometries:
+                return 0
+            for z_dir in self.directory.iterdir():
+                if not z_dir.name.isdigit():
+                    continue
+                z = int(z_dir.name)
+                for geometry in geometries:
+                    removed += self._invalidate_zoom(z_dir, z, geometry)
+        if removed:
+            logger.info("Tile cache: invalidated %d tiles", removed)
+        return removed
+    
+    def _invalidate_zoom(self, z_dir: Path, z: int, geometry: BaseGeometry) -> int:
+        west, south, east, north = geometry.bounds
+        # One tile more on each side for the buffer
+        x_range = range(_tile_x(z, west) - 1, _tile_x(z, east) + 2)
+        y_range = range(_tile_y(z, north) - 1, _tile_y(z, south) + 2)
+        removed = 0
+        for x_dir in z_dir.iterdir():
+            if not x_dir.name.isdigit() or int(x_dir.name) not in x_range:
+                continue
+            x = int(x_dir.name)
+            for path in x_dir.glob("*.mvt"):
+                if not path.stem.isdigit() or int(path.stem) not in y_range:
+                    continue
+                y = int(path.stem)
+                if not geometry.intersects(box(*tile_bounds(z, x, y, TILE_BUFFER / TILE_EXTENT))):
+                    continue
+                path.unlink(missing_ok=True)
+                self._size -= self._entries.pop((z, x, y), 0)
+                removed += 1
+        return removed
+    
+    def clear(self) -> None:
+        """Remove every cached tile."""
+        with self._lock:
+            self._next_generation()
+            for path in self.directory.glob("*/*/*.mvt"):
+                path.unlink(missing_ok=True)
+            self._entries.clear()
+            self._size = 0
+    
+    def stats(self) -> dict:
+        """Size of the cache as known to this process."""
+        with self._lock:
+            return {"tiles": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+tile_cache = TileCache()
+
+
+def route_shapes(
+    db: Session,
+    route_ids: Optional[Iterable[int]] = None,
+    line_id: Optional[int] = None,
+) -> list[BaseGeometry]:
+    """The paths of routes, or of a line's routes, as shapes."""
+    query = select(Route.path).where(Route.path.is_not(None))
+    if route_ids is not None:
+        query = query.where(Route.id.in_(list(route_ids)))
+    if line_id is not None:
+        query = query.where(Route.line_id == line_id)
+    return [to_shape(path) for path in db.execute(query).scalars()]
+
+
+def invalidate_route_tiles(paths: Iterable) -> int:
+    """Invalidate the tiles of route paths, given as shapes or PostGIS geometries."""
+    shapes = [
+        to_shape(path) if path is not None and not isinstance(path, BaseGeometry) else path
+        for path in paths
+    ]
+    return run_blocking(tile_cache.invalidate, shapes)
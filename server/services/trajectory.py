@@ -0,0 +1,352 @@
+"""
+Packed trajectory storage for finished recording sessions.
+
+A finished trip is only ever read back as a whole, so storing each fix as a
+`location_points` row (tuple header, nine columns and a PostGIS point) is
+mostly overhead. Compaction moves a session's rows into `trajectory_chunks`:
+each chunk holds up to TRAJECTORY_CHUNK_POINTS points as typed arrays, with
+the chunk's time range and bounding box stored alongside.
+
+Chunk layout (before zlib compression)::
+
+    header   magic b"TRJ1", point count (uint32, little endian)
+    id       int64, delta encoded
+    timestamp  int64 microseconds since the epoch, delta encoded
+    longitude, latitude, altitude, speed, bearing,
+    horizontal_accuracy, vertical_accuracy
+             float64, NaN for missing values
+
+Every array is byte-shuffled (all first bytes, then all second bytes, ...),
+which puts the slowly changing high bytes of neighbouring values next to
+each other and lets zlib compress them well.
+
+Readers go through `session_points` / `session_coordinates`, which merge the
+chunks with any rows that are still stored individually.
+"""
+import os
+import struct
+import zlib
+from datetime import datetime
+from typing import Optional, Sequence
+
+import numpy as np
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from models.recording import (
+    LocationPoint,
+    LocationPointRead,
+    RecordingSession,
+    RecordingStatus,
+    TrajectoryChunk,
+)
+
+TRAJECTORY_CHUNK_POINTS = int(os.getenv("TRAJECTORY_CHUNK_POINTS", "2048"))
+
+# "rows" keeps every point as a location_points row; "chunks" compacts a
+# session into trajectory chunks as soon as it ends
+TRAJECTORY_STORAGE = os.getenv("TRAJECTORY_STORAGE", "rows")
+
+CHUNK_MAGIC = b"TRJ1"
+_HEADER = struct.Struct("<4sI")
+
+INTEGER_COLUMNS = ("id", "timestamp")
+FLOAT_COLUMNS = (
+    "longitude",
+    "latitude",
+    "altitude",
+    "speed",
+    "bearing",
+    "horizontal_accuracy",
+    "vertical_accuracy",
+)
+PACKED_COLUMNS = INTEGER_COLUMNS + FLOAT_COLUMNS
+
+_EPOCH = np.datetime64(0, "us")
+
+
+def shuffle_bytes(values: np.ndarray) -> bytes:
+    """Byte-shuffle an array of fixed-size little endian values."""
+    raw = values.astype(values.dtype.newbyteorder("<"), copy=False)
+    return raw.view(np.uint8).reshape(len(values), values.itemsize).T.tobytes()
+
+
+def unshuffle_bytes(data: bytes, dtype: str, count: int) -> np.ndarray:
+    """Reverse `shuffle_bytes`."""
+    itemsize = np.dtype(dtype).itemsize
+    raw = np.frombuffer(data, dtype=np.uint8).reshape(itemsize, count).T
+    return np.ascontiguousarray(raw).view(dtype).reshape(count)
+
+
+def empty_points() -> dict[str, np.ndarray]:
+    """Point arrays holding no points."""
+    points = {column: np.empty(0, dtype="<f8") for column in FLOAT_COLUMNS}
+    points["id"] = np.empty(0, dtype="<i8")
+    points["timestamp"] = np.empty(0, dtype="datetime64[us]")
+    return points
+
+
+def points_from_rows(rows: Sequence[Sequence]) -> dict[str, np.ndarray]:
+    """Build point arrays from rows of values in PACKED_COLUMNS order."""
+    if not rows:
+        return empty_points()
+    columns = list(zip(*rows))
+    points = {
+        "id": np.array(columns[0], dtype="<i8"),
+        "timestamp": np.array(columns[1], dtype="datetime64[us]"),
+    }
+    for name, values in zip(FLOAT_COLUMNS, columns[2:]):
+        # None becomes NaN
+        points[name] = np.array(values, dtype="<f8")
+    return points
+
+
+def pack_points(points: dict[str, np.ndarray]) -> bytes:
+    """Pack point arrays into the compressed chunk format."""
+    count = len(points["timestamp"])
+    micros = (points["timestamp"] - _EPOCH).astype("<i8")
+    parts = [
+        _HEADER.pack(CHUNK_MAGIC, count),
+        shuffle_bytes(np.diff(points["id"].astype("<i8"), prepend=np.int64(0))),
+        shuffle_bytes(np.diff(micros, prepend=np.int64(0))),
+    ]
+    parts.extend(shuffle_bytes(points[name].astype("<f8")) for name in FLOAT_COLUMNS)
+    return zlib.compress(b"".join(parts), level=6)
+
+
+def unpack_points(data: bytes) -> dict[str, np.ndarray]:
+    """Unpack a chunk written by `pack_points`."""
+    raw = zlib.decompress(data)
+    magic, count = _HEADER.unpack_from(raw)
+    if magic != CHUNK_MAGIC:
+        raise ValueError(f"Not a trajectory chunk (magic {magic!r})")
+    
+    offset = _HEADER.size
+    size = count * 8
+    
+    def column(dtype: str) -> np.ndarray:
+        nonlocal offset
+        values = unshuffle_bytes(raw[offset:offset + size], dtype, count)
+        offset += size
+        return values
+    
+    points = {
+        "id": np.cumsum(column("<i8")),
+        "timestamp": _EPOCH + np.cumsum(column("<i8")).astype("timedelta64[us]"),
+    }
+    for name in FLOAT_COLUMNS:
+        points[name] = column("<f8")
+    return points
+
+
+def concat_points(parts: Sequence[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    """
+    Merge point arrays into one, ordered by timestamp.
+    
+    Points with a timestamp seen before are dropped, so the first part wins
+    (e.g. a point uploaded again after its session was compacted).
+    """
+    parts = [part for part in parts if len(part["timestamp"])]
+    if not parts:
+        return empty_points()
+    merged = {
+        column: np.concatenate([part[column] for part in parts])
+        for column in PACKED_COLUMNS
+    }
+    _, first = np.unique(merged["timestamp"], return_index=True)
+    return {column: values[first] for column, values in merged.items()}
+
+
+def point_reads(session_id: int, points: dict[str, np.ndarray]) -> list[LocationPointRead]:
+    """Turn point arrays into the API's location point schema."""
+    columns = {
+        name: [None if np.isnan(v) else v for v in points[name].tolist()]
+        for name in FLOAT_COLUMNS
+    }
+    return [
+        LocationPointRead(
+            id=point_id,
+            session_id=session_id,
+            timestamp=timestamp,
+            **{name: columns[name][i] for name in FLOAT_COLUMNS},
+        )
+        for i, (point_id, timestamp) in enumerate(zip(
+            points["id"].tolist(), points["timestamp"].astype(datetime).tolist()
+        ))
+    ]
+
+
+def _row_columns():
+    """location_points columns in PACKED_COLUMNS order."""
+    return [getattr(LocationPoint, column) for column in PACKED_COLUMNS]
+
+
+def load_chunks(
+    db: Session,
+    session_id: int,
+    lower: Optional[datetime] = None,
+    upper: Optional[datetime] = None,
+) -> list[dict[str, np.ndarray]]:
+    """Unpacked chunks of a session, optionally only those overlapping [lower, upper]."""
+    query = (
+        select(TrajectoryChunk.data)
+        .where(TrajectoryChunk.session_id == session_id)
+        .order_by(TrajectoryChunk.sequence)
+    )
+    if lower is not None:
+        query = query.where(TrajectoryChunk.end_time >= lower)
+    if upper is not None:
+        query = query.where(TrajectoryChunk.start_time <= upper)
+    return [unpack_points(data) for data in db.execute(query).scalars()]
+
+
+def session_points(
+    db: Session,
+    session_id: int,
+    lower: datetime,
+    upper: datetime,
+) -> dict[str, np.ndarray]:
+    """
+    All location points of a session between `lower` and `upper`, as arrays
+    ordered by timestamp, whether they are packed in chunks or stored as rows.
+    """
+    rows = db.execute(
+        select(*_row_columns())
+        .where(LocationPoint.session_id == session_id)
+        .where(LocationPoint.timestamp.between(lower, upper))
+    ).all()
+    points = concat_points([*load_chunks(db, session_id, lower, upper), points_from_rows(rows)])
+    
+    in_range = (
+        (points["timestamp"] >= np.datetime64(lower, "us"))
+        & (points["timestamp"] <= np.datetime64(upper, "us"))
+    )
+    return {column: values[in_range] for column, values in points.items()}
+
+
+def has_chunks(db: Session, session_id: int) -> bool:
+    """Whether any of a session's points have been packed into chunks."""
+    return db.execute(
+        select(select(TrajectoryChunk.id).where(TrajectoryChunk.session_id == session_id).exists())
+    ).scalar()
+
+
+def session_location_points(
+    db: Session,
+    session_id: int,
+    lower: datetime,
+    upper: datetime,
+    skip: int,
+    limit: int,
+    after: Optional[datetime] = None,
+) -> list[LocationPointRead]:
+    """
+    A page of a session's location points, ordered by timestamp, starting
+    `skip` points after the timestamp `after` (or the start of the session).
+    """
+    if not has_chunks(db, session_id):
+        query = (
+            select(LocationPoint)
+            .where(LocationPoint.session_id == session_id)
+            .where(LocationPoint.timestamp.between(lower, upper))
+        )
+        if after is not None:
+            query = query.where(LocationPoint.timestamp > after)
+        points = db.execute(
+            query.order_by(LocationPoint.timestamp)
+            .offset(skip).limit(limit)
+        ).scalars().all()
+        return [LocationPointRead.model_validate(p) for p in points]
+    
+    if after is not None:
+        # Chunks ending before the cursor are not even loaded
+        lower = max(lower, after)
+    points = session_points(db, session_id, lower, upper)
+    start = skip
+    if after is not None:
+        start += int(np.searchsorted(points["timestamp"], np.datetime64(after, "us"), side="right"))
+    page = {column: values[start:start + limit] for column, values in points.items()}
+    return point_reads(session_id, page)
+
+
+def session_coordinates(
+    db: Session,
+    session_id: int,
+    lower: datetime,
+    upper: datetime,
+) -> list[tuple[float, float]]:
+    """(longitude, latitude) of a session's points in time order, for path computation."""
+    points = session_points(db, session_id, lower, upper)
+    return list(zip(points["longitude"].tolist(), points["latitude"].tolist()))
+
+
+def compact_session(
+    db: Session,
+    session_id: int,
+    chunk_size: int = TRAJECTORY_CHUNK_POINTS,
+) -> int:
+    """
+    Move a session's location_points rows into trajectory chunks.
+    
+    New chunks are appended after any the session already has (e.g. when a
+    resumed session ends again). Runs in the caller's transaction; returns the
+    number of points packed.
+    """
+    rows = db.execute(
+        delete(LocationPoint)
+        .where(LocationPoint.session_id == session_id)
+        .returning(*_row_columns())
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not rows:
+        return 0
+    
+    points = concat_points([points_from_rows(rows)])
+    sequence = db.execute(
+        select(func.coalesce(func.max(TrajectoryChunk.sequence) + 1, 0))
+        .where(TrajectoryChunk.session_id == session_id)
+    ).scalar()
+    
+    count = len(points["timestamp"])
+    for start in range(0, count, chunk_size):
+        chunk = {column: values[start:start + chunk_size] for column, values in points.items()}
+        db.add(TrajectoryChunk(
+            session_id=session_id,
+            sequence=sequence,
+            start_time=chunk["timestamp"][0].astype(datetime),
+            end_time=chunk["timestamp"][-1].astype(datetime),
+            point_count=len(chunk["timestamp"]),
+            bbox=func.ST_MakeEnvelope(
+                float(chunk["longitude"].min()), float(chunk["latitude"].min()),
+                float(chunk["longitude"].max()), float(chunk["latitude"].max()),
+                4326,
+            ),
+            data=pack_points(chunk),
+        ))
+        sequence += 1
+    db.flush()
+    return count
+
+
+def compact_finished_sessions(
+    db: Session,
+    ended_before: datetime,
+    limit: int = 100,
+) -> dict[int, int]:
+    """
+    Compact finished sessions that ended before `ended_before` and still have
+    location_points rows. Returns the number of points packed per session.
+    """
+    session_ids = db.execute(
+        select(RecordingSession.id)
+        .where(RecordingSession.status != RecordingStatus.IN_PROGRESS)
+        .where(RecordingSession.ended_at < ended_before)
+        .where(
+            select(LocationPoint.id)
+            .where(LocationPoint.session_id == RecordingSession.id)
+            .exists()
+        )
+        .order_by(RecordingSession.ended_at)
+        .limit(limit)
+    ).scalars().all()
+    return {session_id: compact_session(db, session_id) for session_id in session_ids}
@@ -21,9 +21,13 @@ TEST_DATABASE_URL = os.getenv(
 
 # Override DATABASE_URL so app modules use the test database
 os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+# Maintenance jobs are run explicitly by the tests that need them
+os.environ["SCHEDULER_ENABLED"] = "false"
 
-from database import get_db
+from database import get_db, get_read_db
 from main import app
+from services.partitions import ensure_partitions
+from services.session_cache import session_cache
 from models.line import Line, LineStatus
 from models.recording import RecordingSession, RecordingStatus
 from models.user import User
@@ -70,6 +74,8 @@ def setup_test_database():
     
     # Create all tables
     SQLModel.metadata.create_all(test_engine)
+    with test_engine.begin() as conn:
+        ensure_partitions(conn)
     yield
     # Optionally drop tables after all tests
     # SQLModel.metadata.drop_all(test_engine)
@@ -99,11 +105,14 @@ def client(db: Session) -> Generator[TestClient, None, None]:
             pass
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     
     with TestClient(app) as test_client:
         yield test_client
     
     app.dependency_overrides.clear()
+    # Cached session state would outlive the rolled back test data
+    session_cache.clear()
 
 
 # ============================================================
@@ -0,0 +1,173 @@
+"""Tests for the async (DB_MODE=async) variants of the routers."""
+import inspect
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+import routes.tiles
+import services.tiles
+from database import ASYNC_DATABASE_URL, get_async_db, get_async_read_db, get_db
+from models.user import User
+from routes import (
+    admin_router,
+    lines_router,
+    make_async_router,
+    recordings_router,
+    routes_router,
+    tiles_router,
+)
+from services.tiles import TILE_CACHE_HEADER, TileCache
+
+
+def _api_routes(router) -> dict:
+    return {
+        (route.path, frozenset(route.methods)): route
+        for route in router.routes if isinstance(route, APIRoute)
+    }
+
+
+def _async_session(connection: AsyncConnection) -> AsyncSession:
+    # Commits release a savepoint, the test's transaction is rolled back at the end
+    return AsyncSession(bind=connection, autoflush=False, join_transaction_mode="create_savepoint")
+
+
+@pytest.fixture
+def async_client(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """A client of the async routers, on asyncpg sessions in a transaction rolled back after the test."""
+    cache = TileCache(directory=str(tmp_path))
+    monkeypatch.setattr(services.tiles, "tile_cache", cache)
+    monkeypatch.setattr(routes.tiles, "tile_cache", cache)
+    
+    app = FastAPI()
+    for router in (admin_router, lines_router, recordings_router, routes_router, tiles_router):
+        app.include_router(make_async_router(router))
+    # Connections belong to the client's event loop, so none are pooled
+    engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+    
+    with TestClient(app) as client:
+        connection = client.portal.call(engine.connect)
+        transaction = client.portal.call(connection.begin)
+        
+        async def override_get_async_db():
+            async with _async_session(connection) as db:
+                yield db
+        
+        app.dependency_overrides[get_async_db] = override_get_async_db
+        app.dependency_overrides[get_async_read_db] = override_get_async_db
+        app.state.connection = connection
+        yield client
+        
+        client.portal.call(transaction.rollback)
+        client.portal.call(connection.close)
+
+
+class TestAsyncRouters:
+    """Tests for make_async_router."""
+    
+    @pytest.mark.parametrize("router", [lines_router, recordings_router, routes_router])
+    def test_same_routes(self, router):
+        """Should expose the same paths, methods and status codes."""
+        sync_routes = _api_routes(router)
+        async_routes = _api_routes(make_async_router(router))
+        
+        assert sync_routes.keys() == async_routes.keys()
+        for key, route in sync_routes.items():
+            assert async_routes[key].status_code == route.status_code
+            assert async_routes[key].response_model == route.response_model
+    
+    @pytest.mark.parametrize("router", [lines_router, recordings_router, routes_router])
+    def test_database_endpoints_are_async(self, router):
+        """Should run every endpoint that uses the database on an async session."""
+        for route in _api_routes(make_async_router(router)).values():
+            dependencies = [
+                param.default.dependency
+                for param in inspect.signature(route.endpoint).parameters.values()
+                if hasattr(param.default, "dependency")
+            ]
+            assert get_db not in dependencies
+            if get_async_db in dependencies:
+                assert inspect.iscoroutinefunction(route.endpoint)
+    
+    def test_same_openapi_schema(self):
+        """Should document the async app exactly like the sync one."""
+        sync_app, async_app = FastAPI(), FastAPI()
+        for router in (lines_router, recordings_router, routes_router):
+            sync_app.include_router(router)
+            async_app.include_router(make_async_router(router))
+        
+        assert async_app.openapi() == sync_app.openapi()
+
+
+class TestAsyncRoundTrips:
+    """Requests served by each async router against the database."""
+    
+    def test_lines(self, async_client: TestClient):
+        """Should create a line and read it back."""
+        created = async_client.post("/lines/", json={"name": "Async Line"})
+        
+        assert created.status_code == 201
+        response = async_client.get(f"/lines/{created.json()['id']}")
+        assert response.status_code == 200
+        assert response.json()["name"] == "Async Line"
+    
+    def test_routes(self, async_client: TestClient):
+        """Should create a route, invalidating tiles off the event loop, and serve its GeoJSON."""
+        line = async_client.post("/lines/", json={"name": "Async Line"}).json()
+        created = async_client.post("/routes/", json={
+            "line_id": line["id"], "direction": "outbound", "path": [[-73.99, 40.73], [-73.98, 40.74]]
+        })
+        
+        assert created.status_code == 201
+        response = async_client.get(f"/routes/{created.json()['id']}/geojson")
+        assert response.status_code == 200
+        assert response.json()["geometry"]["coordinates"] == [[-73.99, 40.73], [-73.98, 40.74]]
+    
+    def test_recordings(self, async_client: TestClient):
+        """Should record a session, upload points and complete its path."""
+        async def add_user() -> int:
+            async with _async_session(async_client.app.state.connection) as db:
+                user = User(username="async", email="async@example.com", password_hash="hash")
+                db.add(user)
+                await db.commit()
+                return user.id
+        
+        user_id = async_client.portal.call(add_user)
+        line = async_client.post("/lines/", json={"name": "Async Line"}).json()
+        session = async_client.post(f"/recordings/?user_id={user_id}", json={"line_id": line["id"]}).json()
+        start = datetime.utcnow()
+        uploaded = async_client.post(f"/recordings/{session['id']}/locations/batch", json={"points": [
+            {
+                "timestamp": (start + timedelta(seconds=i)).isoformat() + "Z",
+                "latitude": 40.7128,
+                "longitude": -74.0060 + (i * 0.0001),
+            }
+            for i in range(3)
+        ]})
+        ended = async_client.post(f"/recordings/{session['id']}/end")
+        
+        assert uploaded.status_code == 201
+        assert ended.status_code == 200
+        assert ended.json()["status"] == "completed"
+        assert len(ended.json()["computed_path"]) == 3
+    
+    def test_tiles(self, async_client: TestClient):
+        """Should render a tile, then serve it from the file cache."""
+        first = async_client.get("/tiles/routes/14/4824/6159.mvt")
+        second = async_client.get("/tiles/routes/14/4824/6159.mvt")
+        
+        assert first.status_code == 200
+        assert first.headers[TILE_CACHE_HEADER] == "miss"
+        assert second.headers[TILE_CACHE_HEADER] == "hit"
+    
+    def test_admin(self, async_client: TestClient):
+        """Should list the recorded maintenance runs."""
+        response = async_client.get("/admin/jobs")
+        
+        assert response.status_code == 200
+        assert "runs" in response.json()
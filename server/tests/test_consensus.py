@@ -0,0 +1,181 @@
+"""Tests for consensus paths built from recordings."""
+from datetime import datetime
+
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from models.line import Line
+from models.recording import RecordingSession, RecordingStatus
+from models.route import Route
+from models.user import User
+from services.consensus import (
+    build_consensus,
+    pack_stations,
+    pending_consensus,
+    resample_paths,
+    unpack_stations,
+)
+from services.paths import linestring_ewkt
+
+# A gently curving route about 4 km long
+ROUTE = np.column_stack((np.linspace(-74.0, -73.95, 300), 40.7 + 0.005 * np.sin(np.linspace(0, 3, 300))))
+
+
+def noisy_trip(rng: np.random.Generator, count: int, noise: float = 0.00004, shift: float = 0.0) -> np.ndarray:
+    """GPS fixes along the route at random spacing, with a few meters of noise."""
+    t = np.sort(rng.uniform(0, 1, count))
+    t[0], t[-1] = 0, 1
+    along = np.linspace(0, 1, len(ROUTE))
+    trip = np.column_stack((np.interp(t, along, ROUTE[:, 0]), np.interp(t, along, ROUTE[:, 1]) + shift))
+    return trip + rng.normal(0, noise, (count, 2))
+
+
+def distance_meters(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.hypot((a[:, 0] - b[:, 0]) * 84400, (a[:, 1] - b[:, 1]) * 111200)
+
+
+class TestBuildConsensus:
+    """Tests for resample_paths and build_consensus"""
+    
+    def test_resample_keeps_ends_and_spacing(self):
+        """Should resample every path from its start to its end at equal steps."""
+        short = np.array([[-74.0, 40.7], [-73.99, 40.7]])
+        bent = np.array([[-74.0, 40.7], [-74.0, 40.71], [-74.0001, 40.7]])
+        
+        resampled = resample_paths([short, bent], stations=11)
+        
+        assert resampled.shape == (2, 11, 2)
+        np.testing.assert_allclose(resampled[:, 0], [short[0], bent[0]])
+        np.testing.assert_allclose(resampled[:, -1], [short[-1], bent[-1]])
+        np.testing.assert_allclose(resampled[0, :, 0], np.linspace(-74.0, -73.99, 11))
+        # The two legs of the bent path are about as long
+        np.testing.assert_allclose(resampled[1, 5], [-74.0, 40.71], atol=1e-4)
+    
+    def test_median_of_the_trips_that_agree(self):
+        """Should follow the route and leave out the trips that took a detour."""
+        rng = np.random.default_rng(7)
+        trips = [noisy_trip(rng, int(rng.integers(300, 800))) for _ in range(40)]
+        trips += [noisy_trip(rng, 500, shift=0.003) for _ in range(5)]
+        
+        consensus = build_consensus(resample_paths(trips))
+        
+        assert consensus.members.tolist() == [True] * 40 + [False] * 5
+        assert distance_meters(consensus.path, resample_paths([ROUTE])[0]).max() < 10
+        assert consensus.spread < 25
+    
+    def test_starts_from_the_reference(self):
+        """Should refine from a previous consensus rather than from all traces."""
+        rng = np.random.default_rng(3)
+        # Most trips took the detour, but the previous consensus is the route
+        trips = [noisy_trip(rng, 400) for _ in range(4)] + [noisy_trip(rng, 400, shift=0.003) for _ in range(6)]
+        tracks = resample_paths(trips)
+        
+        from_reference = build_consensus(tracks, reference=resample_paths([ROUTE])[0])
+        from_scratch = build_consensus(tracks)
+        
+        assert from_reference.members.tolist() == [True] * 4 + [False] * 6
+        assert from_scratch.members.tolist() == [False] * 4 + [True] * 6
+    
+    def test_pack_round_trip(self):
+        """Should unpack the stations that were packed."""
+        stations = resample_paths([ROUTE])[0]
+        
+        np.testing.assert_array_equal(unpack_stations(pack_stations(stations)), stations)
+
+
+class TestConsensusEndpoints:
+    """Tests for /lines/{line_id}/consensus"""
+    
+    def _record(self, db: Session, user: User, line: Line, trips: list[np.ndarray]) -> list[RecordingSession]:
+        sessions = []
+        for trip in trips:
+            session = RecordingSession(
+                user_id=user.id,
+                line_id=line.id,
+                direction="eastbound",
+                status=RecordingStatus.COMPLETED,
+                started_at=datetime(2026, 10, 17, 8, 0),
+                ended_at=datetime(2026, 10, 17, 8, 30),
+                computed_path=linestring_ewkt(trip.tolist()),
+            )
+            db.add(session)
+            sessions.append(session)
+        db.commit()
+        return sessions
+    
+    def test_build_and_apply(self, client: TestClient, db: Session, test_user: User, approved_line: Line):
+        """Should propose a path from the recordings and write it to a new route."""
+        rng = np.random.default_rng(11)
+        self._record(db, test_user, approved_line, [noisy_trip(rng, 300) for _ in range(4)])
+        assert (approved_line.id, "eastbound") in pending_consensus(db)
+        
+        response = client.post(f"/lines/{approved_line.id}/consensus")
+        
+        assert response.status_code == 200
+        [consensus] = response.json()
+        assert consensus["direction"] == "eastbound"
+        assert consensus["track_count"] == 4
+        assert consensus["outlier_count"] == 0
+        assert (approved_line.id, "eastbound") not in pending_consensus(db)
+        assert client.get(f"/lines/{approved_line.id}/consensus").json() == [consensus]
+        
+        response = client.post(f"/lines/{approved_line.id}/consensus/apply", params={"direction": "eastbound"})
+        
+        assert response.status_code == 200
+        route = response.json()
+        assert route["direction"] == "eastbound"
+        assert route["path"] == consensus["path"]
+    
+    def test_incremental_update(self, client: TestClient, db: Session, test_user: User, approved_line: Line):
+        """Should add new recordings to the consensus, leaving detours out."""
+        rng = np.random.default_rng(5)
+        self._record(db, test_user, approved_line, [noisy_trip(rng, 300) for _ in range(3)])
+        client.post(f"/lines/{approved_line.id}/consensus")
+        
+        self._record(db, test_user, approved_line, [noisy_trip(rng, 300), noisy_trip(rng, 300, shift=0.003)])
+        response = client.post(f"/lines/{approved_line.id}/consensus", params={"direction": "eastbound"})
+        
+        [consensus] = response.json()
+        assert consensus["track_count"] == 4
+        assert consensus["outlier_count"] == 1
+    
+    def test_zero_length_recording_is_not_pending(
+        self, client: TestClient, db: Session, test_user: User, approved_line: Line
+    ):
+        """Should settle a recording whose path has no length instead of retrying it forever."""
+        rng = np.random.default_rng(3)
+        stationary = np.array([[-73.99, 40.73], [-73.99, 40.73]])
+        self._record(db, test_user, approved_line, [noisy_trip(rng, 300) for _ in range(3)] + [stationary])
+        
+        response = client.post(f"/lines/{approved_line.id}/consensus")
+        
+        [consensus] = response.json()
+        assert consensus["track_count"] == 3
+        assert (approved_line.id, "eastbound") not in pending_consensus(db)
+    
+    def test_too_few_recordings(self, client: TestClient, db: Session, test_user: User, approved_line: Line):
+        """Should not propose a path from fewer than CONSENSUS_MIN_TRACKS recordings."""
+        rng = np.random.default_rng(1)
+        self._record(db, test_user, approved_line, [noisy_trip(rng, 300) for _ in range(2)])
+        
+        response = client.post(f"/lines/{approved_line.id}/consensus")
+        
+        assert response.json() == []
+        response = client.post(f"/lines/{approved_line.id}/consensus/apply", params={"direction": "eastbound"})
+        assert response.status_code == 404
+    
+    def test_apply_to_an_existing_route(
+        self, client: TestClient, db: Session, test_user: User, approved_line: Line
+    ):
+        """Should update the line's route in the consensus's direction."""
+        route = Route(line_id=approved_line.id, direction="eastbound")
+        db.add(route)
+        rng = np.random.default_rng(2)
+        self._record(db, test_user, approved_line, [noisy_trip(rng, 300) for _ in range(3)])
+        client.post(f"/lines/{approved_line.id}/consensus")
+        
+        response = client.post(f"/lines/{approved_line.id}/consensus/apply", params={"direction": "eastbound"})
+        
+        assert response.json()["id"] == route.id
+        assert len(response.json()["path"]) > 2
@@ -0,0 +1,125 @@
+"""Tests for conditional GET on the catalog endpoints."""
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from models.line import Line
+from services.etags import not_modified
+
+UPDATED = datetime(2024, 5, 1, 12, 30, 15, 250000)
+LAST_MODIFIED = "Wed, 01 May 2024 12:30:15 GMT"
+
+
+def _request(query: str = "", **headers: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/lines/",
+        "query_string": query.encode(),
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+        "app": FastAPI(version="1.0"),
+    })
+
+
+def _etag(query: str = "", version=(3, UPDATED)) -> str:
+    response = Response()
+    not_modified(_request(query), response, version)
+    return response.headers["etag"]
+
+
+class TestNotModified:
+    """Tests for not_modified"""
+    
+    def test_sets_validators(self):
+        """Should set a strong ETag and the latest updated_at as Last-Modified."""
+        response = Response()
+        
+        assert not_modified(_request(), response, (3, UPDATED), (0, None)) is None
+        assert response.headers["etag"].startswith('"')
+        assert response.headers["last-modified"] == LAST_MODIFIED
+        assert response.headers["cache-control"] == "no-cache"
+    
+    def test_etag_changes_with_the_scope(self):
+        """Should change the ETag when a row changes, a row goes away or the query differs."""
+        etag = _etag()
+        
+        assert _etag() == etag
+        assert _etag(version=(3, datetime(2024, 5, 2))) != etag
+        assert _etag(version=(2, UPDATED)) != etag
+        assert _etag(query="limit=10") != etag
+    
+    @pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"other", {etag}', "*"])
+    def test_if_none_match(self, if_none_match: str):
+        """Should answer 304 when the client has the current ETag."""
+        header = if_none_match.format(etag=_etag())
+        
+        cached = not_modified(_request(if_none_match=header), Response(), (3, UPDATED))
+        
+        assert cached is not None
+        assert cached.status_code == 304
+        assert cached.headers["etag"] == _etag()
+    
+    def test_stale_etag(self):
+        """Should not answer 304 for another ETag, even with a recent If-Modified-Since."""
+        request = _request(if_none_match='"stale"', if_modified_since=LAST_MODIFIED)
+        
+        assert not_modified(request, Response(), (3, UPDATED), modified_since=True) is None
+    
+    def test_if_modified_since(self):
+        """Should compare If-Modified-Since with whole seconds, for single resources only."""
+        current = _request(if_modified_since=LAST_MODIFIED)
+        older = _request(if_modified_since="Wed, 01 May 2024 12:30:14 GMT")
+        
+        assert not_modified(current, Response(), (1, UPDATED), modified_since=True).status_code == 304
+        assert not_modified(older, Response(), (1, UPDATED), modified_since=True) is None
+        assert not_modified(current, Response(), (1, UPDATED)) is None
+        assert not_modified(_request(if_modified_since="garbage"), Response(), (1, UPDATED), modified_since=True) is None
+
+
+class TestConditionalEndpoints:
+    """Tests for ETags on /lines and /routes"""
+    
+    def test_list_lines(self, client: TestClient, approved_line: Line):
+        """Should answer 304 until a line changes."""
+        etag = client.get("/lines/").headers["etag"]
+        
+        cached = client.get("/lines/", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+        
+        client.patch(f"/lines/{approved_line.id}", json={"name": "Renamed"})
+        
+        assert client.get("/lines/", headers={"If-None-Match": etag}).status_code == 200
+    
+    def test_line_detail_follows_its_routes(self, client: TestClient, approved_line: Line):
+        """Should change a line's ETag when one of its routes is added or deleted."""
+        route = client.post("/routes/", json={"line_id": approved_line.id, "direction": "outbound"}).json()
+        response = client.get(f"/lines/{approved_line.id}")
+        etag = response.headers["etag"]
+        
+        assert client.get(f"/lines/{approved_line.id}", headers={"If-None-Match": etag}).status_code == 304
+        assert client.get(
+            f"/lines/{approved_line.id}", headers={"If-Modified-Since": response.headers["last-modified"]}
+        ).status_code == 304
+        
+        client.delete(f"/routes/{route['id']}")
+        
+        assert client.get(f"/lines/{approved_line.id}", headers={"If-None-Match": etag}).status_code == 200
+    
+    def test_route_and_geojson(self, client: TestClient, approved_line: Line):
+        """Should answer 304 for an unchanged route and its GeoJSON, each with its own ETag."""
+        route = client.post("/routes/", json={
+            "line_id": approved_line.id, "direction": "outbound", "path": [[-73.99, 40.7], [-73.98, 40.71]]
+        }).json()
+        
+        detail_etag = client.get(f"/routes/{route['id']}").headers["etag"]
+        geojson_etag = client.get(f"/routes/{route['id']}/geojson").headers["etag"]
+        
+        assert detail_etag != geojson_etag
+        assert client.get(f"/routes/{route['id']}", headers={"If-None-Match": detail_etag}).status_code == 304
+        assert client.get(
+            f"/routes/{route['id']}/geojson", headers={"If-None-Match": geojson_etag}
+        ).status_code == 304
+        assert client.get("/routes/99999").status_code == 404
@@ -0,0 +1,124 @@
+"""Tests for streaming export of recording data."""
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from models.recording import LocationPoint, RecordingSession, SensorReading
+from services.export import encode_blocks
+from services.trajectory import compact_session
+
+COLUMNS = ("id", "timestamp", "speed")
+
+BLOCKS = [
+    [(1, datetime(2026, 10, 17, 8, 0), 5.0), (2, datetime(2026, 10, 17, 8, 0, 1), None)],
+    [(3, datetime(2026, 10, 17, 8, 0, 2), 6.5)],
+]
+
+
+class TestEncodeBlocks:
+    """Tests for encoding row blocks."""
+    
+    def test_ndjson(self):
+        """Should write one JSON object per row, one chunk per block."""
+        chunks = list(encode_blocks(BLOCKS, COLUMNS, "ndjson"))
+        
+        assert len(chunks) == 2
+        lines = b"".join(chunks).decode().splitlines()
+        assert [json.loads(line) for line in lines] == [
+            {"id": 1, "timestamp": "2026-10-17T08:00:00", "speed": 5.0},
+            {"id": 2, "timestamp": "2026-10-17T08:00:01", "speed": None},
+            {"id": 3, "timestamp": "2026-10-17T08:00:02", "speed": 6.5},
+        ]
+    
+    def test_csv(self):
+        """Should write a header row and empty fields for missing values."""
+        body = b"".join(encode_blocks(BLOCKS, COLUMNS, "csv")).decode()
+        
+        rows = list(csv.reader(io.StringIO(body)))
+        assert rows[0] == list(COLUMNS)
+        assert rows[2] == ["2", "2026-10-17T08:00:01", ""]
+        assert len(rows) == 4
+    
+    def test_empty_csv_has_header(self):
+        """Should still write the header when there are no rows."""
+        assert b"".join(encode_blocks([], COLUMNS, "csv")) == b"id,timestamp,speed\r\n"
+
+
+class TestExportEndpoints:
+    """Tests for GET /recordings/{session_id}/locations/export and /sensors/export"""
+    
+    def _add_points(
+        self, db: Session, session: RecordingSession, count: int, offset: timedelta = timedelta(0)
+    ) -> None:
+        for i in range(count):
+            db.add(LocationPoint(
+                session_id=session.id,
+                timestamp=session.started_at + offset + timedelta(seconds=i),
+                latitude=40.7128 + i * 0.0001,
+                longitude=-74.0060,
+                speed=float(i),
+            ))
+        db.commit()
+    
+    def test_export_locations_ndjson(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should stream every point, in time order."""
+        self._add_points(db, recording_session, 25)
+        
+        response = client.get(f"/recordings/{recording_session.id}/locations/export")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["speed"] for row in rows] == [float(i) for i in range(25)]
+    
+    def test_export_compacted_locations_csv(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should include points packed into trajectory chunks."""
+        self._add_points(db, recording_session, 10)
+        compact_session(db, recording_session.id, chunk_size=4)
+        db.commit()
+        self._add_points(db, recording_session, 3, offset=timedelta(minutes=1))
+        
+        response = client.get(
+            f"/recordings/{recording_session.id}/locations/export", params={"format": "csv"}
+        )
+        
+        assert response.status_code == 200
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert len(rows) == 13
+        assert [row["timestamp"] for row in rows] == sorted(row["timestamp"] for row in rows)
+    
+    def test_export_sensors_csv(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should stream sensor readings as CSV."""
+        for i in range(5):
+            db.add(SensorReading(
+                session_id=recording_session.id,
+                timestamp=recording_session.started_at + timedelta(milliseconds=100 * i),
+                accel_x=0.1 * i,
+            ))
+        db.commit()
+        
+        response = client.get(
+            f"/recordings/{recording_session.id}/sensors/export", params={"format": "csv"}
+        )
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert len(rows) == 5
+        assert rows[0]["gyro_x"] == ""
+    
+    def test_export_not_found(self, client: TestClient):
+        """Should return 404 for an unknown session."""
+        response = client.get("/recordings/99999/locations/export")
+        
+        assert response.status_code == 404
@@ -0,0 +1,100 @@
+"""Tests for the GeoJSON endpoints."""
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from models.line import Line
+from services.geojson import GEOJSON_MEDIA_TYPE, parse_bbox
+
+PATH = [[-73.987654321, 40.7], [-73.98, 40.71]]
+OTHER_PATH = [[-73.5, 41.0], [-73.49, 41.01]]
+
+
+class TestParseBbox:
+    """Tests for parse_bbox"""
+    
+    def test_valid(self):
+        """Should parse west,south,east,north."""
+        assert parse_bbox("-74.0,40.7,-73.9,40.8") == (-74.0, 40.7, -73.9, 40.8)
+    
+    @pytest.mark.parametrize("bbox", ["-74,40.7,-73.9", "a,b,c,d", "-73.9,40.7,-74.0,40.8", "0,-91,1,0"])
+    def test_invalid(self, bbox: str):
+        """Should reject malformed, inverted and out of range boxes."""
+        with pytest.raises(HTTPException) as error:
+            parse_bbox(bbox)
+        assert error.value.status_code == 400
+
+
+class TestGeoJSONEndpoints:
+    """Tests for /lines/{line_id}/geojson, /routes/geojson and /routes/{route_id}/geojson"""
+    
+    def _create_route(self, client: TestClient, line: Line, path: list, direction: str = "outbound") -> dict:
+        return client.post(
+            "/routes/", json={"line_id": line.id, "direction": direction, "path": path}
+        ).json()
+    
+    def test_line_collection(self, client: TestClient, approved_line: Line):
+        """Should return every route of the line in one FeatureCollection."""
+        outbound = self._create_route(client, approved_line, PATH)
+        inbound = self._create_route(client, approved_line, PATH[::-1], "inbound")
+        
+        response = client.get(f"/lines/{approved_line.id}/geojson")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == GEOJSON_MEDIA_TYPE
+        data = response.json()
+        assert data["type"] == "FeatureCollection"
+        assert [f["id"] for f in data["features"]] == [outbound["id"], inbound["id"]]
+        feature = data["features"][0]
+        assert feature["properties"]["line_name"] == approved_line.name
+        assert feature["properties"]["direction"] == "outbound"
+        assert feature["geometry"]["type"] == "LineString"
+    
+    def test_line_without_routes(self, client: TestClient, approved_line: Line):
+        """Should return an empty FeatureCollection for a line without routes."""
+        response = client.get(f"/lines/{approved_line.id}/geojson")
+        
+        assert response.json() == {"type": "FeatureCollection", "features": []}
+    
+    def test_line_not_found(self, client: TestClient):
+        """Should return 404 for a missing line."""
+        response = client.get("/lines/99999/geojson")
+        
+        assert response.status_code == 404
+    
+    def test_precision(self, client: TestClient, approved_line: Line):
+        """Should round coordinates to the requested number of decimals."""
+        route = self._create_route(client, approved_line, PATH)
+        
+        response = client.get(f"/routes/{route['id']}/geojson", params={"precision": 3})
+        
+        assert response.json()["geometry"]["coordinates"][0] == [-73.988, 40.7]
+    
+    def test_bbox_collection(self, client: TestClient, approved_line: Line, pending_line: Line):
+        """Should return the routes of approved lines crossing the box."""
+        inside = self._create_route(client, approved_line, PATH)
+        self._create_route(client, approved_line, OTHER_PATH)
+        self._create_route(client, pending_line, PATH)
+        
+        response = client.get("/routes/geojson", params={"bbox": "-74.0,40.69,-73.97,40.72"})
+        
+        assert response.status_code == 200
+        assert [f["id"] for f in response.json()["features"]] == [inside["id"]]
+    
+    def test_route_feature(self, client: TestClient, approved_line: Line):
+        """Should return a single route as a Feature."""
+        route = self._create_route(client, approved_line, PATH)
+        
+        response = client.get(f"/routes/{route['id']}/geojson")
+        
+        data = response.json()
+        assert data["type"] == "Feature"
+        assert data["properties"]["id"] == route["id"]
+        assert data["geometry"]["coordinates"][1] == PATH[1]
+    
+    def test_route_without_path(self, client: TestClient, approved_line: Line):
+        """Should return 404 for a route without a path."""
+        route = client.post("/routes/", json={"line_id": approved_line.id, "direction": "outbound"}).json()
+        
+        assert client.get(f"/routes/{route['id']}/geojson").status_code == 404
+        assert client.get("/routes/99999/geojson").status_code == 404
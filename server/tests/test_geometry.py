@@ -0,0 +1,175 @@
+"""Tests for the page decoding and the encodings of paths."""
+import json
+from datetime import datetime
+
+import numpy as np
+import pytest
+import shapely
+from fastapi.testclient import TestClient
+from geoalchemy2 import WKBElement
+from geoalchemy2.shape import from_shape
+from shapely.geometry import LineString
+
+from models.geometry import GeometryFormat, decode_delta, decode_polyline, encode_delta, encode_polyline
+from models.line import Line
+from models.recording import RecordingSession, RecordingSessionRead, RecordingStatus
+from models.route import Route, RouteCreate, RouteRead, RouteUpdate
+from services.geometry import decode_paths, page_json
+
+PATHS = [
+    [(-73.99, 40.7), (-73.98, 40.71), (-73.97, 40.715)],
+    [(-73.5, 41.0), (-73.49, 41.01)],
+]
+
+# Google's example, points as [lon, lat]
+GOOGLE_PATH = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+GOOGLE_POLYLINE = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def _route(route_id: int, path) -> Route:
+    now = datetime(2024, 5, 1)
+    return Route(id=route_id, line_id=1, direction="outbound", path=path, created_at=now, updated_at=now)
+
+
+class TestDecodePaths:
+    """Tests for decode_paths"""
+    
+    def test_mixed_values(self):
+        """Should decode WKB, extended WKB, hex WKB and shapely values, keeping None."""
+        values = [
+            from_shape(LineString(PATHS[0]), srid=4326),
+            None,
+            WKBElement(shapely.to_wkb(shapely.set_srid(LineString(PATHS[1]), 4326), include_srid=True), extended=True),
+            WKBElement(shapely.to_wkb(LineString(PATHS[1]), hex=True)),
+            LineString(PATHS[0]),
+        ]
+        
+        decoded = decode_paths(values)
+        
+        assert decoded[1] is None
+        for path, expected in zip([decoded[0], decoded[2], decoded[3], decoded[4]], [0, 1, 1, 0]):
+            np.testing.assert_array_equal(path, PATHS[expected])
+    
+    def test_empty_page(self):
+        """Should decode an empty page."""
+        assert decode_paths([]) == []
+
+
+class TestPageJson:
+    """Tests for page_json"""
+    
+    def test_matches_row_by_row(self):
+        """Should give the same routes as validating each row."""
+        routes = [_route(1, from_shape(LineString(PATHS[0]), srid=4326)), _route(2, None)]
+        
+        page = json.loads(page_json(RouteRead, routes, "path"))
+        
+        assert page == [json.loads(RouteRead.model_validate(r).model_dump_json()) for r in routes]
+        assert page[0]["path"] == [list(point) for point in PATHS[0]]
+    
+    def test_recordings(self):
+        """Should decode the computed paths of recording sessions."""
+        session = RecordingSession(
+            id=1,
+            user_id=1,
+            line_id=1,
+            direction="outbound",
+            device_model="Test Device",
+            os_version="1.0",
+            status=RecordingStatus.COMPLETED,
+            started_at=datetime(2024, 5, 1),
+            last_activity_at=datetime(2024, 5, 1),
+            computed_path=from_shape(LineString(PATHS[1]), srid=4326),
+        )
+        
+        page = json.loads(page_json(RecordingSessionRead, [session], "computed_path"))
+        
+        assert page[0]["computed_path"] == [list(point) for point in PATHS[1]]
+        assert page[0]["status"] == "completed"
+
+
+class TestEncodings:
+    """Tests for the polyline and delta encodings"""
+    
+    def test_polyline(self):
+        """Should match Google's reference encoding, latitude first."""
+        assert encode_polyline(np.array(GOOGLE_PATH)) == GOOGLE_POLYLINE
+        np.testing.assert_allclose(decode_polyline(GOOGLE_POLYLINE), GOOGLE_PATH)
+    
+    @pytest.mark.parametrize("precision", [0, 5, 6, 10])
+    def test_round_trip(self, precision: int):
+        """Should give back the coordinates rounded to the precision, without drift."""
+        coords = np.random.default_rng(precision).uniform([-180, -90], [180, 90], size=(500, 2))
+        rounded = np.round(coords * 10 ** precision) / 10 ** precision
+        
+        np.testing.assert_allclose(decode_polyline(encode_polyline(coords, precision), precision), rounded)
+        np.testing.assert_allclose(decode_delta(encode_delta(coords, precision), precision), rounded)
+    
+    def test_delta(self):
+        """Should send the first point, then differences."""
+        assert encode_delta(np.array(GOOGLE_PATH)) == [-12020000, 3850000, -75000, 220000, -550300, 255200]
+    
+    @pytest.mark.parametrize("text", ["_p~iF~ps|U_ulLnnqC_mqNvxq", "_p~iF", " ", "é", "~" * 12 + "?_p~iF"])
+    def test_invalid_polyline(self, text: str):
+        """Should reject truncated, odd and non-polyline strings."""
+        with pytest.raises(ValueError):
+            decode_polyline(text)
+    
+    @pytest.mark.parametrize("values", [[2 ** 70, 0, 1, 1], [2 ** 62, 0, 2 ** 62, 0], [18000001, 0, 0, 0], [1.5, 0, 1, 1]])
+    def test_invalid_delta(self, values: list):
+        """Should reject values that don't fit in int64, overflow when summed or leave the map."""
+        with pytest.raises(ValueError):
+            decode_delta(values)
+    
+    def test_page_formats(self):
+        """Should encode a page's paths in the requested format."""
+        routes = [_route(1, from_shape(LineString(GOOGLE_PATH), srid=4326)), _route(2, None)]
+        
+        polylines = json.loads(page_json(RouteRead, routes, "path", GeometryFormat.POLYLINE))
+        deltas = json.loads(page_json(RouteRead, routes, "path", GeometryFormat.DELTA, 6))
+        
+        assert [r["path"] for r in polylines] == [GOOGLE_POLYLINE, None]
+        assert deltas[0]["path"][:2] == [-120200000, 38500000]
+    
+    def test_encoded_route_input(self):
+        """Should accept encoded paths when creating or updating a route."""
+        created = RouteCreate(line_id=1, direction="outbound", path=GOOGLE_POLYLINE)
+        updated = RouteUpdate(path=[-7399000, 4070000, 1000, 1000], path_precision=5)
+        
+        assert created.path == GOOGLE_PATH
+        assert updated.path == [[-73.99, 40.7], [-73.98, 40.71]]
+        with pytest.raises(ValueError):
+            RouteUpdate(path=GOOGLE_POLYLINE, path_precision=20)
+        with pytest.raises(ValueError):
+            RouteUpdate(path=GOOGLE_POLYLINE, path_precision=None)
+        with pytest.raises(ValueError):
+            RouteUpdate(path=[2 ** 70, 0, 1, 1])
+
+
+class TestGeometryFormatEndpoints:
+    """Tests for geometry_format on the route endpoints"""
+    
+    def test_polyline_round_trip(self, client: TestClient, approved_line: Line):
+        """Should store a route sent as a polyline and send it back in any format."""
+        route = client.post(
+            "/routes/", json={"line_id": approved_line.id, "direction": "outbound", "path": GOOGLE_POLYLINE}
+        ).json()
+        
+        assert route["path"] == GOOGLE_PATH
+        single = client.get(f"/routes/{route['id']}", params={"geometry_format": "polyline"}).json()
+        assert single["path"] == GOOGLE_POLYLINE
+        page = client.get("/routes/", params={"line_id": approved_line.id, "geometry_format": "delta"}).json()
+        assert page[0]["path"] == encode_delta(np.array(GOOGLE_PATH))
+    
+    @pytest.mark.parametrize("payload", [
+        {"path": "_p~iF~ps|U_u"},
+        {"path": "_p~iF~ps|U", "path_precision": None},
+        {"path": [2 ** 70, 0, 1, 1]},
+    ])
+    def test_invalid_encoded_path(self, client: TestClient, approved_line: Line, payload: dict):
+        """Should reject a malformed encoded path or precision."""
+        response = client.post(
+            "/routes/", json={"line_id": approved_line.id, "direction": "outbound", **payload}
+        )
+        
+        assert response.status_code == 422
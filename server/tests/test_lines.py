@@ -69,6 +69,24 @@ class TestListLines:
         assert response.status_code == 200
         data = response.json()
         assert len(data) == 2
+    
+    def test_list_lines_cursor_pagination(
+        self, client: TestClient, approved_line: Line, pending_line: Line
+    ):
+        """Should page through lines with the X-Next-Cursor header."""
+        first = client.get("/lines/", params={"include_all": True, "limit": 1})
+        cursor = first.headers["X-Next-Cursor"]
+        second = client.get("/lines/", params={"include_all": True, "limit": 1, "cursor": cursor})
+        
+        assert second.status_code == 200
+        ids = [first.json()[0]["id"], second.json()[0]["id"]]
+        assert ids == sorted({approved_line.id, pending_line.id})
+    
+    def test_list_lines_invalid_cursor(self, client: TestClient):
+        """Should reject a cursor it did not issue."""
+        response = client.get("/lines/", params={"cursor": "not-a-cursor"})
+        
+        assert response.status_code == 400
 
 
 class TestGetLine:
@@ -0,0 +1,150 @@
+"""Tests for map matching recordings onto routes."""
+from datetime import timedelta
+
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from models.line import Line
+from models.recording import LocationPoint, RecordingSession, RecordingStatus
+from models.route import Route
+from services.map_matching import match_points, pack_match, unmatched_sessions, unpack_match
+
+# Two routes sharing their first kilometer, then one goes on east and the
+# other turns north
+EAST = np.column_stack((np.linspace(-74.0, -73.98, 50), np.full(50, 40.7)))
+NORTH = np.vstack((
+    np.column_stack((np.linspace(-74.0, -73.99, 25), np.full(25, 40.7))),
+    np.column_stack((np.full(25, -73.99), np.linspace(40.7, 40.71, 25))),
+))
+ROUTES = [(1, EAST), (2, NORTH)]
+
+
+def northbound_trip(count: int = 200, noise: float = 0.00004) -> tuple[np.ndarray, np.ndarray]:
+    """GPS fixes along the north route, with a few meters of noise."""
+    rng = np.random.default_rng(42)
+    half = count // 2
+    lon = np.concatenate((np.linspace(-74.0, -73.99, half), np.full(count - half, -73.99)))
+    lat = np.concatenate((np.full(half, 40.7), np.linspace(40.7, 40.709, count - half)))
+    return lon + rng.normal(0, noise, count), lat + rng.normal(0, noise, count)
+
+
+class TestMatchPoints:
+    """Tests for match_points"""
+    
+    def test_follows_the_route_taken(self):
+        """Should match the whole trip, shared part included, to the route it follows."""
+        lon, lat = northbound_trip()
+        
+        result = match_points(lon, lat, None, ROUTES)
+        
+        assert (result.route_id == 2).all()
+        assert np.all(np.diff(result.distance_along) > -20)
+        assert result.distance_along[-1] > 1500
+        assert np.nanmax(np.abs(result.offset)) < 25
+    
+    def test_offset_sign(self):
+        """Should give a positive offset left of the route and a negative one right of it."""
+        lon = np.linspace(-73.999, -73.985, 10)
+        
+        north_of = match_points(lon, np.full(10, 40.7001), None, [(1, EAST)])
+        south_of = match_points(lon, np.full(10, 40.6999), None, [(1, EAST)])
+        
+        assert (north_of.offset > 0).all()
+        assert (south_of.offset < 0).all()
+        np.testing.assert_allclose(north_of.offset, 11.1, atol=0.5)
+    
+    def test_far_fixes_are_unmatched(self):
+        """Should leave fixes far from every route unmatched, and match the others."""
+        result = match_points(
+            np.array([-73.999, -73.5, -73.998]), np.array([40.7, 40.7, 40.7]), None, [(1, EAST)]
+        )
+        
+        assert result.route_id.tolist() == [1, -1, 1]
+        assert np.isnan(result.distance_along[1])
+    
+    def test_no_routes(self):
+        """Should leave every fix unmatched when the line has no routes."""
+        lon, lat = northbound_trip(10)
+        
+        result = match_points(lon, lat, None, [])
+        
+        assert (result.route_id == -1).all()
+    
+    def test_pack_round_trip(self):
+        """Should unpack the timestamps and results that were packed."""
+        lon, lat = northbound_trip(50)
+        timestamps = np.datetime64("2026-10-17T08:00:00", "us") + np.arange(50).astype("timedelta64[s]")
+        result = match_points(lon, lat, None, ROUTES)
+        
+        unpacked_timestamps, unpacked = unpack_match(pack_match(timestamps, result))
+        
+        assert (unpacked_timestamps == timestamps).all()
+        assert (unpacked.route_id == result.route_id).all()
+        np.testing.assert_array_equal(unpacked.offset, result.offset)
+
+
+class TestMatchEndpoints:
+    """Tests for /recordings/{session_id}/match and /recordings/maintenance/match"""
+    
+    def _setup(self, db: Session, line: Line, session: RecordingSession) -> list[Route]:
+        routes = []
+        for direction, coords in (("east", EAST), ("north", NORTH)):
+            route = Route(
+                line_id=line.id,
+                direction=direction,
+                path="SRID=4326;LINESTRING(" + ", ".join(f"{x} {y}" for x, y in coords) + ")",
+            )
+            db.add(route)
+            routes.append(route)
+        lon, lat = northbound_trip()
+        for i, (x, y) in enumerate(zip(lon.tolist(), lat.tolist())):
+            db.add(LocationPoint(
+                session_id=session.id,
+                timestamp=session.started_at + timedelta(seconds=i),
+                latitude=y,
+                longitude=x,
+            ))
+        db.commit()
+        return routes
+    
+    def test_match_and_read_back(
+        self, client: TestClient, db: Session, approved_line: Line, recording_session: RecordingSession
+    ):
+        """Should store the match and return it per point."""
+        east, north = self._setup(db, approved_line, recording_session)
+        
+        response = client.post(f"/recordings/{recording_session.id}/match")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["route_id"] == north.id
+        assert data["point_count"] == data["matched_count"] == 200
+        
+        stored = client.get(f"/recordings/{recording_session.id}/match").json()
+        assert stored["points"] == data["points"]
+        assert {p["route_id"] for p in stored["points"]} == {north.id}
+    
+    def test_not_matched(self, client: TestClient, recording_session: RecordingSession):
+        """Should return 404 for a session without a stored match."""
+        response = client.get(f"/recordings/{recording_session.id}/match")
+        
+        assert response.status_code == 404
+    
+    def test_bulk_matches_completed_sessions(
+        self, client: TestClient, db: Session, approved_line: Line, recording_session: RecordingSession
+    ):
+        """Should match completed sessions once, and again after a route changes."""
+        east, _ = self._setup(db, approved_line, recording_session)
+        recording_session.status = RecordingStatus.COMPLETED
+        recording_session.ended_at = recording_session.started_at + timedelta(minutes=5)
+        db.commit()
+        
+        response = client.post("/recordings/maintenance/match")
+        
+        assert recording_session.id in response.json()["session_ids"]
+        assert recording_session.id not in unmatched_sessions(db)
+        
+        client.patch(f"/routes/{east.id}", json={"color": "#FF0000"})
+        
+        assert recording_session.id in unmatched_sessions(db)
@@ -0,0 +1,120 @@
+"""Tests for compressed request body handling."""
+import gzip
+import json
+
+import pytest
+import zstandard
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from middleware import DECODERS, DecompressRequestMiddleware
+
+
+def _echo_client(max_size: int = 1024 * 1024) -> TestClient:
+    """Client for an app that reports the body it received on /upload."""
+    app = FastAPI()
+    app.add_middleware(DecompressRequestMiddleware, path_pattern=r"^/upload$", max_size=max_size)
+    
+    @app.post("/upload")
+    async def upload(request: Request):
+        body = await request.body()
+        return {"size": len(body), "payload": json.loads(body)}
+    
+    @app.post("/other")
+    async def other(request: Request):
+        return {"size": len(await request.body())}
+    
+    return TestClient(app)
+
+
+PAYLOAD = {"points": [{"latitude": 40.7128, "longitude": -74.0060}] * 50}
+
+
+class TestDecompressRequestMiddleware:
+    """Tests for DecompressRequestMiddleware."""
+    
+    @pytest.mark.parametrize("encoding, compress", [
+        ("gzip", gzip.compress),
+        ("zstd", zstandard.ZstdCompressor().compress),
+    ])
+    def test_decompresses_body(self, encoding, compress):
+        """Should hand the app the decompressed body."""
+        raw = json.dumps(PAYLOAD).encode()
+        
+        response = _echo_client().post(
+            "/upload",
+            content=compress(raw),
+            headers={"Content-Encoding": encoding, "Content-Type": "application/json"}
+        )
+        
+        assert response.status_code == 200
+        assert response.json() == {"size": len(raw), "payload": PAYLOAD}
+    
+    def test_plain_body_passes_through(self):
+        """Should leave uncompressed requests alone."""
+        response = _echo_client().post("/upload", json=PAYLOAD)
+        
+        assert response.status_code == 200
+        assert response.json()["payload"] == PAYLOAD
+    
+    def test_other_paths_are_not_decompressed(self):
+        """Should only decompress bodies on matching paths."""
+        body = gzip.compress(b"{}")
+        
+        response = _echo_client().post(
+            "/other", content=body, headers={"Content-Encoding": "gzip"}
+        )
+        
+        assert response.json()["size"] == len(body)
+    
+    def test_unsupported_encoding(self):
+        """Should reject encodings it cannot decode."""
+        response = _echo_client().post(
+            "/upload", content=b"{}", headers={"Content-Encoding": "br"}
+        )
+        
+        assert response.status_code == 415
+    
+    def test_corrupt_body(self):
+        """Should reject a body that is not valid gzip."""
+        response = _echo_client().post(
+            "/upload", content=b"not gzip at all", headers={"Content-Encoding": "gzip"}
+        )
+        
+        assert response.status_code == 400
+    
+    def test_truncated_body(self):
+        """Should reject a compressed body that ends early."""
+        body = zstandard.ZstdCompressor().compress(json.dumps(PAYLOAD).encode())
+        
+        response = _echo_client().post(
+            "/upload", content=body[:-8], headers={"Content-Encoding": "zstd"}
+        )
+        
+        assert response.status_code == 400
+    
+    @pytest.mark.parametrize("encoding, compress", [
+        ("gzip", gzip.compress),
+        ("zstd", zstandard.ZstdCompressor().compress),
+    ])
+    def test_decompressed_size_limit(self, encoding, compress):
+        """Should reject bodies that inflate past the limit."""
+        response = _echo_client(max_size=1024).post(
+            "/upload",
+            content=compress(b" " * 10 * 1024 * 1024),
+            headers={"Content-Encoding": encoding}
+        )
+        
+        assert response.status_code == 413
+    
+    @pytest.mark.parametrize("encoding, compress", [
+        ("gzip", gzip.compress),
+        ("zstd", zstandard.ZstdCompressor().compress),
+    ])
+    def test_stops_decompressing_at_the_limit(self, encoding, compress):
+        """Should not inflate a body much past the limit before rejecting it."""
+        decoder = DECODERS[encoding]()
+        
+        body = decoder.decompress(compress(b" " * 10 * 1024 * 1024), 1000)
+        
+        assert 1000 < len(body) <= 1000 + 128 * 1024
@@ -0,0 +1,54 @@
+"""Tests for the nearby route search."""
+import pytest
+from fastapi.testclient import TestClient
+
+from models.line import Line
+
+# Three parallel east-west routes, about 111 m, 555 m and 5.5 km north of the point
+POINT = {"longitude": -73.985, "latitude": 40.7}
+PATHS = {
+    "near": [[-73.99, 40.701], [-73.98, 40.701]],
+    "middle": [[-73.99, 40.705], [-73.98, 40.705]],
+    "far": [[-73.99, 40.75], [-73.98, 40.75]],
+}
+
+
+class TestNearbyRoutes:
+    """Tests for /routes/nearby/"""
+    
+    @pytest.fixture
+    def route_ids(self, client: TestClient, approved_line: Line) -> dict[str, int]:
+        return {
+            name: client.post(
+                "/routes/", json={"line_id": approved_line.id, "direction": name, "path": path}
+            ).json()["id"]
+            for name, path in PATHS.items()
+        }
+    
+    def test_nearest_first_within_radius(self, client: TestClient, route_ids: dict[str, int]):
+        """Should return the routes within the radius, nearest first, with their distance."""
+        response = client.get("/routes/nearby/", params={**POINT, "radius_meters": 1000})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert [r["id"] for r in data] == [route_ids["near"], route_ids["middle"]]
+        assert data[0]["distance_meters"] == pytest.approx(111, abs=2)
+        assert data[1]["distance_meters"] == pytest.approx(555, abs=5)
+    
+    def test_closest_point(self, client: TestClient, route_ids: dict[str, int]):
+        """Should give the point of each route closest to the search point."""
+        data = client.get("/routes/nearby/", params=POINT).json()
+        
+        assert data[0]["closest_point"] == pytest.approx([-73.985, 40.701])
+    
+    def test_limit(self, client: TestClient, route_ids: dict[str, int]):
+        """Should return at most `limit` routes, the nearest ones."""
+        data = client.get("/routes/nearby/", params={**POINT, "radius_meters": 10000, "limit": 1}).json()
+        
+        assert [r["id"] for r in data] == [route_ids["near"]]
+    
+    def test_invalid_coordinates(self, client: TestClient):
+        """Should reject coordinates out of range."""
+        response = client.get("/routes/nearby/", params={"longitude": 200, "latitude": 40.7})
+        
+        assert response.status_code == 422
@@ -0,0 +1,35 @@
+"""Tests for keyset pagination cursors."""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, Response
+
+from services.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, set_next_cursor
+
+
+class TestCursors:
+    """Tests for encoding and decoding cursors."""
+    
+    def test_round_trip(self):
+        """Should decode the values it encoded."""
+        values = (datetime(2026, 10, 17, 8, 30, 0, 125000), 42)
+        
+        assert decode_cursor(encode_cursor(*values), (datetime, int)) == values
+    
+    @pytest.mark.parametrize("cursor", ["garbage!", encode_cursor(1, 2), encode_cursor("x")])
+    def test_invalid_cursor(self, cursor):
+        """Should reject cursors that don't decode to the expected key."""
+        with pytest.raises(HTTPException) as exc:
+            decode_cursor(cursor, (int,))
+        
+        assert exc.value.status_code == 400
+    
+    def test_next_cursor_only_for_full_pages(self):
+        """Should only send a cursor when there may be more rows."""
+        full, short = Response(), Response()
+        
+        set_next_cursor(full, [1, 2], 2, lambda item: (item,))
+        set_next_cursor(short, [1], 2, lambda item: (item,))
+        
+        assert decode_cursor(full.headers[NEXT_CURSOR_HEADER], (int,)) == (2,)
+        assert NEXT_CURSOR_HEADER not in short.headers
@@ -0,0 +1,109 @@
+"""Tests for monthly partition maintenance of the recording data tables."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models.recording import LocationPoint, RecordingSession
+from services.partitions import (
+    add_months,
+    detach_partitions,
+    ensure_partitions,
+    list_partitions,
+    month_start,
+    outside_session_window,
+    session_time_bounds,
+)
+
+
+class TestMonthHelpers:
+    """Tests for the month arithmetic helpers."""
+    
+    def test_month_start(self):
+        assert month_start(datetime(2026, 10, 17, 13, 45)) == datetime(2026, 10, 1)
+    
+    def test_add_months_across_years(self):
+        assert add_months(datetime(2026, 11, 1), 3) == datetime(2027, 2, 1)
+        assert add_months(datetime(2026, 1, 1), -1) == datetime(2025, 12, 1)
+    
+    def test_session_time_bounds(self):
+        """Should widen the session's time range by the pruning margin."""
+        lower, upper = session_time_bounds(datetime(2026, 10, 17), datetime(2026, 10, 18))
+        
+        assert lower < datetime(2026, 10, 17)
+        assert upper > datetime(2026, 10, 18)
+    
+    def test_outside_session_window(self):
+        """Should accept only timestamps that the session's time bounds keep once it ends."""
+        now = datetime.utcnow()
+        started_at = now - timedelta(hours=1)
+        
+        assert outside_session_window(started_at, [started_at, now]) is None
+        assert outside_session_window(started_at, []) is None
+        assert outside_session_window(started_at, [now, now - timedelta(days=3)]) == now - timedelta(days=3)
+        assert outside_session_window(started_at, [now + timedelta(days=3)]) == now + timedelta(days=3)
+        
+        # Abandoned sessions end at their last recorded activity, a little before the last upload
+        lower, upper = session_time_bounds(started_at, now - timedelta(minutes=1))
+        accepted = [started_at - timedelta(hours=11), now + timedelta(hours=11)]
+        assert outside_session_window(started_at, accepted) is None
+        assert all(lower <= t <= upper for t in accepted)
+
+
+class TestPartitionMaintenance:
+    """Tests for ensure_partitions and detach_partitions."""
+    
+    def test_ensure_partitions_creates_months_ahead(self, db: Session):
+        """Should create the current month and the requested months ahead."""
+        created = ensure_partitions(db, months_ahead=2, now=datetime(2031, 5, 20))
+        
+        assert "location_points_2031_05" in created
+        assert "sensor_readings_2031_07" in created
+        names = [p.name for p in list_partitions(db, "location_points")]
+        assert {"location_points_2031_05", "location_points_2031_06", "location_points_2031_07"} <= set(names)
+        
+        # Running it again is a no-op
+        assert ensure_partitions(db, months_ahead=2, now=datetime(2031, 5, 20)) == []
+    
+    def test_rows_in_default_partition_are_moved(
+        self, db: Session, recording_session: RecordingSession
+    ):
+        """Should move rows caught by the default partition into a new month's partition."""
+        db.add(LocationPoint(
+            session_id=recording_session.id,
+            timestamp=datetime(2035, 3, 10, 8, 0),
+            latitude=40.7128,
+            longitude=-74.0060,
+        ))
+        db.flush()
+        
+        ensure_partitions(db, months_ahead=0, now=datetime(2035, 3, 1))
+        
+        partition = db.execute(
+            text('SELECT tableoid::regclass::text FROM location_points WHERE "timestamp" = :timestamp'),
+            {"timestamp": datetime(2035, 3, 10, 8, 0)}
+        ).scalar()
+        assert partition == "location_points_2035_03"
+    
+    def test_detach_old_partitions(self, db: Session):
+        """Should detach partitions that end before the cutoff and keep the rest."""
+        ensure_partitions(db, months_ahead=1, now=datetime(2000, 1, 1))
+        
+        detached = detach_partitions(db, before=datetime(2000, 2, 1))
+        
+        assert "location_points_2000_01" in detached
+        assert "sensor_readings_2000_01" in detached
+        names = [p.name for p in list_partitions(db, "location_points")]
+        assert "location_points_2000_01" not in names
+        assert "location_points_2000_02" in names
+        # Detached partitions are kept as standalone tables
+        assert db.execute(text("SELECT to_regclass('location_points_2000_01')")).scalar() is not None
+    
+    def test_drop_old_partitions(self, db: Session):
+        """Should drop old partitions when asked to."""
+        ensure_partitions(db, months_ahead=0, now=datetime(2000, 1, 1))
+        
+        dropped = detach_partitions(db, before=datetime(2000, 2, 1), drop=True)
+        
+        assert "location_points_2000_01" in dropped
+        assert db.execute(text("SELECT to_regclass('location_points_2000_01')")).scalar() is None
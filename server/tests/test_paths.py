@@ -0,0 +1,68 @@
+"""Tests for incrementally maintained session paths."""
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from models.recording import RecordingSession
+
+
+def _points(start: datetime, seconds: range) -> list[dict]:
+    return [
+        {
+            "timestamp": (start + timedelta(seconds=s)).isoformat(),
+            "latitude": 40.7128,
+            "longitude": -74.0060 + s * 0.001,
+        }
+        for s in seconds
+    ]
+
+
+class TestIncrementalPath:
+    """Tests for computed_path being extended as points arrive."""
+    
+    def test_path_grows_while_in_progress(
+        self, client: TestClient, recording_session: RecordingSession
+    ):
+        """Should expose the partial path of an in-progress session."""
+        start = datetime.utcnow()
+        url = f"/recordings/{recording_session.id}"
+        
+        client.post(f"{url}/locations/batch", json={"points": _points(start, range(1))})
+        assert client.get(url).json()["computed_path"] is None
+        
+        client.post(f"{url}/locations/batch", json={"points": _points(start, range(1, 4))})
+        data = client.get(url).json()
+        assert len(data["computed_path"]) == 4
+        assert data["path_end_at"] == (start + timedelta(seconds=3)).isoformat()
+        
+        client.post(f"{url}/locations", json=_points(start, range(4, 5))[0])
+        assert len(client.get(url).json()["computed_path"]) == 5
+    
+    def test_out_of_order_batch(
+        self, client: TestClient, recording_session: RecordingSession
+    ):
+        """Should put points from a late batch in timestamp order."""
+        start = datetime.utcnow()
+        url = f"/recordings/{recording_session.id}"
+        
+        client.post(f"{url}/locations/batch", json={"points": _points(start, range(5, 8))})
+        client.post(f"{url}/locations/batch", json={"points": _points(start, range(0, 3))})
+        
+        path = client.get(url).json()["computed_path"]
+        longitudes = [lon for lon, _ in path]
+        assert len(path) == 6
+        assert longitudes == sorted(longitudes)
+    
+    def test_end_keeps_incremental_path(
+        self, client: TestClient, recording_session: RecordingSession
+    ):
+        """Should end the session with the path built from all batches."""
+        start = datetime.utcnow()
+        url = f"/recordings/{recording_session.id}"
+        for first in range(0, 9, 3):
+            client.post(f"{url}/locations/batch", json={"points": _points(start, range(first, first + 3))})
+        
+        response = client.post(f"{url}/end")
+        
+        assert response.status_code == 200
+        assert len(response.json()["computed_path"]) == 9
@@ -1,8 +1,12 @@
 """Tests for the recordings API endpoints."""
+import gzip
+import json
 from datetime import datetime, timedelta
+from pathlib import Path
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
 from models.line import Line, LineStatus
@@ -13,6 +17,8 @@ from models.recording import (
     SensorReading,
 )
 from models.user import User
+from services.cleanup import CLEANUP_LOCK_KEY
+from services.spool import IngestSpool
 
 
 class TestStartRecording:
@@ -113,6 +119,27 @@ class TestListRecordings:
         assert response.status_code == 200
         data = response.json()
         assert all(r["status"] == "completed" for r in data)
+    
+    def test_list_recordings_cursor_pagination(
+        self,
+        client: TestClient,
+        recording_session: RecordingSession,
+        completed_recording: RecordingSession
+    ):
+        """Should page through sessions, newest first, with the X-Next-Cursor header."""
+        first = client.get("/recordings/", params={"limit": 1})
+        second = client.get(
+            "/recordings/", params={"limit": 1, "cursor": first.headers["X-Next-Cursor"]}
+        )
+        
+        assert [first.json()[0]["id"], second.json()[0]["id"]] == [
+            completed_recording.id, recording_session.id
+        ]
+        third = client.get(
+            "/recordings/", params={"limit": 1, "cursor": second.headers["X-Next-Cursor"]}
+        )
+        assert third.json() == []
+        assert "X-Next-Cursor" not in third.headers
 
 
 class TestEndRecording:
@@ -137,6 +164,39 @@ class TestEndRecording:
         
         assert response.status_code == 400
         assert "not in progress" in response.json()["detail"]
+    
+    def test_end_recording_drains_spool(
+        self,
+        client: TestClient,
+        db: Session,
+        recording_session: RecordingSession,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        """Should write the session's spooled batches before completing its path."""
+        spool = IngestSpool(tmp_path, session_factory=lambda: Session(bind=db.connection()))
+        monkeypatch.setattr("routes.recordings.get_spool", lambda: spool)
+        now = datetime.utcnow()
+        points = [
+            {
+                "timestamp": (now + timedelta(seconds=i)).isoformat(),
+                "latitude": 40.7128,
+                "longitude": -74.0060 + (i * 0.0001),
+            }
+            for i in range(3)
+        ]
+        
+        spooled = client.post(
+            f"/recordings/{recording_session.id}/locations/batch",
+            json={"points": points}
+        )
+        response = client.post(f"/recordings/{recording_session.id}/end")
+        
+        assert spooled.status_code == 202
+        assert response.status_code == 200
+        assert len(response.json()["computed_path"]) == 3
+        assert spool.stats()["depth"] == 0
+        spool.close()
 
 
 class TestCancelRecording:
@@ -181,6 +241,29 @@ class TestLocationBatchUpload:
         assert data["added"] == 10
         assert data["session_id"] == recording_session.id
     
+    def test_upload_gzip_batch(
+        self, client: TestClient, recording_session: RecordingSession
+    ):
+        """Should accept a gzip-compressed batch."""
+        now = datetime.utcnow()
+        points = [
+            {
+                "timestamp": (now + timedelta(seconds=i)).isoformat(),
+                "latitude": 40.7128,
+                "longitude": -74.0060 + (i * 0.0001),
+            }
+            for i in range(5)
+        ]
+        
+        response = client.post(
+            f"/recordings/{recording_session.id}/locations/batch",
+            content=gzip.compress(json.dumps({"points": points}).encode()),
+            headers={"Content-Encoding": "gzip", "Content-Type": "application/json"}
+        )
+        
+        assert response.status_code == 201
+        assert response.json()["added"] == 5
+    
     def test_upload_empty_batch(
         self, client: TestClient, recording_session: RecordingSession
     ):
@@ -228,6 +311,220 @@ class TestLocationBatchUpload:
         
         db.refresh(recording_session)
         assert recording_session.last_activity_at >= original_activity
+    
+    def test_upload_after_end_is_rejected(
+        self, client: TestClient, recording_session: RecordingSession
+    ):
+        """Should not keep accepting uploads from cached state once the session ends."""
+        point = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "latitude": 40.7128,
+            "longitude": -74.0060,
+        }
+        client.post(
+            f"/recordings/{recording_session.id}/locations/batch",
+            json={"points": [point]}
+        )
+        client.post(f"/recordings/{recording_session.id}/end")
+        
+        response = client.post(
+            f"/recordings/{recording_session.id}/locations/batch",
+            json={"points": [{**point, "timestamp": datetime.utcnow().isoformat()}]}
+        )
+        
+        assert response.status_code == 400
+    
+    def test_batch_builds_point_geometry(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should store a PostGIS point matching each uploaded coordinate."""
+        now = datetime.utcnow()
+        points = [
+            {
+                "timestamp": (now + timedelta(seconds=i)).isoformat(),
+                "latitude": 40.7128 + (i * 0.0001),
+                "longitude": -74.0060,
+                "altitude": None,
+                "bearing": 90.0,
+            }
+            for i in range(3)
+        ]
+        
+        response = client.post(
+            f"/recordings/{recording_session.id}/locations/batch",
+            json={"points": points}
+        )
+        
+        assert response.status_code == 201
+        
+        rows = db.execute(
+            select(
+                func.ST_X(LocationPoint.point),
+                func.ST_Y(LocationPoint.point),
+                LocationPoint.altitude,
+                LocationPoint.bearing,
+            )
+            .where(LocationPoint.session_id == recording_session.id)
+            .order_by(LocationPoint.timestamp)
+        ).all()
+        
+        assert len(rows) == 3
+        for i, (x, y, altitude, bearing) in enumerate(rows):
+            assert x == pytest.approx(-74.0060)
+            assert y == pytest.approx(40.7128 + (i * 0.0001))
+            assert altitude is None
+            assert bearing == 90.0
+    
+    def test_overlapping_batch_skips_stored_points(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should skip points already stored for the same timestamp."""
+        now = datetime.utcnow()
+        points = [
+            {
+                "timestamp": (now + timedelta(seconds=i)).isoformat(),
+                "latitude": 40.7128,
+                "longitude": -74.0060 + (i * 0.0001),
+            }
+            for i in range(6)
+        ]
+        
+        client.post(
+            f"/recordings/{recording_session.id}/locations/batch",
+            json={"points": points[:4]}
+        )
+        response = client.post(
+            f"/recordings/{recording_session.id}/locations/batch",
+            json={"points": points[2:]}
+        )
+        
+        assert response.status_code == 201
+        data = response.json()
+        assert data["added"] == 2
+        assert data["duplicates"] == 2
+        
+        count = db.execute(
+            select(func.count())
+            .select_from(LocationPoint)
+            .where(LocationPoint.session_id == recording_session.id)
+        ).scalar()
+        assert count == 6
+    
+    def test_batches_with_utc_offsets(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should store timestamps sent with a UTC offset as naive UTC, batch after batch."""
+        start = datetime.utcnow().replace(microsecond=0)
+        points = [
+            {
+                "timestamp": (start + timedelta(seconds=i)).isoformat() + "Z",
+                "latitude": 40.7128,
+                "longitude": -74.0060 + (i * 0.0001),
+            }
+            for i in range(6)
+        ]
+        
+        first = client.post(
+            f"/recordings/{recording_session.id}/locations/batch",
+            json={"points": points[:3]}
+        )
+        second = client.post(
+            f"/recordings/{recording_session.id}/locations/batch",
+            json={"points": points[3:]}
+        )
+        
+        assert first.status_code == 201
+        assert second.status_code == 201
+        assert second.json()["added"] == 3
+        
+        last = db.execute(
+            select(func.max(LocationPoint.timestamp))
+            .where(LocationPoint.session_id == recording_session.id)
+        ).scalar()
+        assert last == start + timedelta(seconds=5)
+    
+    def test_timestamps_outside_session_are_rejected(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should refuse a batch with points the session's reads would not find."""
+        now = datetime.utcnow()
+        points = [
+            {
+                "timestamp": timestamp.isoformat(),
+                "latitude": 40.7128,
+                "longitude": -74.0060,
+            }
+            for timestamp in (now, now - timedelta(days=3))
+        ]
+        
+        response = client.post(
+            f"/recordings/{recording_session.id}/locations/batch",
+            json={"points": points}
+        )
+        
+        assert response.status_code == 422
+        assert "device clock" in response.json()["detail"]
+        count = db.execute(
+            select(func.count())
+            .select_from(LocationPoint)
+            .where(LocationPoint.session_id == recording_session.id)
+        ).scalar()
+        assert count == 0
+    
+    def test_retried_batch_id_is_replayed(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should answer a retry with the original result without writing again."""
+        now = datetime.utcnow()
+        batch = {
+            "batch_id": "device-1-batch-7",
+            "points": [
+                {
+                    "timestamp": (now + timedelta(seconds=i)).isoformat(),
+                    "latitude": 40.7128,
+                    "longitude": -74.0060,
+                }
+                for i in range(3)
+            ],
+        }
+        
+        first = client.post(
+            f"/recordings/{recording_session.id}/locations/batch", json=batch
+        )
+        retry = client.post(
+            f"/recordings/{recording_session.id}/locations/batch", json=batch
+        )
+        
+        assert first.status_code == 201
+        assert first.json()["replayed"] is False
+        assert retry.status_code == 201
+        assert retry.json()["replayed"] is True
+        assert retry.json()["added"] == 3
+        assert retry.json()["batch_id"] == "device-1-batch-7"
+        
+        count = db.execute(
+            select(func.count())
+            .select_from(LocationPoint)
+            .where(LocationPoint.session_id == recording_session.id)
+        ).scalar()
+        assert count == 3
+    
+    def test_retried_single_point_returns_stored_point(
+        self, client: TestClient, recording_session: RecordingSession
+    ):
+        """Should return the stored point when the same point is uploaded twice."""
+        point = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "latitude": 40.7128,
+            "longitude": -74.0060,
+        }
+        
+        first = client.post(f"/recordings/{recording_session.id}/locations", json=point)
+        retry = client.post(f"/recordings/{recording_session.id}/locations", json=point)
+        
+        assert first.status_code == 201
+        assert retry.status_code == 201
+        assert retry.json()["id"] == first.json()["id"]
 
 
 class TestSensorBatchUpload:
@@ -259,6 +556,100 @@ class TestSensorBatchUpload:
         assert response.status_code == 201
         data = response.json()
         assert data["added"] == 20
+    
+    def test_upload_columnar_sensor_batch(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should accept one array per channel instead of a list of readings."""
+        now = datetime.utcnow()
+        response = client.post(
+            f"/recordings/{recording_session.id}/sensors/batch",
+            json={
+                "timestamp": [(now + timedelta(milliseconds=i * 20)).isoformat() for i in range(50)],
+                "accel_x": [0.1 * i for i in range(50)],
+                "accel_z": [9.8] * 50,
+                "magnetic_heading": [None] + [180.0] * 49,
+            }
+        )
+        
+        assert response.status_code == 201
+        data = response.json()
+        assert data["added"] == 50
+        
+        readings = db.execute(
+            select(SensorReading)
+            .where(SensorReading.session_id == recording_session.id)
+            .order_by(SensorReading.timestamp)
+        ).scalars().all()
+        assert len(readings) == 50
+        assert readings[0].magnetic_heading is None
+        assert readings[1].accel_x == pytest.approx(0.1)
+        assert readings[1].gyro_x is None
+    
+    def test_columnar_batch_skips_stored_readings(
+        self, client: TestClient, recording_session: RecordingSession
+    ):
+        """Should count readings already stored for the same timestamp as duplicates."""
+        now = datetime.utcnow()
+        batch = {
+            "timestamp": [(now + timedelta(milliseconds=i * 20)).isoformat() for i in range(4)],
+            "accel_x": [0.1, 0.2, 0.3, 0.4],
+        }
+        
+        client.post(f"/recordings/{recording_session.id}/sensors/batch", json=batch)
+        response = client.post(f"/recordings/{recording_session.id}/sensors/batch", json=batch)
+        
+        assert response.status_code == 201
+        assert response.json()["added"] == 0
+        assert response.json()["duplicates"] == 4
+    
+    def test_columnar_batch_with_utc_offsets(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should store columnar timestamps sent with a UTC offset as naive UTC."""
+        start = datetime.utcnow().replace(microsecond=0)
+        response = client.post(
+            f"/recordings/{recording_session.id}/sensors/batch",
+            json={
+                "timestamp": [
+                    (start + timedelta(hours=2)).isoformat() + "+02:00",
+                    (start + timedelta(seconds=1)).isoformat() + "Z",
+                ],
+                "accel_x": [0.1, 0.2],
+            }
+        )
+        
+        assert response.status_code == 201
+        timestamps = db.execute(
+            select(SensorReading.timestamp)
+            .where(SensorReading.session_id == recording_session.id)
+            .order_by(SensorReading.timestamp)
+        ).scalars().all()
+        assert timestamps == [start, start + timedelta(seconds=1)]
+    
+    def test_columnar_batch_length_mismatch(
+        self, client: TestClient, recording_session: RecordingSession
+    ):
+        """Should reject channels with a different length than timestamp."""
+        now = datetime.utcnow().isoformat()
+        response = client.post(
+            f"/recordings/{recording_session.id}/sensors/batch",
+            json={"timestamp": [now, now], "accel_x": [0.1]}
+        )
+        
+        assert response.status_code == 422
+    
+    def test_columnar_batch_heading_out_of_range(
+        self, client: TestClient, recording_session: RecordingSession
+    ):
+        """Should reject magnetic_heading values outside [0, 360)."""
+        now = datetime.utcnow().isoformat()
+        response = client.post(
+            f"/recordings/{recording_session.id}/sensors/batch",
+            json={"timestamp": [now, now], "magnetic_heading": [10.0, 360.0]}
+        )
+        
+        assert response.status_code == 422
 
 
 class TestGetLocationPoints:
@@ -295,6 +686,32 @@ class TestGetLocationPoints:
         assert response.status_code == 200
         data = response.json()
         assert len(data) == 3
+    
+    def test_get_locations_cursor_pagination(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should return the points after the cursor, without gaps or repeats."""
+        start = datetime.utcnow()
+        for i in range(5):
+            db.add(LocationPoint(
+                session_id=recording_session.id,
+                timestamp=start + timedelta(seconds=i),
+                latitude=40.7128,
+                longitude=-74.0060 + i * 0.001,
+            ))
+        db.commit()
+        
+        url = f"/recordings/{recording_session.id}/locations"
+        pages = [client.get(url, params={"limit": 2})]
+        while "X-Next-Cursor" in pages[-1].headers:
+            pages.append(client.get(
+                url, params={"limit": 2, "cursor": pages[-1].headers["X-Next-Cursor"]}
+            ))
+        
+        timestamps = [p["timestamp"] for page in pages for p in page.json()]
+        assert len(pages) == 3
+        assert timestamps == sorted(timestamps)
+        assert len(set(timestamps)) == 5
 
 
 class TestStaleSessionCleanup:
@@ -342,6 +759,76 @@ class TestStaleSessionCleanup:
         assert response.status_code == 200
         data = response.json()
         assert recording_session.id not in data["session_ids"]
+    
+    def _stale_sessions(self, db: Session, user: User, line: Line, count: int) -> list[RecordingSession]:
+        sessions = [
+            RecordingSession(
+                user_id=user.id,
+                line_id=line.id,
+                status=RecordingStatus.IN_PROGRESS,
+                started_at=datetime.utcnow() - timedelta(minutes=90),
+                last_activity_at=datetime.utcnow() - timedelta(minutes=60),
+            )
+            for _ in range(count)
+        ]
+        db.add_all(sessions)
+        db.commit()
+        return sessions
+    
+    def test_cleanup_in_chunks(
+        self, client: TestClient, db: Session, test_user: User, approved_line: Line
+    ):
+        """Should process stale sessions chunk by chunk and report what is left."""
+        self._stale_sessions(db, test_user, approved_line, 5)
+        
+        response = client.post(
+            "/recordings/cleanup/stale",
+            params={"inactive_minutes": 30, "chunk_size": 2, "max_chunks": 2}
+        )
+        
+        data = response.json()
+        assert data["chunks"] == 2
+        assert data["abandoned_count"] == 4
+        assert data["remaining"] == 1
+        
+        data = client.post("/recordings/cleanup/stale", params={"inactive_minutes": 30}).json()
+        assert data["abandoned_count"] == 1
+        assert data["remaining"] == 0
+    
+    def test_cleanup_builds_paths(
+        self, client: TestClient, db: Session, test_user: User, approved_line: Line
+    ):
+        """Should build the path of a stale session from its points."""
+        session = self._stale_sessions(db, test_user, approved_line, 1)[0]
+        for i in range(3):
+            db.add(LocationPoint(
+                session_id=session.id,
+                timestamp=session.started_at + timedelta(seconds=i),
+                latitude=40.7128,
+                longitude=-74.0060 + i * 0.001,
+            ))
+        db.commit()
+        
+        client.post("/recordings/cleanup/stale", params={"inactive_minutes": 30})
+        
+        data = client.get(f"/recordings/{session.id}").json()
+        assert data["status"] == "abandoned"
+        assert len(data["computed_path"]) == 3
+    
+    def test_cleanup_skips_when_locked(
+        self, client: TestClient, db: Session, test_user: User, approved_line: Line
+    ):
+        """Should leave the work to a worker already running the cleanup."""
+        self._stale_sessions(db, test_user, approved_line, 1)
+        
+        with db.get_bind().connect() as other_worker:
+            other_worker.execute(select(func.pg_advisory_lock(CLEANUP_LOCK_KEY)))
+            data = client.post("/recordings/cleanup/stale", params={"inactive_minutes": 30}).json()
+            other_worker.execute(select(func.pg_advisory_unlock(CLEANUP_LOCK_KEY)))
+        
+        assert data["locked_out"] is True
+        assert data["abandoned_count"] == 0
+        assert data["remaining"] >= 1
 
 
 class TestResumeRecording:
@@ -0,0 +1,175 @@
+"""Tests for the in-memory route index."""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from geoalchemy2.shape import from_shape
+from shapely.geometry import LineString
+from sqlalchemy.orm import Session
+
+import routes.lines
+import routes.routes
+from models.line import Line, LineStatus
+from models.route import Route
+from services.route_index import _ORIGIN, RouteIndex
+
+# Parallel east-west routes about 111 m, 555 m and 5.5 km north of the point
+POINT = (-73.985, 40.7)
+PATHS = {
+    1: [(-73.99, 40.701), (-73.98, 40.701)],
+    2: [(-73.99, 40.705), (-73.98, 40.705)],
+    3: [(-73.99, 40.75), (-73.98, 40.75)],
+}
+
+
+class FakeCatalog:
+    """Stands in for the database query of RouteIndex: rows of (route, line name, status, shape)."""
+    
+    def __init__(self):
+        self.routes: dict[int, tuple[list, LineStatus, int]] = {}
+    
+    def add(self, route_id: int, path: list, status: LineStatus = LineStatus.APPROVED, line_id: int = 1):
+        self.routes[route_id] = (path, status, line_id)
+    
+    def rows(self, db, route_ids=None, line_id=None):
+        rows = []
+        for route_id, (path, status, route_line_id) in sorted(self.routes.items()):
+            if route_ids is not None and route_id not in route_ids:
+                continue
+            if line_id is not None and route_line_id != line_id:
+                continue
+            route = Route(
+                id=route_id,
+                line_id=route_line_id,
+                direction="outbound",
+                path=from_shape(LineString(path), srid=4326),
+            )
+            rows.append((route, "Line 42", status, LineString(path)))
+        return rows
+
+
+@pytest.fixture
+def catalog() -> FakeCatalog:
+    catalog = FakeCatalog()
+    for route_id, path in PATHS.items():
+        catalog.add(route_id, path)
+    return catalog
+
+
+@pytest.fixture
+def index(monkeypatch, catalog: FakeCatalog) -> RouteIndex:
+    index = RouteIndex(rebuild_after=4)
+    monkeypatch.setattr(index, "_load_entries", catalog.rows)
+    index.load(None)
+    return index
+
+
+class TestRouteIndex:
+    """Tests for RouteIndex"""
+    
+    def test_nearby(self, index: RouteIndex):
+        """Should return the routes within the radius, nearest first, with distances and closest points."""
+        data = json.loads(index.nearby(*POINT, radius_meters=1000, limit=20))
+        
+        assert [r["id"] for r in data] == [1, 2]
+        assert data[0]["distance_meters"] == pytest.approx(111, abs=2)
+        assert data[1]["distance_meters"] == pytest.approx(555, abs=5)
+        assert data[0]["closest_point"] == pytest.approx([-73.985, 40.701])
+        assert data[0]["line_id"] == 1
+    
+    def test_nearby_limit(self, index: RouteIndex):
+        """Should return at most `limit` routes, the nearest ones."""
+        data = json.loads(index.nearby(*POINT, radius_meters=10000, limit=1))
+        
+        assert [r["id"] for r in data] == [1]
+        assert json.loads(index.nearby(0, 0, radius_meters=1000, limit=20)) == []
+    
+    def test_bbox_only_approved(self, index: RouteIndex, catalog: FakeCatalog):
+        """Should return the Features of approved routes crossing the box, by id."""
+        catalog.add(4, PATHS[1], status=LineStatus.PENDING, line_id=2)
+        index.load(None)
+        
+        data = json.loads(index.bbox(-74.0, 40.69, -73.97, 40.72))
+        
+        assert data["type"] == "FeatureCollection"
+        assert [f["id"] for f in data["features"]] == [1, 2]
+        assert data["features"][0]["properties"]["line_name"] == "Line 42"
+        assert data["features"][0]["geometry"]["coordinates"] == [list(c) for c in PATHS[1]]
+    
+    def test_refresh_moves_and_drops_routes(self, index: RouteIndex, catalog: FakeCatalog):
+        """Should answer with the new version of changed routes and forget deleted ones."""
+        catalog.add(3, [(-73.99, 40.7005), (-73.98, 40.7005)])
+        del catalog.routes[1]
+        
+        index.refresh(None, route_ids=[1, 3])
+        
+        data = json.loads(index.nearby(*POINT, radius_meters=1000, limit=20))
+        assert [r["id"] for r in data] == [3, 2]
+        assert index.stats()["routes"] == 2
+    
+    def test_refresh_line(self, index: RouteIndex, catalog: FakeCatalog):
+        """Should reload every route of a line, dropping the ones that are gone."""
+        catalog.routes.clear()
+        
+        index.refresh(None, line_id=1)
+        
+        assert json.loads(index.nearby(*POINT, radius_meters=10000, limit=20)) == []
+    
+    def test_rebuilds_after_many_changes(self, index: RouteIndex, catalog: FakeCatalog):
+        """Should fold changed routes back into the tree once enough have piled up."""
+        index.refresh(None, route_ids=[1, 2])
+        assert index.stats()["pending"] == 2
+        
+        index.refresh(None, route_ids=[3])
+        
+        assert index.stats() == {"ready": True, "routes": 3, "pending": 0, "stale": 0}
+        assert [r["id"] for r in json.loads(index.nearby(*POINT, radius_meters=1000, limit=20))] == [1, 2]
+    
+    def test_ignores_own_notifications(self, index: RouteIndex, catalog: FakeCatalog):
+        """Should not reload routes on its own notifications, which it has applied already."""
+        del catalog.routes[1]
+        
+        index._apply(json.dumps({"origin": _ORIGIN, "routes": [1], "line": None}))
+        
+        assert index.stats()["routes"] == 3
+
+
+class TestRouteIndexEndpoints:
+    """Tests for /routes/nearby/ and /routes/geojson served from the index"""
+    
+    @pytest.fixture
+    def index(self, monkeypatch, db: Session) -> RouteIndex:
+        index = RouteIndex()
+        index.load(db)
+        monkeypatch.setattr(routes.routes, "route_index", index)
+        monkeypatch.setattr(routes.lines, "route_index", index)
+        return index
+    
+    def test_nearby_follows_writes(self, client: TestClient, approved_line: Line, index: RouteIndex):
+        """Should serve created, moved and deleted routes without a reload."""
+        near = client.post(
+            "/routes/", json={"line_id": approved_line.id, "direction": "outbound", "path": PATHS[2]}
+        ).json()
+        params = {"longitude": POINT[0], "latitude": POINT[1], "radius_meters": 1000}
+        
+        assert [r["id"] for r in client.get("/routes/nearby/", params=params).json()] == [near["id"]]
+        
+        client.patch(f"/routes/{near['id']}", json={"path": PATHS[3]})
+        assert client.get("/routes/nearby/", params=params).json() == []
+        
+        client.patch(f"/routes/{near['id']}", json={"path": PATHS[1]})
+        client.delete(f"/routes/{near['id']}")
+        assert client.get("/routes/nearby/", params=params).json() == []
+    
+    def test_bbox_follows_approval(self, client: TestClient, pending_line: Line, index: RouteIndex):
+        """Should add a line's routes to bbox collections once it is approved."""
+        route = client.post(
+            "/routes/", json={"line_id": pending_line.id, "direction": "outbound", "path": PATHS[1]}
+        ).json()
+        params = {"bbox": "-74.0,40.69,-73.97,40.72"}
+        
+        assert client.get("/routes/geojson", params=params).json()["features"] == []
+        
+        client.post(f"/lines/{pending_line.id}/approve")
+        
+        assert [f["id"] for f in client.get("/routes/geojson", params=params).json()["features"]] == [route["id"]]
@@ -0,0 +1,174 @@
+"""Tests for the in-process maintenance scheduler."""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from models.maintenance import MaintenanceRun, MaintenanceRunStatus
+from services.scheduler import SKIPPED, Job, Scheduler, job_lock_key
+from database import engine
+
+TEST_JOB = "test_exclusive_job"
+
+
+class TestLocalJobs:
+    """Tests for jobs that run in every worker."""
+    
+    def test_run_is_recorded(self):
+        """Should keep the result of a run in the worker's history."""
+        scheduler = Scheduler([Job("count", lambda: {"count": 3}, 60, 5, exclusive=False)])
+        
+        run = asyncio.run(scheduler.run_job("count"))
+        
+        assert run.status == MaintenanceRunStatus.OK.value
+        assert run.detail == {"count": 3}
+        assert list(scheduler.history) == [run]
+        assert scheduler.describe()[0]["last_run"]["detail"] == {"count": 3}
+    
+    def test_failure_is_recorded(self):
+        """Should record a failing job as an error, without raising."""
+        def fail():
+            raise RuntimeError("boom")
+        scheduler = Scheduler([Job("fail", fail, 60, 5, exclusive=False)])
+        
+        run = asyncio.run(scheduler.run_job("fail"))
+        
+        assert run.status == MaintenanceRunStatus.ERROR.value
+        assert run.detail == {"error": "boom"}
+    
+    def test_overrun_is_recorded_as_timeout(self):
+        """Should mark a run that exceeds its timeout."""
+        scheduler = Scheduler([Job("slow", lambda: time.sleep(0.2), 60, 0.05, exclusive=False)])
+        
+        run = asyncio.run(scheduler.run_job("slow"))
+        
+        assert run.status == MaintenanceRunStatus.TIMEOUT.value
+        assert "slow" not in scheduler.running
+    
+    def test_overlapping_run_is_skipped(self):
+        """Should not start a job that is still running in this worker."""
+        release = threading.Event()
+        scheduler = Scheduler([Job("wait", lambda: release.wait(1), 60, 5, exclusive=False)])
+        
+        async def run_twice():
+            first = asyncio.create_task(scheduler.run_job("wait"))
+            await asyncio.sleep(0.05)
+            second = await scheduler.run_job("wait")
+            release.set()
+            return await first, second
+        
+        first, second = asyncio.run(run_twice())
+        
+        assert first.status == MaintenanceRunStatus.OK.value
+        assert second.status == SKIPPED
+    
+    def test_loop_runs_periodically(self):
+        """Should run each job again after its interval, until stopped."""
+        calls = []
+        scheduler = Scheduler(
+            [Job("tick", lambda: calls.append(1), 0.01, 1, exclusive=False)], jitter_seconds=0
+        )
+        
+        async def run_for_a_while():
+            scheduler.start()
+            await asyncio.sleep(0.2)
+            await scheduler.stop()
+        
+        asyncio.run(run_for_a_while())
+        
+        assert len(calls) >= 2
+
+
+class TestExclusiveJobs:
+    """Tests for jobs that run in one worker at a time."""
+    
+    @pytest.fixture(autouse=True)
+    def clean_runs(self):
+        """Runs are committed by the scheduler, so remove them after each test."""
+        yield
+        with engine.begin() as conn:
+            conn.execute(delete(MaintenanceRun).where(MaintenanceRun.job == TEST_JOB))
+    
+    def _runs(self) -> list[MaintenanceRun]:
+        with Session(engine) as db:
+            return db.execute(
+                select(MaintenanceRun).where(MaintenanceRun.job == TEST_JOB).order_by(MaintenanceRun.id)
+            ).scalars().all()
+    
+    def test_run_is_stored(self):
+        """Should run the job on a session and record the run."""
+        scheduler = Scheduler([Job(TEST_JOB, lambda db: {"one": db.execute(select(1)).scalar()}, 60, 5)])
+        
+        run = asyncio.run(scheduler.run_job(TEST_JOB))
+        
+        assert run.status == MaintenanceRunStatus.OK.value
+        [stored] = self._runs()
+        assert stored.id == run.run_id
+        assert stored.status == MaintenanceRunStatus.OK
+        assert json.loads(stored.detail) == {"one": 1}
+    
+    def test_recent_run_is_not_repeated(self):
+        """Should skip a job that another worker ran within half its interval."""
+        scheduler = Scheduler([Job(TEST_JOB, lambda db: None, 60, 5)])
+        
+        first = asyncio.run(scheduler.run_job(TEST_JOB))
+        second = asyncio.run(scheduler.run_job(TEST_JOB))
+        
+        assert first.status == MaintenanceRunStatus.OK.value
+        assert second.status == SKIPPED
+        assert len(self._runs()) == 1
+    
+    def test_locked_job_is_skipped(self):
+        """Should skip a job whose advisory lock is held by another worker."""
+        scheduler = Scheduler([Job(TEST_JOB, lambda db: None, 60, 5)])
+        
+        with engine.connect() as other_worker:
+            other_worker.execute(select(func.pg_advisory_xact_lock(job_lock_key(TEST_JOB))))
+            run = asyncio.run(scheduler.run_job(TEST_JOB))
+            other_worker.rollback()
+        
+        assert run.status == SKIPPED
+        assert self._runs() == []
+    
+    def test_slow_query_is_cancelled(self):
+        """Should cancel the running query of a job that exceeds its timeout."""
+        scheduler = Scheduler([Job(TEST_JOB, lambda db: db.execute(select(func.pg_sleep(5))), 60, 0.2)])
+        
+        started = time.monotonic()
+        run = asyncio.run(scheduler.run_job(TEST_JOB))
+        
+        assert time.monotonic() - started < 4
+        assert run.status == MaintenanceRunStatus.TIMEOUT.value
+        [stored] = self._runs()
+        assert stored.status == MaintenanceRunStatus.TIMEOUT
+
+
+class TestAdminEndpoints:
+    """Tests for /admin/jobs"""
+    
+    def test_list_jobs(self, client: TestClient):
+        """Should list the configured jobs."""
+        response = client.get("/admin/jobs")
+        
+        assert response.status_code == 200
+        names = [job["name"] for job in response.json()["jobs"]]
+        assert "stale_cleanup" in names
+        assert "partitions" in names
+    
+    def test_run_local_job(self, client: TestClient):
+        """Should run a job on demand and return the run."""
+        response = client.post("/admin/jobs/session_cache_prune/run")
+        
+        assert response.status_code == 200
+        assert response.json()["status"] == "ok"
+    
+    def test_run_unknown_job(self, client: TestClient):
+        """Should return 404 for an unknown job."""
+        response = client.post("/admin/jobs/nope/run")
+        
+        assert response.status_code == 404
@@ -0,0 +1,79 @@
+"""Tests for the in-process session state cache."""
+import time
+
+from models.recording import RecordingStatus
+from services.session_cache import SessionStateCache
+
+
+class TestSessionStateCache:
+    """Tests for SessionStateCache."""
+    
+    def test_get_returns_cached_status(self):
+        """Should return the state of a cached session."""
+        cache = SessionStateCache()
+        cache.put(1, RecordingStatus.IN_PROGRESS)
+        
+        assert cache.get(1).status == RecordingStatus.IN_PROGRESS
+        assert cache.get(2) is None
+    
+    def test_entries_expire(self):
+        """Should stop returning entries older than the TTL."""
+        cache = SessionStateCache(ttl_seconds=0.01)
+        cache.put(1, RecordingStatus.IN_PROGRESS)
+        time.sleep(0.02)
+        
+        assert cache.get(1) is None
+    
+    def test_least_recently_used_is_evicted(self):
+        """Should evict the least recently used session when full."""
+        cache = SessionStateCache(max_size=2)
+        cache.put(1, RecordingStatus.IN_PROGRESS)
+        cache.put(2, RecordingStatus.IN_PROGRESS)
+        cache.get(1)
+        cache.put(3, RecordingStatus.IN_PROGRESS)
+        
+        assert cache.get(1) is not None
+        assert cache.get(2) is None
+        assert len(cache) == 2
+    
+    def test_prune_keeps_recent_activity(self):
+        """Should drop expired entries, but not while their activity write time matters."""
+        cache = SessionStateCache(ttl_seconds=0.01, activity_interval_seconds=60)
+        cache.put(1, RecordingStatus.IN_PROGRESS)
+        cache.put(2, RecordingStatus.IN_PROGRESS)
+        cache.activity_due(2)
+        time.sleep(0.02)
+        
+        assert cache.prune() == 1
+        assert len(cache) == 1
+        assert not cache.activity_due(2)
+    
+    def test_invalidate(self):
+        """Should drop an invalidated session."""
+        cache = SessionStateCache()
+        cache.put(1, RecordingStatus.IN_PROGRESS)
+        cache.invalidate(1)
+        
+        assert cache.get(1) is None
+    
+    def test_activity_writes_are_coalesced(self):
+        """Should allow one activity write per interval for a cached session."""
+        cache = SessionStateCache(activity_interval_seconds=60)
+        cache.put(1, RecordingStatus.IN_PROGRESS)
+        
+        assert cache.activity_due(1) is True
+        assert cache.activity_due(1) is False
+        # Uncached sessions are always written
+        assert cache.activity_due(2) is True
+        assert cache.activity_due(2) is True
+    
+    def test_activity_write_time_survives_reload(self):
+        """Should keep coalescing activity writes when an expired entry is reloaded."""
+        cache = SessionStateCache(ttl_seconds=0.01, activity_interval_seconds=60)
+        cache.put(1, RecordingStatus.IN_PROGRESS)
+        cache.activity_due(1)
+        time.sleep(0.02)
+        
+        assert cache.get(1) is None
+        cache.put(1, RecordingStatus.IN_PROGRESS)
+        assert cache.activity_due(1) is False
@@ -0,0 +1,161 @@
+"""Tests for the simplified levels of route and session paths."""
+import math
+from datetime import timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models.line import Line
+from models.recording import LocationPoint, RecordingSession, SessionPathLevel
+from models.route import RoutePathLevel
+from services.paths import update_session_path
+from services.simplification import PATH_LOD_TOLERANCES, PATH_TOLERANCE_HEADER, pick_tolerance
+
+
+def wiggly_path(count: int = 500) -> list[list[float]]:
+    """A west-east path with a sub-meter zigzag, which simplification removes."""
+    return [
+        [-74.0 + i * 0.0001, 40.7 + (0.000002 if i % 2 else 0) + 0.001 * math.sin(i / 50)]
+        for i in range(count)
+    ]
+
+
+class TestPickTolerance:
+    """Tests for pick_tolerance"""
+    
+    def test_nothing_requested(self):
+        """Should serve the full path."""
+        assert pick_tolerance() is None
+    
+    def test_nearest_finer_level(self):
+        """Should pick the largest stored tolerance that is not coarser than asked."""
+        assert pick_tolerance(tolerance=PATH_LOD_TOLERANCES[1] + 0.5) == PATH_LOD_TOLERANCES[1]
+        assert pick_tolerance(tolerance=1e9) == PATH_LOD_TOLERANCES[-1]
+    
+    def test_finer_than_all_levels(self):
+        """Should serve the full path below the finest level."""
+        assert pick_tolerance(tolerance=PATH_LOD_TOLERANCES[0] / 2) is None
+    
+    def test_zoom(self):
+        """Should use the pixel size at the zoom level, coarser when zoomed out."""
+        assert pick_tolerance(zoom=22) is None
+        assert pick_tolerance(zoom=5) == PATH_LOD_TOLERANCES[-1]
+        assert pick_tolerance(zoom=14) <= pick_tolerance(zoom=12)
+
+
+class TestRoutePathLevels:
+    """Tests for simplified route paths"""
+    
+    def _create(self, client: TestClient, line: Line) -> dict:
+        response = client.post("/routes/", json={
+            "line_id": line.id, "direction": "outbound", "path": wiggly_path(),
+        })
+        assert response.status_code == 201
+        return response.json()
+    
+    def test_levels_stored_on_create(self, client: TestClient, db: Session, approved_line: Line):
+        """Should store one level per tolerance, with fewer points as it gets coarser."""
+        route = self._create(client, approved_line)
+        
+        levels = db.execute(
+            select(RoutePathLevel.tolerance, RoutePathLevel.point_count)
+            .where(RoutePathLevel.route_id == route["id"])
+            .order_by(RoutePathLevel.tolerance)
+        ).all()
+        
+        assert [t for t, _ in levels] == list(PATH_LOD_TOLERANCES)
+        counts = [c for _, c in levels]
+        assert counts == sorted(counts, reverse=True)
+        assert counts[0] < 500
+    
+    def test_get_with_zoom(self, client: TestClient, approved_line: Line):
+        """Should return the simplified path for the zoom level."""
+        route = self._create(client, approved_line)
+        
+        response = client.get(f"/routes/{route['id']}", params={"zoom": 12})
+        
+        assert response.status_code == 200
+        assert response.headers[PATH_TOLERANCE_HEADER] == f"{pick_tolerance(zoom=12):g}"
+        path = response.json()["path"]
+        assert 2 <= len(path) < len(route["path"])
+        assert path[0] == route["path"][0]
+        assert path[-1] == route["path"][-1]
+    
+    def test_list_without_tolerance_is_full(self, client: TestClient, approved_line: Line):
+        """Should return every vertex when no tolerance is requested."""
+        self._create(client, approved_line)
+        
+        response = client.get("/routes/", params={"line_id": approved_line.id})
+        
+        assert PATH_TOLERANCE_HEADER not in response.headers
+        assert len(response.json()[0]["path"]) == 500
+    
+    def test_list_with_tolerance(self, client: TestClient, approved_line: Line):
+        """Should simplify every route of the page."""
+        self._create(client, approved_line)
+        self._create(client, approved_line)
+        
+        response = client.get("/routes/", params={"line_id": approved_line.id, "tolerance": 100})
+        
+        assert response.headers[PATH_TOLERANCE_HEADER] == f"{pick_tolerance(tolerance=100):g}"
+        assert all(len(r["path"]) < 500 for r in response.json())
+    
+    def test_levels_replaced_on_path_update(
+        self, client: TestClient, db: Session, approved_line: Line
+    ):
+        """Should recompute the levels when the path changes."""
+        route = self._create(client, approved_line)
+        
+        client.patch(f"/routes/{route['id']}", json={"path": [[-74.0, 40.7], [-73.9, 40.8]]})
+        
+        counts = db.execute(
+            select(RoutePathLevel.point_count).where(RoutePathLevel.route_id == route["id"])
+        ).scalars().all()
+        assert counts == [2] * len(PATH_LOD_TOLERANCES)
+
+
+class TestSessionPathLevels:
+    """Tests for simplified session paths"""
+    
+    def _add_points(self, db: Session, session: RecordingSession) -> None:
+        for i, (lon, lat) in enumerate(wiggly_path()):
+            db.add(LocationPoint(
+                session_id=session.id,
+                timestamp=session.started_at + timedelta(seconds=i),
+                latitude=lat,
+                longitude=lon,
+            ))
+        db.commit()
+    
+    def test_in_progress_simplified_on_read(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should simplify the path of a session without stored levels on the fly."""
+        self._add_points(db, recording_session)
+        update_session_path(db, recording_session.id)
+        db.commit()
+        
+        response = client.get(f"/recordings/{recording_session.id}", params={"tolerance": 20})
+        
+        assert response.status_code == 200
+        assert 2 <= len(response.json()["computed_path"]) < 500
+    
+    def test_levels_stored_on_end(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should store the levels when the session ends, and serve them."""
+        self._add_points(db, recording_session)
+        
+        client.post(f"/recordings/{recording_session.id}/end")
+        
+        stored = db.execute(
+            select(func.count())
+            .select_from(SessionPathLevel)
+            .where(SessionPathLevel.session_id == recording_session.id)
+        ).scalar()
+        assert stored == len(PATH_LOD_TOLERANCES)
+        
+        response = client.get("/recordings/", params={"zoom": 10})
+        [session] = [s for s in response.json() if s["id"] == recording_session.id]
+        assert len(session["computed_path"]) < 500
@@ -0,0 +1,153 @@
+"""Tests for the write-behind ingest spool."""
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models.recording import LocationPointBatch, SensorReadingColumns
+from services.spool import IngestSpool
+
+
+def _database_down():
+    """Session factory simulating an unreachable database, so nothing gets flushed."""
+    raise OperationalError("SELECT 1", {}, Exception("database is down"))
+
+
+def _location_batch(count: int = 3) -> LocationPointBatch:
+    now = datetime.utcnow()
+    return LocationPointBatch(points=[
+        {
+            "timestamp": now + timedelta(seconds=i),
+            "latitude": 40.7128,
+            "longitude": -74.0060 + (i * 0.0001),
+        }
+        for i in range(count)
+    ])
+
+
+class TestIngestSpool:
+    """Tests for IngestSpool durability and recovery."""
+    
+    def test_append_assigns_increasing_sequences(self, tmp_path: Path):
+        """Should acknowledge each batch with the next sequence number."""
+        spool = IngestSpool(tmp_path, session_factory=_database_down)
+        
+        sequences = [spool.append("locations", 1, _location_batch()) for _ in range(3)]
+        
+        assert sequences == [1, 2, 3]
+        assert spool.stats()["depth"] == 3
+        spool.close()
+    
+    def test_spooled_batches_survive_restart(self, tmp_path: Path):
+        """Should keep unflushed batches across a restart and continue the sequence."""
+        spool = IngestSpool(tmp_path, session_factory=_database_down)
+        spool.append("locations", 1, _location_batch())
+        spool.append(
+            "sensor_columns", 2,
+            SensorReadingColumns(timestamp=[datetime.utcnow()], accel_x=[0.5])
+        )
+        spool.close()
+        
+        reopened = IngestSpool(tmp_path, session_factory=_database_down)
+        stats = reopened.stats()
+        records, _ = reopened._read_pending(10)
+        
+        assert stats["depth"] == 2
+        assert stats["flush_lag_seconds"] >= 0
+        assert [r.sequence for r in records] == [1, 2]
+        assert records[0].session_id == 1
+        assert len(records[0].batch.points) == 3
+        assert records[1].batch.accel_x == [0.5]
+        assert reopened.append("locations", 1, _location_batch()) == 3
+        reopened.close()
+    
+    def test_torn_record_is_truncated_on_recovery(self, tmp_path: Path):
+        """Should drop a partially written record left by a crash mid-append."""
+        spool = IngestSpool(tmp_path, session_factory=_database_down)
+        spool.append("locations", 1, _location_batch())
+        spool.close()
+        
+        segment = next(tmp_path.glob("segment-*.log"))
+        with open(segment, "ab") as f:
+            f.write(b"\x00\x00\x00\x00\x00\x00\x00\x02partial")
+        
+        reopened = IngestSpool(tmp_path, session_factory=_database_down)
+        
+        assert reopened.stats()["depth"] == 1
+        assert reopened.append("locations", 1, _location_batch()) == 2
+        assert [r.sequence for r in reopened._read_pending(10)[0]] == [1, 2]
+        reopened.close()
+    
+    def test_directory_is_locked_by_one_spool(self, tmp_path: Path):
+        """Should refuse to open a spool directory another spool owns."""
+        spool = IngestSpool(tmp_path, session_factory=_database_down)
+        
+        with pytest.raises(BlockingIOError):
+            IngestSpool(tmp_path, session_factory=_database_down)
+        spool.close()
+    
+    def test_connection_error_keeps_records(self, tmp_path: Path):
+        """Should leave records spooled while the database is unreachable."""
+        spool = IngestSpool(tmp_path, session_factory=_database_down)
+        spool.append("locations", 1, _location_batch())
+        
+        with pytest.raises(OperationalError):
+            spool.flush()
+        
+        assert spool.stats()["depth"] == 1
+        assert spool.stats()["flushed_sequence"] == 0
+        spool.close()
+    
+    def test_failing_record_is_set_aside(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        """Should retry records one at a time after a non-connection error and set the failing one aside."""
+        spool = IngestSpool(tmp_path, session_factory=_database_down)
+        for session_id in (1, 2, 3):
+            spool.append("locations", session_id, _location_batch())
+        written = []
+        
+        def write(records):
+            if any(r.session_id == 2 for r in records):
+                raise TypeError("can't compare offset-naive and offset-aware datetimes")
+            written.extend(r.sequence for r in records)
+        
+        monkeypatch.setattr(spool, "_write", write)
+        
+        assert spool.flush() == 3
+        assert written == [1, 3]
+        stats = spool.stats()
+        assert stats["depth"] == 0
+        assert stats["flushed_sequence"] == 3
+        assert stats["rejected_records"] == 1
+        assert (tmp_path / "rejected.log").stat().st_size > 0
+        spool.close()
+    
+    def test_unreadable_record_is_set_aside(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        """Should set aside a spooled record that no longer validates instead of stalling on it."""
+        spool = IngestSpool(tmp_path, session_factory=_database_down)
+        spool.append("locations", 1, _location_batch())
+        # Spooled unvalidated, so it fails validation when read back
+        spool.append("sensor_columns", 2, SensorReadingColumns.model_construct(timestamp=[], accel_x=[0.5]))
+        written = []
+        monkeypatch.setattr(spool, "_write", lambda records: written.extend(r.sequence for r in records))
+        
+        assert spool.flush() == 2
+        assert written == [1]
+        assert spool.stats()["rejected_records"] == 1
+        assert spool.flush() == 0
+        spool.close()
+    
+    def test_drain_flushes_every_appended_record(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        """Should flush groups until every record appended before the call is written."""
+        monkeypatch.setattr("services.spool.SPOOL_FLUSH_MAX_RECORDS", 2)
+        spool = IngestSpool(tmp_path, session_factory=_database_down)
+        for _ in range(5):
+            spool.append("locations", 1, _location_batch())
+        written = []
+        monkeypatch.setattr(spool, "_write", lambda records: written.extend(r.sequence for r in records))
+        
+        spool.drain()
+        
+        assert written == [1, 2, 3, 4, 5]
+        assert spool.stats()["depth"] == 0
+        spool.close()
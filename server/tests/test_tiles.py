@@ -0,0 +1,150 @@
+"""Tests for the route vector tiles and their cache."""
+import pytest
+from fastapi.testclient import TestClient
+from shapely.geometry import LineString
+
+import routes.tiles
+import services.tiles
+from models.line import Line
+from services.tiles import TILE_MEDIA_TYPE, TileCache, tile_bounds, valid_tile
+
+# Tiles at zoom 14 around a route in Manhattan
+ROUTE_COORDS = [[-73.99, 40.73], [-73.98, 40.74]]
+ROUTE_TILE = (14, 4824, 6159)
+FAR_TILE = (14, 4830, 6159)
+
+
+@pytest.fixture
+def cache(tmp_path) -> TileCache:
+    return TileCache(directory=str(tmp_path), max_bytes=10 * 8192)
+
+
+class TestTileCache:
+    """Tests for TileCache"""
+    
+    def test_round_trip(self, cache: TileCache):
+        """Should return a stored tile, and None for others."""
+        cache.put(*ROUTE_TILE, b"tile", cache.generation())
+        
+        assert cache.get(*ROUTE_TILE) == b"tile"
+        assert cache.get(*FAR_TILE) is None
+    
+    def test_evicts_least_recently_used(self, cache: TileCache):
+        """Should evict the least recently used tiles once over the byte limit."""
+        for x in range(10):
+            cache.put(14, x, 0, b"x" * 4000, cache.generation())
+        cache.get(14, 0, 0)
+        
+        cache.put(14, 10, 0, b"x" * 4000, cache.generation())
+        
+        assert cache.get(14, 0, 0) is not None
+        assert cache.get(14, 1, 0) is None
+        assert not (cache.directory / "14" / "1" / "0.mvt").exists()
+        assert cache.stats()["bytes"] <= cache.max_bytes
+    
+    def test_invalidates_only_tiles_on_the_path(self, cache: TileCache):
+        """Should remove the tiles the path passes through and keep the others."""
+        cache.put(*ROUTE_TILE, b"near", cache.generation())
+        cache.put(*FAR_TILE, b"far", cache.generation())
+        cache.put(0, 0, 0, b"world", cache.generation())
+        
+        removed = cache.invalidate([LineString(ROUTE_COORDS)])
+        
+        assert removed == 2
+        assert cache.get(*ROUTE_TILE) is None
+        assert cache.get(0, 0, 0) is None
+        assert cache.get(*FAR_TILE) == b"far"
+    
+    def test_drops_tiles_rendered_before_an_invalidation(self, cache: TileCache):
+        """Should not store a tile rendered before an invalidation."""
+        generation = cache.generation()
+        cache.invalidate([LineString(ROUTE_COORDS)])
+        
+        cache.put(*ROUTE_TILE, b"stale", generation)
+        
+        assert cache.get(*ROUTE_TILE) is None
+    
+    def test_drops_tiles_rendered_before_an_invalidation_in_another_worker(self, cache: TileCache):
+        """Should not store a tile rendered before another process invalidated it."""
+        generation = cache.generation()
+        other_worker = TileCache(directory=str(cache.directory), max_bytes=cache.max_bytes)
+        other_worker.invalidate([LineString(ROUTE_COORDS)])
+        
+        cache.put(*ROUTE_TILE, b"stale", generation)
+        
+        assert cache.get(*ROUTE_TILE) is None
+        assert other_worker.get(*ROUTE_TILE) is None
+    
+    def test_indexes_existing_tiles(self, cache: TileCache):
+        """Should count the tiles already on disk when started."""
+        cache.put(*ROUTE_TILE, b"tile", cache.generation())
+        
+        restarted = TileCache(directory=str(cache.directory), max_bytes=cache.max_bytes)
+        
+        assert restarted.get(*ROUTE_TILE) == b"tile"
+        assert restarted.stats()["tiles"] == 1
+    
+    def test_tile_math(self):
+        """Should locate tiles on the Web Mercator grid."""
+        west, south, east, north = tile_bounds(*ROUTE_TILE)
+        
+        assert west <= -73.99 <= east
+        assert south <= 40.73 <= north
+        assert tile_bounds(0, 0, 0)[2] == 180
+        assert valid_tile(14, 16383, 0)
+        assert not valid_tile(14, 16384, 0)
+
+
+class TestTileEndpoint:
+    """Tests for /tiles/routes/{z}/{x}/{y}.mvt"""
+    
+    @pytest.fixture(autouse=True)
+    def _cache(self, monkeypatch, cache: TileCache):
+        monkeypatch.setattr(services.tiles, "tile_cache", cache)
+        monkeypatch.setattr(routes.tiles, "tile_cache", cache)
+    
+    def _create_route(self, client: TestClient, line: Line) -> dict:
+        return client.post(
+            "/routes/", json={"line_id": line.id, "direction": "outbound", "path": ROUTE_COORDS}
+        ).json()
+    
+    def test_tile_of_approved_line(self, client: TestClient, approved_line: Line):
+        """Should render the routes of approved lines, then serve the tile from the cache."""
+        self._create_route(client, approved_line)
+        
+        response = client.get("/tiles/routes/14/4824/6159.mvt")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == TILE_MEDIA_TYPE
+        assert response.headers["x-tile-cache"] == "miss"
+        assert len(response.content) > 0
+        
+        cached = client.get("/tiles/routes/14/4824/6159.mvt")
+        assert cached.headers["x-tile-cache"] == "hit"
+        assert cached.content == response.content
+    
+    def test_pending_lines_are_not_shown(self, client: TestClient, pending_line: Line):
+        """Should leave out the routes of lines that are not approved."""
+        self._create_route(client, pending_line)
+        
+        response = client.get("/tiles/routes/14/4824/6159.mvt")
+        
+        assert response.status_code == 200
+        assert response.content == b""
+    
+    def test_route_edit_invalidates_its_tiles(self, client: TestClient, approved_line: Line, cache: TileCache):
+        """Should drop the cached tiles of a route when it changes."""
+        route = self._create_route(client, approved_line)
+        client.get("/tiles/routes/14/4824/6159.mvt")
+        client.get("/tiles/routes/14/4830/6159.mvt")
+        
+        client.patch(f"/routes/{route['id']}", json={"color": "#FF0000"})
+        
+        assert cache.get(*ROUTE_TILE) is None
+        assert cache.get(*FAR_TILE) == b""
+    
+    def test_out_of_range(self, client: TestClient):
+        """Should return 404 for a tile outside the grid."""
+        response = client.get("/tiles/routes/2/4/0.mvt")
+        
+        assert response.status_code == 404
@@ -0,0 +1,159 @@
+"""Tests for packed trajectory chunk storage."""
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models.recording import LocationPoint, RecordingSession, TrajectoryChunk
+from services.trajectory import (
+    PACKED_COLUMNS,
+    compact_session,
+    concat_points,
+    pack_points,
+    points_from_rows,
+    unpack_points,
+)
+
+
+def _rows(count: int, start: datetime = datetime(2026, 10, 17, 8, 0)) -> list[tuple]:
+    """Location point rows in PACKED_COLUMNS order, with some missing values."""
+    return [
+        (
+            1000 + i,
+            start + timedelta(seconds=i, microseconds=250),
+            -74.0060 + i * 0.00001,
+            40.7128 + i * 0.00001,
+            None if i % 3 else 12.5,
+            5.0 + i % 7,
+            None,
+            4.0,
+            None,
+        )
+        for i in range(count)
+    ]
+
+
+class TestChunkFormat:
+    """Tests for packing and unpacking point arrays."""
+    
+    def test_round_trip(self):
+        """Should unpack exactly the points that were packed."""
+        points = points_from_rows(_rows(500))
+        
+        unpacked = unpack_points(pack_points(points))
+        
+        assert np.array_equal(unpacked["id"], points["id"])
+        assert np.array_equal(unpacked["timestamp"], points["timestamp"])
+        for column in PACKED_COLUMNS[2:]:
+            assert np.array_equal(unpacked[column], points[column], equal_nan=True)
+    
+    def test_chunk_is_compact(self):
+        """Should take far less space than nine 8-byte values per point."""
+        assert len(pack_points(points_from_rows(_rows(2000)))) < 2000 * 9 * 8 / 5
+    
+    def test_rejects_other_data(self):
+        """Should refuse to unpack data that is not a chunk."""
+        with pytest.raises(ValueError):
+            unpack_points(zlib.compress(b"nope" + bytes(8)))
+    
+    def test_concat_orders_and_deduplicates(self):
+        """Should merge parts by timestamp, keeping the first copy of a point."""
+        rows = _rows(10)
+        first = points_from_rows(rows[5:])
+        second = points_from_rows(rows[:6])
+        second["speed"][:] = -1
+        
+        merged = concat_points([first, second])
+        
+        assert merged["id"].tolist() == [row[0] for row in rows]
+        # The point at index 5 comes from the first part
+        assert merged["speed"][5] == rows[5][5]
+
+
+class TestCompaction:
+    """Tests for compacting sessions into trajectory chunks."""
+    
+    def _add_points(self, db: Session, session: RecordingSession, count: int) -> None:
+        for point_id, timestamp, lon, lat, altitude, speed, *_ in _rows(count, session.started_at):
+            db.add(LocationPoint(
+                session_id=session.id,
+                timestamp=timestamp,
+                latitude=lat,
+                longitude=lon,
+                altitude=altitude,
+                speed=speed,
+            ))
+        db.commit()
+    
+    def test_compact_session(self, db: Session, recording_session: RecordingSession):
+        """Should move the session's rows into fixed-size chunks."""
+        self._add_points(db, recording_session, 25)
+        
+        assert compact_session(db, recording_session.id, chunk_size=10) == 25
+        db.commit()
+        
+        remaining = db.execute(
+            select(func.count()).select_from(LocationPoint)
+            .where(LocationPoint.session_id == recording_session.id)
+        ).scalar()
+        chunks = db.execute(
+            select(TrajectoryChunk)
+            .where(TrajectoryChunk.session_id == recording_session.id)
+            .order_by(TrajectoryChunk.sequence)
+        ).scalars().all()
+        assert remaining == 0
+        assert [c.point_count for c in chunks] == [10, 10, 5]
+        assert chunks[0].start_time == recording_session.started_at + timedelta(microseconds=250)
+    
+    def test_compacted_points_are_read_back(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should serve the same points, in order, before and after compaction."""
+        self._add_points(db, recording_session, 30)
+        before = client.get(f"/recordings/{recording_session.id}/locations").json()
+        
+        compact_session(db, recording_session.id, chunk_size=8)
+        db.commit()
+        after = client.get(f"/recordings/{recording_session.id}/locations").json()
+        page = client.get(
+            f"/recordings/{recording_session.id}/locations", params={"skip": 10, "limit": 5}
+        ).json()
+        
+        assert after == before
+        assert page == before[10:15]
+    
+    def test_path_from_compacted_and_new_points(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should compute the path from packed and unpacked points together."""
+        self._add_points(db, recording_session, 10)
+        compact_session(db, recording_session.id)
+        db.commit()
+        later = recording_session.started_at + timedelta(minutes=5)
+        client.post(
+            f"/recordings/{recording_session.id}/locations",
+            json={"timestamp": later.isoformat(), "latitude": 40.72, "longitude": -74.0}
+        )
+        
+        response = client.post(f"/recordings/{recording_session.id}/end")
+        
+        assert response.status_code == 200
+        assert len(response.json()["computed_path"]) == 11
+    
+    def test_compact_endpoint(
+        self, client: TestClient, db: Session, recording_session: RecordingSession
+    ):
+        """Should compact sessions that ended before the cutoff."""
+        self._add_points(db, recording_session, 5)
+        client.post(f"/recordings/{recording_session.id}/end")
+        
+        response = client.post("/recordings/maintenance/compact", params={"ended_minutes": 0})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert recording_session.id in data["session_ids"]
+        assert data["compacted_points"] >= 5